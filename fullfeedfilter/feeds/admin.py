@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Feeds, Filters, ArticleScrapers, FeedValidation, ArticleRecords
+from .models import Feeds, Filters, ArticleScrapers, BuildJob, FeedState, FeedValidation, ArticleRecords, \
+    HostHealth
 
 
 class FeedsAdmin(admin.ModelAdmin):
@@ -10,6 +11,16 @@ class FiltersAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'feed', 'keyword', '__str__']
 
 
+class FeedStateAdmin(admin.ModelAdmin):
+    list_display = ['feed', 'etag', 'last_modified', 'last_fetched', 'last_built', 'next_poll', 'poll_interval',
+                    'consecutive_failures']
+
+
+class BuildJobAdmin(admin.ModelAdmin):
+    list_display = ['feed', 'kind', 'priority', 'state', 'created_at', 'started_at', 'finished_at']
+    list_filter = ['state', 'kind']
+
+
 class FeedValidationAdmin(admin.ModelAdmin):
     list_display = ['feed', 'error', 'ignore']
 
@@ -18,8 +29,16 @@ class ArticleRecordsAdmin(admin.ModelAdmin):
     list_display = ['feed', 'title', 'scraper', 'full_article', 'full_article_retries', 'hidden']
 
 
+class HostHealthAdmin(admin.ModelAdmin):
+    list_display = ['host', 'state', 'failure_rate', 'latency', 'consecutive_failures', 'opened_at']
+    list_filter = ['state']
+
+
 admin.site.register(Feeds, FeedsAdmin)
 admin.site.register(Filters, FiltersAdmin)
 admin.site.register(ArticleScrapers)
+admin.site.register(FeedState, FeedStateAdmin)
+admin.site.register(BuildJob, BuildJobAdmin)
 admin.site.register(FeedValidation, FeedValidationAdmin)
 admin.site.register(ArticleRecords, ArticleRecordsAdmin)
+admin.site.register(HostHealth, HostHealthAdmin)
@@ -0,0 +1,107 @@
+"""
+./manage.py benchmark_filters
+./manage.py benchmark_filters -k 200 -n 100 -w 5000
+"""
+import random
+import string
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandParser
+from termcolor import cprint
+
+from feeds.models import Filters
+from feeds.scripts.keyword_matcher import CompiledFilters, normalize_filter_text
+from general.scripts import utils
+
+SOURCES = ["feed", "title", "body", "link", "tag"]
+
+
+class Command(BaseCommand):
+    help = 'Compares the compiled keyword matcher with the per-filter substring loop.'
+
+    def __init__(self) -> None:
+        super().__init__(stdout=None, stderr=None, no_color=False, force_color=False)
+        self.random = random.Random(0)
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('-k', '--keywords', type=int, default=200, help='Number of keyword filters')
+        parser.add_argument('-n', '--articles', type=int, default=100, help='Number of articles')
+        parser.add_argument('-w', '--words', type=int, default=2000, help='Words per article body')
+
+    def handle(self, *args, **kwargs) -> None:
+        vocabulary = [self.random_word() for _ in range(5000)]
+        filters = self.build_filters(vocabulary=vocabulary, total=kwargs['keywords'])
+        articles = [self.build_article(vocabulary=vocabulary, words=kwargs['words']) for _ in range(kwargs['articles'])]
+
+        start_time = datetime.now()
+        legacy_results = [self.filter_with_loop(filters=filters, article=article) for article in articles]
+        legacy_seconds = (datetime.now() - start_time).total_seconds()
+
+        start_time = datetime.now()
+        compiled_filters = CompiledFilters(filters=filters)
+        compiled_results = [self.filter_with_matcher(compiled_filters, filters=filters, article=article)
+                            for article in articles]
+        compiled_seconds = (datetime.now() - start_time).total_seconds()
+
+        cprint(f"{len(filters)} filters x {len(articles)} articles ({kwargs['words']} words each)", 'yellow')
+        cprint(f"\tPer-filter loop: \t{legacy_seconds:.3f} seconds")
+        cprint(f"\tCompiled matcher: \t{compiled_seconds:.3f} seconds")
+        cprint(f"\tSpeedup: \t\t{legacy_seconds / max(compiled_seconds, 0.000001):.1f}x", 'cyan')
+
+        if legacy_results == compiled_results:
+            cprint("Results are identical.", 'green')
+        else:
+            cprint("Results differ!", 'red')
+
+    def random_word(self) -> str:
+        return ''.join(self.random.choice(string.ascii_lowercase) for _ in range(self.random.randint(3, 9)))
+
+    def build_filters(self, vocabulary: list, total: int) -> list:
+        filters = []
+        for i in range(total):
+            keyword = ' '.join(self.random.choice(vocabulary) for _ in range(self.random.choice([1, 1, 1, 2])))
+            filters.append(Filters(id=i,
+                                   keyword=keyword,
+                                   normalized_keyword=normalize_filter_text(keyword),
+                                   condition=self.random.choice(["in", "in", "in", "not_in"]),
+                                   source=self.random.choice(SOURCES),
+                                   action=self.random.choice(["hide", "hide", "show"])))
+        return filters
+
+    def build_article(self, vocabulary: list, words: int) -> dict:
+        body = ' '.join(f"<p>{self.random.choice(vocabulary)}</p>" if i % 20 == 0 else self.random.choice(vocabulary)
+                        for i in range(words))
+        tags = [self.random.choice(vocabulary) for _ in range(5)]
+        title = ' '.join(self.random.choice(vocabulary) for _ in range(8))
+        link = f"https://example.com/{'-'.join(self.random.choice(vocabulary) for _ in range(4))}"
+        return {
+            "title": title,
+            "body": body,
+            "link": link,
+            "tag": " ".join(tags).lower(),
+            "feed": " ".join([title, link, body] + tags).lower(),
+        }
+
+    @staticmethod
+    def filter_with_loop(filters: list, article: dict) -> list:
+        """ The original ArticleFilter._filter_is_true loop. """
+        results = []
+        for _filter in filters:
+            keyword = utils.sanitize_string(_filter.keyword, strip_special_chars=True,
+                                            replace_special_chars_with_space=True, lowercase=True)
+            source = utils.sanitize_string(article[_filter.source], strip_special_chars=True,
+                                           replace_special_chars_with_space=True, lowercase=True)
+            found = f" {keyword} " in f" {source} "
+            results.append(found if _filter.condition == "in" else not found)
+        return results
+
+    @staticmethod
+    def filter_with_matcher(compiled_filters: CompiledFilters, filters: list, article: dict) -> list:
+        matched_keywords = {}
+        results = []
+        for _filter in filters:
+            if _filter.source not in matched_keywords:
+                source = normalize_filter_text(article[_filter.source])
+                matched_keywords[_filter.source] = compiled_filters.search(source=_filter.source, text=source)
+            results.append(compiled_filters.is_true(_filter, matched_keywords=matched_keywords[_filter.source]))
+        return results
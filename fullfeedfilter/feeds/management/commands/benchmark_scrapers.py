@@ -0,0 +1,123 @@
+"""
+./manage.py benchmark_scrapers -f 2
+./manage.py benchmark_scrapers -u https://kenoshanews.com/news/article.html -r 10
+./manage.py benchmark_scrapers saved_page.html -s https://kenoshanews.com/ -c "Simple Scraper" -v2
+"""
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from termcolor import cprint
+
+from feeds.models import ArticleRecords, Feeds
+from feeds.scripts.lxml_engine import LxmlDocument
+from feeds.scripts.scrapers import CraigslistScraper, Scraper, SimpleScraper
+
+SCRAPERS = {
+    "Simple Scraper": SimpleScraper,
+    "Craigslist Scraper": CraigslistScraper,
+}
+
+ENGINES = ["soup", "lxml"]
+
+# Scraper attributes that end up in the article
+COMPARED_ATTRIBUTES = ["article_html", "additional_images", "top_image", "tags", "additional_details", "map"]
+
+
+class Command(BaseCommand):
+    help = 'Scrapes article pages with the BeautifulSoup and lxml engines, compares the results and times them.'
+
+    def __init__(self) -> None:
+        super().__init__(stdout=None, stderr=None, no_color=False, force_color=False)
+        self.verbose = False
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('files', nargs='*', help='Saved article pages (scraped with the config of --site)')
+        parser.add_argument('-s', '--site', type=str, help='Url whose scrapers.yaml config applies to the files')
+        parser.add_argument('-u', '--url', action='append', default=[], help='Article url (downloaded through the cache)')
+        parser.add_argument('-f', '--feed_id', type=int, help="Scrape the feed's articles (downloaded through the cache)")
+        parser.add_argument('-n', '--max_pages', type=int, default=50, help='Articles of the feed to scrape')
+        parser.add_argument('-c', '--scraper', type=str, default="Simple Scraper", choices=list(SCRAPERS),
+                            help='Scraper for --url and files (a feed uses its own)')
+        parser.add_argument('-r', '--repeat', type=int, default=5, help='Times each page is scraped (best time counts)')
+        parser.add_argument('-v2', '--verbose', action='store_true', help='Show the differing values')
+
+    def vprint(self, message: str, color=None, on_color=None) -> print:
+        if self.verbose:
+            return cprint(message, color=color, on_color=on_color)
+
+    def handle(self, *args, **kwargs) -> None:
+        self.verbose = kwargs['verbose']
+        pages = self.get_pages(**kwargs)
+        if not pages:
+            raise CommandError("No pages to scrape: give files (with --site), --url or --feed_id.")
+
+        totals = {engine: 0.0 for engine in ENGINES}
+        differing = 0
+        for name, url, scraper_class, content in pages:
+            seconds = {}
+            results = {}
+            for engine in ENGINES:
+                seconds[engine], results[engine] = self.scrape(scraper_class, url, content, engine, kwargs['repeat'])
+                totals[engine] += seconds[engine]
+
+            differences = [attribute for attribute in COMPARED_ATTRIBUTES
+                           if results["soup"].get(attribute) != results["lxml"].get(attribute)]
+            if differences:
+                differing += 1
+            speedup = seconds["soup"] / max(seconds["lxml"], 0.000001)
+            fallback = "" if results["lxml"]["parsed_by_lxml"] else " (parsed by BeautifulSoup)"
+            cprint(f"\t{name} ({len(content) / 1024:.0f} KB): soup {seconds['soup'] * 1000:.2f} ms, "
+                   f"lxml {seconds['lxml'] * 1000:.2f} ms{fallback}, {speedup:.1f}x"
+                   f"{', differs: ' + ', '.join(differences) if differences else ''}",
+                   'red' if differences else None)
+            for attribute in differences:
+                self.vprint(f"\t\tsoup {attribute}: {results['soup'].get(attribute)!r}", 'red')
+                self.vprint(f"\t\tlxml {attribute}: {results['lxml'].get(attribute)!r}", 'red')
+
+        cprint(f"{len(pages)} pages, best of {kwargs['repeat']}", 'yellow')
+        cprint(f"\tBeautifulSoup: \t{totals['soup']:.3f} seconds")
+        cprint(f"\tlxml: \t\t{totals['lxml']:.3f} seconds")
+        cprint(f"\tSpeedup: \t{totals['soup'] / max(totals['lxml'], 0.000001):.1f}x", 'cyan')
+        if differing:
+            cprint(f"Results differ on {differing} pages!", 'red')
+        else:
+            cprint("Results are identical.", 'green')
+
+    def get_pages(self, **kwargs) -> list:
+        """ (name, url, scraper class, content) of each page to scrape. """
+        pages = []
+        if kwargs['files']:
+            if not kwargs['site']:
+                raise CommandError("--site is required with files.")
+            for path in kwargs['files']:
+                with open(path, "rb") as fp:
+                    pages.append((os.path.basename(path), kwargs['site'], SCRAPERS[kwargs['scraper']], fp.read()))
+
+        urls = [(url, SCRAPERS[kwargs['scraper']]) for url in kwargs['url']]
+        if kwargs['feed_id']:
+            feed = Feeds.objects.select_related('scraper').get(pk=kwargs['feed_id'])
+            if feed.scraper.name not in SCRAPERS:
+                raise CommandError(f"Feed '{feed.name}' uses the {feed.scraper.name}, which has no lxml engine.")
+            records = ArticleRecords.objects.filter(feed=feed).order_by('-id')[:kwargs['max_pages']]
+            urls += [(record.url, SCRAPERS[feed.scraper.name]) for record in records]
+
+        for url, scraper_class in urls:
+            try:
+                pages.append((url, url, scraper_class, Scraper.download(url)))
+            except Exception as e:
+                cprint(f"\tSkipped {url}: {e}", 'red')
+        return pages
+
+    @staticmethod
+    def scrape(scraper_class, url: str, content: bytes, engine: str, repeat: int) -> (float, dict):
+        best = None
+        scraper = None
+        for _ in range(max(repeat, 1)):
+            start_time = time.perf_counter()
+            scraper = scraper_class(url=url, content=content, engine=engine)
+            seconds = time.perf_counter() - start_time
+            best = seconds if best is None else min(best, seconds)
+        results = {attribute: getattr(scraper, attribute, None) for attribute in COMPARED_ATTRIBUTES}
+        results["parsed_by_lxml"] = isinstance(scraper.soup, LxmlDocument)
+        return best, results
@@ -2,14 +2,21 @@
 ./manage.py build
 ./manage.py build -f 2
 """
-import threading
+import os
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
 
-from feeds.models import Feeds
-from feeds.scripts.build_feed import BuildFeed
+from feeds.models import Feeds, FeedState
+from feeds.scripts import fingerprints, host_health, http_client, response_cache, scrape_errors
+from feeds.scripts.build_feed import BuildFeed, get_feeds_with_due_retries, save_failed_state
+from feeds.scripts.db_writer import DatabaseWriter
+from feeds.scripts.fetch import AsyncFetcher
+from full_feed_filter.settings import BUILD_FEED_WORKERS
+from general.scripts import utils
 from termcolor import colored, cprint
 
 
@@ -22,14 +29,22 @@ class Command(BaseCommand):
         self.verbose = False
         self.verbose_article = False
         self.rebuild_full_articles = False
+        self.force = False
         self.no_threading = False
         self.feed_id = None
         self.article_id = None
         self.article_url = None
         self.max_articles = None
         self.feeds_to_build = None
+        self.fetch_results = {}
+        self.conditional = False
+        self.conditional_feed_ids = set()
+        self.retry_feed_ids = set()
+        self.writer = None
         self.build_type = None
         self.errors = []
+        self.failed = []
+        self.skipped = []
 
         self.startTime = datetime.now()
         self.total_seconds = None
@@ -41,12 +56,11 @@ class Command(BaseCommand):
         self.max_articles = kwargs['max_articles']
         self.verbose = kwargs['verbose']
 
-        # TODO: Disabled threading until sqlite locking bug can get resolved.
-        # self.no_threading = kwargs['no_threading']
-        self.no_threading = True
+        self.no_threading = kwargs['no_threading']
 
         self.verbose_article = kwargs['verbose_article']
         self.rebuild_full_articles = kwargs['rebuild_full_articles']
+        self.force = kwargs['force']
 
         if self.feed_id:
             self.feeds_to_build = Feeds.objects.filter(id=self.feed_id)
@@ -54,6 +68,17 @@ class Command(BaseCommand):
                 raise LookupError(f"Feed ID ({self.feed_id}) not valid.")
         else:
             self.feeds_to_build = Feeds.objects.all()
+        self.feeds_to_build = self.feeds_to_build.select_related('scraper', 'user').prefetch_related('filters_set')
+
+        # Only plain, full re-filter builds may skip feeds that have not changed
+        self.conditional = not (self.force or self.rebuild_full_articles or self.article_id or
+                                self.article_url or self.max_articles)
+
+        # Failing feeds are not fetched again until their backoff has elapsed
+        if self.conditional and not self.feed_id:
+            backing_off = self.feeds_to_build.filter(state__consecutive_failures__gt=0, state__next_poll__gt=now())
+            self.skipped += [(feed, "Failing Feed Backing Off") for feed in backing_off]
+            self.feeds_to_build = self.feeds_to_build.exclude(pk__in=[feed.pk for feed, _ in self.skipped])
 
         if self.rebuild_full_articles:
             self.build_type = "Re-build Full Articles"
@@ -70,6 +95,7 @@ class Command(BaseCommand):
         parser.add_argument('-v3', '--verbose_article', action='store_true', help='Verbose output')
         parser.add_argument('-nt', '--no-threading', action='store_true', help='No Threading')
         parser.add_argument('-r', '--rebuild_full_articles', action='store_true', help='Force Rebuild of Full Articles')
+        parser.add_argument('-F', '--force', action='store_true', help='Rebuild feeds even if they have not changed')
 
     def vprint(self, message, color=None, on_color=None, *args, **kwargs):
         if self.verbose:
@@ -80,37 +106,90 @@ class Command(BaseCommand):
 
         # Start
         self.print_start_options()
+        host_health.get_tracker().reload()
         self.loop_all_feeds_and_build()
+        host_health.get_tracker().save()
+        evicted = response_cache.prune()
+        if evicted:
+            self.vprint(f"Evicted {evicted} pages from the response cache.")
 
         # Complete
         total_time = datetime.now() - self.startTime
         self.total_seconds = int(total_time.total_seconds())
         self.print_total_time()
+        self.print_skipped()
+        self.print_connection_stats()
         self.print_errors()
         self.print_total_time()
 
+        # A single feed build reports its failure, so a build job ends FAILED
+        if self.feed_id and self.failed:
+            raise CommandError("; ".join(f"{feed.name} (ID={feed.id}): {error}" for feed, error in self.failed))
+
+    def fetch_all_feeds(self) -> None:
+        """ Downloads every feed document concurrently before any feed is parsed or built. """
+        start_time = datetime.now()
+        request_headers = {}
+        states = {state.feed_id: state for state in FeedState.objects.filter(feed__in=self.feeds_to_build)}
+        if self.conditional:
+            self.retry_feed_ids = get_feeds_with_due_retries(self.feeds_to_build)
+
+        for feed in self.feeds_to_build:
+            headers = {}
+            state = states.get(feed.id)
+            if self.is_conditional_feed(feed=feed, state=state):
+                self.conditional_feed_ids.add(feed.id)
+                headers = state.get_conditional_headers()
+
+            # Feeds sharing a url only send validators when they all agree on them
+            if feed.url in request_headers and request_headers[feed.url] != headers:
+                headers = {}
+            request_headers[feed.url] = headers
+
+        fetcher = AsyncFetcher()
+        self.fetch_results = fetcher.fetch_all(urls=list(request_headers), request_headers=request_headers)
+
+        total_time = datetime.now() - start_time
+        self.vprint(f"Fetched {len(self.fetch_results)} feeds in {total_time.total_seconds():.2f} seconds.")
+
+    def is_conditional_feed(self, feed: Feeds, state: FeedState) -> bool:
+        """ Unchanged feeds may only be skipped when the last build used the current settings. """
+        if not self.conditional or state is None:
+            return False
+        # Article scrapes due for a retry need the entries, even if the feed has not changed
+        if feed.id in self.retry_feed_ids:
+            return False
+        if not os.path.isfile(os.path.join(utils.get_rss_folder(feed_id=feed.id), 'rss.xml')):
+            return False
+        return state.settings_hash == fingerprints.get_settings_fingerprint(feed, filters=feed.filters_set.all())
+
     def loop_all_feeds_and_build(self) -> None:
-        total_feeds = len(self.feeds_to_build)
-        thread_list = []
+        feeds = list(self.feeds_to_build)
+        total_feeds = len(feeds)
+
+        self.fetch_all_feeds()
 
         if self.no_threading:
-            for idx, feed in enumerate(self.feeds_to_build, start=1):
+            for idx, feed in enumerate(feeds, start=1):
                 self.build_filtered_feed(feed=feed, idx=idx, total_feeds=total_feeds, threaded=False)
-        else:
-            for idx, feed in enumerate(self.feeds_to_build, start=1):
-                t = threading.Thread(target=self.build_filtered_feed, args=(feed, idx, total_feeds))
-                thread_list.append(t)
-
-            for i, thread in enumerate(thread_list):
-                thread.start()
-
-            for i, thread in enumerate(thread_list):
-                thread.join()
-
-            # if success is False:
-            #     self.handle_error(Exception("self.build_filtered_feed(feed=feed) = FALSE"), feed)
-            #     # self.errors.append(feed)
-        pass
+            return
+
+        # Feed threads only read; every write goes through the single writer thread
+        with DatabaseWriter() as self.writer:
+            with ThreadPoolExecutor(max_workers=BUILD_FEED_WORKERS) as executor:
+                futures = {
+                    executor.submit(self.build_filtered_feed, feed, idx, total_feeds): feed
+                    for idx, feed in enumerate(feeds, start=1)
+                }
+        self.writer = None
+
+        # Errors that escaped build_filtered_feed (e.g. while saving the failed state)
+        for future, feed in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                self.handle_error(e, feed)
+                self.failed.append((feed, e))
 
     def build_filtered_feed(self, feed, idx, total_feeds, threaded=True) -> bool:
         # Build Filtered Feeds Object
@@ -118,20 +197,31 @@ class Command(BaseCommand):
         try:
             start_time = datetime.now()
             filtered_feed = BuildFeed(feed=feed,
+                                      fetch_result=self.fetch_results.get(feed.url),
+                                      conditional=feed.id in self.conditional_feed_ids,
                                       article_id=self.article_id,
                                       article_url=self.article_url,
                                       max_articles=self.max_articles,
                                       verbose=self.verbose,
                                       verbose_article=self.verbose_article,
                                       rebuild_full_articles=self.rebuild_full_articles,
-                                      threaded=threaded)
+                                      threaded=threaded,
+                                      writer=self.writer)
 
             if filtered_feed.errors:
                 self.errors.append(filtered_feed.errors)
 
+            # Feed unchanged since last build
+            if filtered_feed.skipped:
+                filtered_feed.save_state()
+                self.skipped.append((feed, filtered_feed.skipped))
+                self.vprint(f"Skipped - {idx}/{total_feeds} - {feed.name} - ({filtered_feed.skipped})")
+                return True
+
             # Save filtered feeds to file
             if filtered_feed.feedparser.is_valid:
                 filtered_feed.write_feeds_to_file()
+                filtered_feed.save_state()
 
                 total_time = datetime.now() - start_time
                 seconds = int(total_time.total_seconds())
@@ -139,9 +229,15 @@ class Command(BaseCommand):
                 return True
             else:
                 self.vprint(f"ERROR: Feed could not be parsed. Ignored building/saving file. (feed_id={feed.id}).")
+                save_failed_state(feed=feed, error="Feed could not be parsed.", writer=self.writer)
+                self.failed.append((feed, "Feed could not be parsed."))
                 return False
         except Exception as e:
             self.handle_error(e, feed)
+            self.failed.append((feed, e))
+            failures = save_failed_state(feed=feed, error=e, writer=self.writer)
+            self.vprint(f"Failed - {idx}/{total_feeds} - {feed.name} - ({failures} failures in a row)")
+            return False
 
     def handle_error(self, e: Exception, feed: Feeds) -> None:
         tb = traceback.format_exc()
@@ -175,6 +271,25 @@ class Command(BaseCommand):
 
         self.vprint("---------------------------------------", color='grey', on_color='on_grey')
 
+    def print_skipped(self) -> None:
+        if len(self.skipped) > 0:
+            reasons = {}
+            for feed, reason in self.skipped:
+                reasons[reason] = reasons.get(reason, 0) + 1
+
+            for reason, total in reasons.items():
+                self.vprint(f"Skipped ({total}) feeds: {reason}.", 'cyan')
+
+    def print_connection_stats(self) -> None:
+        stats = http_client.get_connection_stats()
+        if not stats:
+            return
+
+        self.vprint("\nConnections:", 'cyan')
+        for host, host_stats in sorted(stats.items(), key=lambda item: -item[1]['requests']):
+            self.vprint(f"\t{host}: {host_stats['requests']} requests over {host_stats['connections']} "
+                        f"connections ({host_stats['reused']} reused)")
+
     def print_errors(self) -> None:
         if len(self.errors) > 0:
             self.vprint(f"\nTotal of ({len(self.errors)}) feeds contained errors:")
@@ -196,15 +311,8 @@ class Command(BaseCommand):
 
     @staticmethod
     def replace_error_text(error_text: str, error_traceback: str) -> tuple:
-
-        if "failed with 403 Client Error: Forbidden" in error_text:
-            error_text = "Article `download()` failed with 403 Client Error: Forbidden"
-            error_traceback = None
-        elif "failed with 404 Client Error: Not Found" in error_text:
-            error_text = "Article `download()` failed with 404 Client Error: Not Found"
-            error_traceback = None
-        elif "(connect timeout=7)'" in error_text:
-            error_text = "Connection timed out. (connect timeout=7)'"
-            error_traceback = None
+        error_message = scrape_errors.get_error_message(scrape_errors.classify_error_text(error_text))
+        if error_message:
+            return error_message, None
 
         return error_text, error_traceback
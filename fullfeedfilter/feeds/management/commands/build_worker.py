@@ -0,0 +1,69 @@
+"""
+./manage.py build_worker
+./manage.py build_worker --once -v2
+"""
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandParser
+from termcolor import cprint
+
+from feeds.scripts import build_jobs
+
+STALE_JOB_TIMEOUT = timedelta(hours=1)
+FINISHED_JOB_RETENTION = timedelta(days=7)
+
+
+class Command(BaseCommand):
+    help = 'Runs queued feed builds (BuildJobs) until stopped.'
+
+    def __init__(self) -> None:
+        super().__init__(stdout=None, stderr=None, no_color=False, force_color=False)
+        self.verbose = False
+        self.once = False
+        self.sleep = 2.0
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('-s', '--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('-v2', '--verbose', action='store_true', help='Verbose output')
+
+    def vprint(self, message: str, color=None, on_color=None) -> print:
+        if self.verbose:
+            return cprint(message, color=color, on_color=on_color)
+
+    def handle(self, *args, **kwargs) -> None:
+        self.verbose = kwargs['verbose']
+        self.once = kwargs['once']
+        self.sleep = kwargs['sleep']
+
+        requeued = build_jobs.requeue_stale_jobs(timeout=STALE_JOB_TIMEOUT)
+        if requeued:
+            cprint(f"Re-queued {requeued} stale build jobs.", 'yellow')
+        build_jobs.delete_finished_jobs(older_than=FINISHED_JOB_RETENTION)
+
+        try:
+            while True:
+                job = build_jobs.claim_next_job()
+                if job is None:
+                    if self.once:
+                        break
+                    time.sleep(self.sleep)
+                    continue
+
+                self.run_job(job)
+        except KeyboardInterrupt:
+            cprint("Build worker stopped.", 'yellow')
+
+    def run_job(self, job) -> None:
+        start_time = datetime.now()
+        self.vprint(f"Building '{job.feed}' ({job.kind}, job_id={job.id})")
+
+        success = build_jobs.run_job(job, verbose=self.verbose)
+
+        seconds = (datetime.now() - start_time).total_seconds()
+        if success:
+            self.vprint(f"Completed '{job.feed}' ({job.kind}) in {seconds:.1f} seconds", 'green')
+        else:
+            cprint(f"Failed '{job.feed}' ({job.kind}, job_id={job.id})", 'red')
+            cprint(job.error, 'red')
@@ -0,0 +1,77 @@
+"""
+./manage.py scheduler
+./manage.py scheduler --once -v2
+"""
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db.models import Q
+from django.utils.timezone import now
+from termcolor import cprint
+
+from feeds.models import BuildJob, Feeds, FeedState
+from feeds.scripts import build_jobs, polling
+
+
+class Command(BaseCommand):
+    help = 'Queues builds for feeds whose adaptive polling interval has elapsed.'
+
+    def __init__(self) -> None:
+        super().__init__(stdout=None, stderr=None, no_color=False, force_color=False)
+        self.verbose = False
+        self.once = False
+        self.tick = 60.0
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--once', action='store_true', help='Queue the feeds that are due and exit')
+        parser.add_argument('-t', '--tick', type=float, default=60.0, help='Seconds between checks for due feeds')
+        parser.add_argument('-v2', '--verbose', action='store_true', help='Verbose output')
+
+    def vprint(self, message: str, color=None, on_color=None) -> print:
+        if self.verbose:
+            return cprint(message, color=color, on_color=on_color)
+
+    def handle(self, *args, **kwargs) -> None:
+        self.verbose = kwargs['verbose']
+        self.once = kwargs['once']
+        self.tick = kwargs['tick']
+
+        try:
+            while True:
+                self.dispatch_due_feeds()
+                if self.once:
+                    break
+                time.sleep(self.tick)
+        except KeyboardInterrupt:
+            cprint("Scheduler stopped.", 'yellow')
+
+    @staticmethod
+    def get_due_feeds():
+        """ Feeds that are due (or have never been polled) and have no build queued or running. """
+        return (
+            Feeds.objects
+            .filter(Q(state__isnull=True) | Q(state__next_poll__isnull=True) | Q(state__next_poll__lte=now()))
+            .exclude(build_jobs__state__in=[BuildJob.STATE_QUEUED, BuildJob.STATE_RUNNING])
+            .select_related('state')
+            .distinct()
+        )
+
+    def dispatch_due_feeds(self) -> int:
+        due_feeds = list(self.get_due_feeds())
+
+        for feed in due_feeds:
+            build_jobs.enqueue_build(feed=feed, kind=BuildJob.KIND_REFILTER, priority=build_jobs.PRIORITY_BACKGROUND)
+
+            # Lease the feed until its build stores the real schedule, so a build that never
+            # finishes does not get the feed queued again on every tick
+            state = getattr(feed, 'state', None)
+            if state is not None:
+                interval = state.poll_interval or polling.DEFAULT_POLL_INTERVAL
+                FeedState.objects.filter(pk=state.pk).update(next_poll=polling.get_next_poll(interval=interval))
+
+            self.vprint(f"Queued '{feed.name}' (feed_id={feed.id})")
+
+        if due_feeds:
+            cprint(f"{datetime.now():%H:%M:%S} Queued {len(due_feeds)} due feeds.", 'green')
+        return len(due_feeds)
@@ -0,0 +1,190 @@
+"""
+./manage.py stress_build
+./manage.py stress_build -n 100 -a 50 -r 3 -c 4 -v2
+"""
+import shutil
+import threading
+from datetime import datetime
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.utils.timezone import now
+from termcolor import cprint
+
+from feeds.management.commands.build import Command as BuildCommand
+from feeds.models import ArticleRecords, BuildJob, Feeds, FeedState
+from feeds.scripts import build_jobs
+from general.scripts import utils
+
+FEED_NAME_PREFIX = "stress-build-"
+
+
+class FeedServer:
+    """ Serves generated feeds from memory on a local port. """
+
+    def __init__(self, documents: dict) -> None:
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                content = documents.get(self.path)
+                self.send_response(200 if content is not None else 404)
+                self.send_header("Content-Type", "application/rss+xml")
+                self.end_headers()
+                if content is not None:
+                    self.wfile.write(content)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'FeedServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Command(BaseCommand):
+    help = 'Builds many generated feeds concurrently, with other writers running, and checks for lock errors.'
+
+    def __init__(self) -> None:
+        super().__init__(stdout=None, stderr=None, no_color=False, force_color=False)
+        self.verbose = False
+        self.contention_errors = []
+        self.contention_writes = 0
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('-n', '--feeds', type=int, default=50, help='Number of generated feeds')
+        parser.add_argument('-a', '--articles', type=int, default=30, help='Articles per feed')
+        parser.add_argument('-r', '--rounds', type=int, default=2, help='Forced builds of all feeds')
+        parser.add_argument('-c', '--contention', type=int, default=2,
+                            help='Threads writing BuildJobs and FeedStates while the feeds build')
+        parser.add_argument('-u', '--username', type=str, help='Owner of the generated feeds (default: first user)')
+        parser.add_argument('-v2', '--verbose', action='store_true', help='Verbose output')
+
+    def vprint(self, message: str, color=None, on_color=None) -> print:
+        if self.verbose:
+            return cprint(message, color=color, on_color=on_color)
+
+    def handle(self, *args, **kwargs) -> None:
+        self.verbose = kwargs['verbose']
+        total_feeds = kwargs['feeds']
+        total_articles = kwargs['articles']
+
+        user = User.objects.get(username=kwargs['username']) if kwargs['username'] else User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError("No user to own the generated feeds.")
+
+        with connection.cursor() as cursor:
+            journal_mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+        cprint(f"SQLite journal_mode={journal_mode}", 'yellow')
+
+        documents = {f"/{i}.xml": self.build_feed_document(i, total_articles) for i in range(total_feeds)}
+        with FeedServer(documents=documents) as server:
+            feeds = [
+                Feeds.objects.create(name=f"{FEED_NAME_PREFIX}{i}", url=f"{server.base_url}/{i}.xml", user=user)
+                for i in range(total_feeds)
+            ]
+            try:
+                lock_errors = 0
+                for build_round in range(1, kwargs['rounds'] + 1):
+                    lock_errors += self.run_round(feeds, build_round, total_articles, kwargs['contention'])
+            finally:
+                self.delete_feeds(feeds)
+
+        if lock_errors or self.contention_errors:
+            raise CommandError(f"{lock_errors} build errors and {len(self.contention_errors)} contention errors "
+                               f"mentioned 'database is locked'.")
+        cprint("No 'database is locked' errors.", 'green')
+
+    @staticmethod
+    def build_feed_document(feed_number: int, total_articles: int) -> bytes:
+        items = []
+        for i in range(total_articles):
+            items.append(
+                f"<item><title>Stress {feed_number} article {i}</title>"
+                f"<link>http://stress.invalid/{feed_number}/{i}.html</link>"
+                f"<description>{escape(f'<p>Body {i} of feed {feed_number}</p>')}</description>"
+                f"<pubDate>{format_datetime(datetime(2024, 1, 1 + i % 28, i % 24))}</pubDate>"
+                f"<category>tag{i % 5}</category></item>"
+            )
+        return (
+            f'<?xml version="1.0"?><rss version="2.0"><channel><title>Stress {feed_number}</title>'
+            f'<link>http://stress.invalid/{feed_number}/</link><description>Generated</description>'
+            f'{"".join(items)}</channel></rss>'
+        ).encode("utf-8")
+
+    def run_round(self, feeds: list, build_round: int, total_articles: int, contention: int) -> int:
+        build_command = BuildCommand()
+        build_command.init_kwargs(feed_id=None, article_id=None, article_url=None, max_articles=None,
+                                  verbose=self.verbose, verbose_article=False, no_threading=False,
+                                  rebuild_full_articles=False, force=True)
+        build_command.feeds_to_build = (
+            Feeds.objects.filter(pk__in=[feed.pk for feed in feeds])
+            .select_related('scraper', 'user')
+            .prefetch_related('filters_set')
+        )
+
+        stop = threading.Event()
+        contention_threads = [
+            threading.Thread(target=self.write_while_building, args=(feeds, stop)) for _ in range(contention)
+        ]
+        for thread in contention_threads:
+            thread.start()
+
+        start_time = datetime.now()
+        try:
+            build_command.loop_all_feeds_and_build()
+        finally:
+            stop.set()
+            for thread in contention_threads:
+                thread.join()
+        seconds = (datetime.now() - start_time).total_seconds()
+
+        errors = [error for feed_errors in build_command.errors for error in
+                  (feed_errors if isinstance(feed_errors, list) else [feed_errors])]
+        lock_errors = [error for error in errors if "database is locked" in str(error['exception'])]
+        for error in errors:
+            self.vprint(f"\t{error['feed_name']}: {error['exception']}", 'red')
+
+        records = ArticleRecords.objects.filter(feed__in=feeds).count()
+        expected = len(feeds) * total_articles
+        color = 'green' if not errors and records == expected else 'red'
+        cprint(f"Round {build_round}: {len(feeds)} feeds in {seconds:.2f} seconds "
+               f"({len(feeds) / max(seconds, 0.001):.1f} feeds/s), {len(errors)} errors "
+               f"({len(lock_errors)} locked), {records}/{expected} article records, "
+               f"{self.contention_writes} concurrent writes.", color)
+        return len(lock_errors)
+
+    def write_while_building(self, feeds: list, stop: threading.Event) -> None:
+        """ Writes from another connection the way the web process and the scheduler do. """
+        i = 0
+        try:
+            while not stop.is_set():
+                feed = feeds[i % len(feeds)]
+                try:
+                    build_jobs.enqueue_build(feed=feed, kind=BuildJob.KIND_REFILTER,
+                                             priority=build_jobs.PRIORITY_BACKGROUND)
+                    FeedState.objects.filter(feed=feed).update(next_poll=now())
+                    self.contention_writes += 1
+                except Exception as e:
+                    if "database is locked" in str(e):
+                        self.contention_errors.append(e)
+                    self.vprint(f"\tConcurrent write failed: {e}", 'red')
+                i += 1
+        finally:
+            connection.close()
+
+    def delete_feeds(self, feeds: list) -> None:
+        Feeds.objects.filter(pk__in=[feed.pk for feed in feeds]).delete()
+        for feed in feeds:
+            shutil.rmtree(utils.get_rss_folder(feed_id=feed.pk), ignore_errors=True)
+        self.vprint(f"Deleted {len(feeds)} generated feeds.")
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0044_auto_20190705_1615'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('etag', models.CharField(blank=True, max_length=250)),
+                ('last_modified', models.CharField(blank=True, max_length=50)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('last_fetched', models.DateTimeField(blank=True, null=True)),
+                ('feed', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='state', to='feeds.feeds')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0045_feedstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedstate',
+            name='entries_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='feedstate',
+            name='last_built',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feedstate',
+            name='settings_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
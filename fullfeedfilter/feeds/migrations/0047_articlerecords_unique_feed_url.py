@@ -0,0 +1,34 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:18
+
+from django.db import migrations
+
+
+def remove_duplicate_article_records(apps, schema_editor):
+    """ Keeps the oldest record for each (feed, url) so the unique constraint can be added. """
+    ArticleRecords = apps.get_model('feeds', 'ArticleRecords')
+
+    seen = set()
+    duplicate_ids = []
+    for pk, feed_id, url in ArticleRecords.objects.order_by('pk').values_list('pk', 'feed_id', 'url'):
+        if (feed_id, url) in seen:
+            duplicate_ids.append(pk)
+        else:
+            seen.add((feed_id, url))
+
+    for i in range(0, len(duplicate_ids), 500):
+        ArticleRecords.objects.filter(pk__in=duplicate_ids[i:i + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0046_feedstate_fingerprints'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_article_records, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='articlerecords',
+            unique_together={('feed', 'url')},
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:22
+
+import re
+from html import unescape
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+SPECIAL_CHARS = re.compile('[^A-Za-z0-9 ]+')
+
+
+def normalize_search_text(dirty_string):
+    # Copy of general.scripts.utils.normalize_search_text as of this migration
+    sanitized_string = unescape(dirty_string)
+    if '<' in sanitized_string or '&' in sanitized_string:
+        sanitized_string = strip_tags(sanitized_string)
+    return SPECIAL_CHARS.sub(' ', sanitized_string).lower().strip()
+
+
+def populate_normalized_keywords(apps, schema_editor):
+    Filters = apps.get_model('feeds', 'Filters')
+
+    filters = list(Filters.objects.all())
+    for _filter in filters:
+        _filter.normalized_keyword = normalize_search_text(_filter.keyword)
+    Filters.objects.bulk_update(filters, ['normalized_keyword'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0047_articlerecords_unique_feed_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filters',
+            name='normalized_keyword',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(populate_normalized_keywords, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0048_filters_normalized_keyword'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('refilter', 'Refilter'), ('rebuild', 'Rebuild'), ('full_rescrape', 'Full Rescrape')], default='refilter', max_length=20)),
+                ('priority', models.IntegerField(default=0)),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='build_jobs', to='feeds.feeds')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='buildjob',
+            index=models.Index(fields=['state', '-priority', 'created_at'], name='feeds_build_state_44c063_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0049_buildjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedstate',
+            name='next_poll',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feedstate',
+            name='poll_interval',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feedstate',
+            name='publish_interval',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feedstate',
+            name='total_not_modified',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feedstate',
+            name='total_polls',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feedstate',
+            name='unchanged_polls',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0050_feedstate_polling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articlerecords',
+            name='full_article_error',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='articlerecords',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
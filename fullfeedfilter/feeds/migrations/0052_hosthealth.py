@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0051_articlerecords_retry_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostHealth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('host', models.CharField(max_length=253, unique=True)),
+                ('state', models.CharField(choices=[('closed', 'Closed'), ('open', 'Open'), ('half_open', 'Half Open')], default='closed', max_length=10)),
+                ('failure_rate', models.FloatField(default=0.0)),
+                ('latency', models.FloatField(default=0.0)),
+                ('consecutive_failures', models.IntegerField(default=0)),
+                ('total_requests', models.IntegerField(default=0)),
+                ('total_failures', models.IntegerField(default=0)),
+                ('opened_at', models.DateTimeField(blank=True, null=True)),
+                ('last_failure', models.DateTimeField(blank=True, null=True)),
+                ('last_success', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0052_hosthealth'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedstate',
+            name='consecutive_failures',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feedstate',
+            name='last_error',
+            field=models.CharField(blank=True, max_length=250),
+        ),
+        migrations.AddField(
+            model_name='feedstate',
+            name='last_success',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.db import models
 from django.template.defaultfilters import slugify
 from django.urls import reverse, reverse_lazy
 
+from general.scripts.utils import normalize_search_text
+
 
 class ArticleScrapers(models.Model):
     name = models.CharField(max_length=50)
@@ -37,6 +39,7 @@ class Filters(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     feed = models.ForeignKey(Feeds, on_delete=models.CASCADE)
     keyword = models.CharField(max_length=50)
+    normalized_keyword = models.CharField(max_length=50, blank=True, default="", editable=False)
     condition = models.CharField(
         max_length=10,
         choices=(
@@ -67,6 +70,7 @@ class Filters(models.Model):
 
     def save(self, *args, **kwargs):
         self.keyword = self.keyword.lower()
+        self.normalized_keyword = normalize_search_text(self.keyword)
         return super(Filters, self).save(*args, **kwargs)
 
     def __str__(self):
@@ -76,6 +80,45 @@ class Filters(models.Model):
         return reverse_lazy("feed_view", kwargs={"pk": self.feed_id}, current_app="feeds")
 
 
+class FeedState(models.Model):
+    feed = models.OneToOneField(Feeds, on_delete=models.CASCADE, related_name="state")
+
+    # Conditional GET
+    etag = models.CharField(max_length=250, blank=True)
+    last_modified = models.CharField(max_length=50, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    last_fetched = models.DateTimeField(blank=True, null=True)
+
+    # Content Fingerprints
+    entries_hash = models.CharField(max_length=64, blank=True)
+    settings_hash = models.CharField(max_length=64, blank=True)
+    last_built = models.DateTimeField(blank=True, null=True)
+
+    # Polling Schedule (seconds)
+    next_poll = models.DateTimeField(blank=True, null=True, db_index=True)
+    poll_interval = models.IntegerField(blank=True, null=True)
+    publish_interval = models.IntegerField(blank=True, null=True)
+    unchanged_polls = models.IntegerField(default=0)
+    total_polls = models.IntegerField(default=0)
+    total_not_modified = models.IntegerField(default=0)
+
+    # Health
+    consecutive_failures = models.IntegerField(default=0)
+    last_success = models.DateTimeField(blank=True, null=True)
+    last_error = models.CharField(max_length=250, blank=True)
+
+    def __str__(self):
+        return f"{self.feed}"
+
+    def get_conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
 class FeedValidation(models.Model):
     feed = models.ForeignKey(Feeds, on_delete=models.CASCADE)
     error = models.CharField(max_length=250)
@@ -95,10 +138,97 @@ class ArticleRecords(models.Model):
 
     full_article = models.BooleanField(default=False)
     full_article_retries = models.IntegerField(default=0)
+    full_article_error = models.CharField(max_length=20, blank=True, default="")
+    next_retry_at = models.DateTimeField(blank=True, null=True)
 
     hidden = models.BooleanField(default=False)
     hidden_date = models.DateTimeField(blank=True, null=True)
     hidden_active_keywords = models.TextField(blank=True, null=True)
 
+    class Meta:
+        unique_together = ("feed", "url")
+
     def __str__(self):
         return self.title
+
+
+class BuildJob(models.Model):
+    """ A queued build of a feed, run by `./manage.py build_worker`. """
+    KIND_REFILTER = "refilter"
+    KIND_REBUILD = "rebuild"
+    KIND_FULL_RESCRAPE = "full_rescrape"
+
+    STATE_QUEUED = "queued"
+    STATE_RUNNING = "running"
+    STATE_DONE = "done"
+    STATE_FAILED = "failed"
+
+    # A queued job is upgraded, never downgraded, when the same feed is enqueued again
+    KIND_STRENGTH = {
+        KIND_REFILTER: 0,
+        KIND_REBUILD: 1,
+        KIND_FULL_RESCRAPE: 2,
+    }
+
+    feed = models.ForeignKey(Feeds, on_delete=models.CASCADE, related_name="build_jobs")
+    kind = models.CharField(
+        max_length=20,
+        default=KIND_REFILTER,
+        choices=(
+            (KIND_REFILTER, "Refilter"),
+            (KIND_REBUILD, "Rebuild"),
+            (KIND_FULL_RESCRAPE, "Full Rescrape"),
+        ),
+    )
+    priority = models.IntegerField(default=0)
+    state = models.CharField(
+        max_length=10,
+        default=STATE_QUEUED,
+        choices=(
+            (STATE_QUEUED, "Queued"),
+            (STATE_RUNNING, "Running"),
+            (STATE_DONE, "Done"),
+            (STATE_FAILED, "Failed"),
+        ),
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["state", "-priority", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.feed} [{self.kind}] ({self.state})"
+
+
+class HostHealth(models.Model):
+    """ Circuit breaker state for a host that articles are scraped from. """
+    STATE_CLOSED = "closed"
+    STATE_OPEN = "open"
+    STATE_HALF_OPEN = "half_open"
+
+    host = models.CharField(max_length=253, unique=True)
+    state = models.CharField(
+        max_length=10,
+        default=STATE_CLOSED,
+        choices=(
+            (STATE_CLOSED, "Closed"),
+            (STATE_OPEN, "Open"),
+            (STATE_HALF_OPEN, "Half Open"),
+        ),
+    )
+    failure_rate = models.FloatField(default=0.0)
+    latency = models.FloatField(default=0.0)
+    consecutive_failures = models.IntegerField(default=0)
+    total_requests = models.IntegerField(default=0)
+    total_failures = models.IntegerField(default=0)
+    opened_at = models.DateTimeField(blank=True, null=True)
+    last_failure = models.DateTimeField(blank=True, null=True)
+    last_success = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.host} ({self.state})"
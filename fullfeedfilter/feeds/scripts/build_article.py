@@ -1,16 +1,18 @@
 import email.utils
 import html
-import re
 import time
 import traceback
 from datetime import datetime
 
 import feedparser
-import newspaper
 from django.utils.timezone import now
-from feeds.models import ArticleRecords, ArticleScrapers, Feeds, Filters
+from feeds.models import ArticleRecords, ArticleScrapers, Filters
+from feeds.scripts.build_context import FeedBuildContext
 from feeds.scripts.build_snippets import Snippets
-from feeds.scripts.scrapers import CraigslistScraper, RedditScraper, SimpleScraper
+from feeds.scripts import extraction, http_client, response_cache, scrape_errors
+from feeds.scripts.host_health import CircuitOpenError, HostHealthTracker
+from feeds.scripts.keyword_matcher import normalize_filter_text
+from feeds.scripts.scrapers import RedditScraper, Scraper
 from full_feed_filter.settings import DOMAIN
 from general.scripts import utils
 
@@ -34,12 +36,14 @@ class FeedNotResolved(Exception):
 
 class Article:
     def __init__(
-        self, feedparser_entry: feedparser, feed: Feeds, rebuild_full_article=False
+        self, feedparser_entry: feedparser, context: FeedBuildContext, rebuild_full_article=False
     ) -> None:
 
         # Objects
-        self.feed = feed
+        self.context = context
+        self.feed = context.feed
         self.errors = []
+        self._article_records = context.article_records
 
         # Article - Attributes
         self.title = None
@@ -58,19 +62,28 @@ class Article:
 
         self.full_article = False
         self.full_article_retries = 0
+        self.full_article_error = ""
+        self.next_retry_at = None
+        self._scrape_failed = False
 
         # Article Objects
         self._rebuild_full_article = rebuild_full_article
 
         try:
-            self._feedparser_article = FeedParserArticle(feedparser_article=feedparser_entry)
+            self._feedparser_article = FeedParserArticle(
+                feedparser_article=feedparser_entry, scrapers=self.context.scrapers
+            )
             self._url = self._feedparser_article.get_link()
         except FeedNotResolved as e:
             self._handle_exception(e, show_tb=False)
             return
 
         self._database_article = None
-        self._scraper_article = ScraperArticle()
+        self._scraper_article = ScraperArticle(host_health=self.context.host_health)
+
+        # Pending Record (saved in bulk by BuildFeed.save_article_records)
+        self.record = None
+        self.record_changed = False
 
         # Build Article
         self._main()
@@ -89,11 +102,11 @@ class Article:
         )
 
     def _main(self):
-        db_record = ArticleRecords.objects.filter(url=self._url, feed=self.feed)
+        db_record = self._article_records.get(self._url)
 
         # Load From Database
-        if db_record.exists():
-            self._database_article = db_record.first()
+        if db_record is not None:
+            self._database_article = db_record
             self._update_article_attributes_from_database()
             if not self.hidden and self._update_article_attributes_from_scraper():
 
@@ -103,6 +116,10 @@ class Article:
 
                 self._update_or_create_record()
 
+            # Keep the stored article, but remember when its scrape may be retried
+            elif self._scrape_failed:
+                self._update_record_retry_schedule()
+
         # Load from RSS and/or Scraper
         else:
             self._update_article_attributes_from_feedparser()
@@ -112,6 +129,7 @@ class Article:
             self._append_article_snippets_to_description()
 
             self._database_article = self._update_or_create_record()
+            self._article_records[self._url] = self._database_article
 
     def _create_new_article_record(self):
         self._update_article_attributes_from_feedparser()
@@ -133,16 +151,30 @@ class Article:
             "tags": utils.convert_list_to_string(self.tags),
             "full_article": self.full_article,
             "full_article_retries": self.full_article_retries,
+            "full_article_error": self.full_article_error,
+            "next_retry_at": self.next_retry_at,
             "hidden": self.hidden,
             "hidden_date": self.hidden_date,
             "hidden_active_keywords": self.hidden_active_keywords,
         }
 
-        db_record = ArticleRecords.objects.filter(url=self._url, feed=self.feed)
-        if db_record.exists():
-            return db_record.update(**record)
+        if self._database_article is None:
+            self._database_article = ArticleRecords(**record)
         else:
-            return ArticleRecords.objects.create(**record)
+            for field, value in record.items():
+                setattr(self._database_article, field, value)
+
+        self.record = self._database_article
+        self.record_changed = True
+        return self.record
+
+    def _update_record_retry_schedule(self):
+        self._database_article.full_article_retries = self.full_article_retries
+        self._database_article.full_article_error = self.full_article_error
+        self._database_article.next_retry_at = self.next_retry_at
+
+        self.record = self._database_article
+        self.record_changed = True
 
     def _update_article_attributes_from_database(self):
         self.link = self._database_article.url
@@ -155,6 +187,8 @@ class Article:
 
         self.full_article = self._database_article.full_article
         self.full_article_retries = self._database_article.full_article_retries
+        self.full_article_error = self._database_article.full_article_error
+        self.next_retry_at = self._database_article.next_retry_at
 
         self.hidden = self._database_article.hidden
         self.hidden_date = self._database_article.hidden_date
@@ -172,24 +206,28 @@ class Article:
         self.tags = self._feedparser_article.tags
 
     def _update_article_attributes_from_scraper(self):
-        if self.feed.scraper.id != 1:
+        if self.feed.scraper_id != 1:
 
+            # Includes failed scrapes, which keep the feed's scraper when it is the default (Newspaper)
             db_article_needs_updating = (
                 self._database_article is None
-                or self._database_article.scraper != self.feed.scraper
+                or self._database_article.scraper_id != self.feed.scraper_id
+                or not self._database_article.full_article
             )
 
             if db_article_needs_updating or self._rebuild_full_article:
 
                 if (
                     self._database_article is not None
-                    and self._database_article.full_article_retries > 10
                     and not self._rebuild_full_article
+                    and not self._is_scrape_due()
                 ):
                     return False
 
+                # A retry downloads the page again: the cached copy is what failed to scrape
+                is_retry = self._database_article is not None and bool(self._database_article.full_article_error)
                 try:
-                    self._scraper_article.load(url=self._url, scraper=self.feed.scraper)
+                    self._scraper_article.load(url=self._url, scraper=self.feed.scraper, refresh=is_retry)
 
                     # Update Article with Scraper Attributes
                     if self._scraper_article.title:
@@ -200,15 +238,38 @@ class Article:
 
                     self.full_article = True
                     self.full_article_retries += 1
+                    self.full_article_error = ""
+                    self.next_retry_at = None
 
                     return True
 
+                except CircuitOpenError as e:
+                    # Not the article's fault: keep the RSS description and try again next build
+                    self._handle_exception(e)
+
                 except Exception as e:
                     self.full_article = False
                     self.full_article_retries += 1
+                    self._schedule_scrape_retry(e)
                     self._handle_exception(e)
         return False
 
+    def _is_scrape_due(self) -> bool:
+        if scrape_errors.is_permanent_error(self._database_article.full_article_error):
+            return False
+        next_retry_at = self._database_article.next_retry_at
+        return next_retry_at is None or next_retry_at <= now()
+
+    def _schedule_scrape_retry(self, exception: Exception) -> None:
+        """ Permanent errors are not retried; anything else is retried with exponential backoff. """
+        self._scrape_failed = True
+        self.full_article_error = scrape_errors.classify_exception(exception)
+
+        if scrape_errors.is_permanent_error(self.full_article_error):
+            self.next_retry_at = None
+        else:
+            self.next_retry_at = scrape_errors.get_next_retry_at(retries=self.full_article_retries)
+
     def _update_article_filter_attributes(self):
         filter_results = ArticleFilter(self)
         filter_results.filter()
@@ -224,17 +285,14 @@ class Article:
             self.tags = None
 
     def _sanitize_description(self):
+        text_transforms = self.context.text_transforms
+
         # Apply HTML Stop
-        if self.feed.stop_html:
-            self.description = self.description.split(self.feed.stop_html)[0]
+        self.description = text_transforms.apply_stop_html(self.description)
 
         # Remove Text
-        if self.feed.remove_text:
-            text_to_remove = self.feed.remove_text.split(",")
-            for text in text_to_remove:
-                pattern = re.compile(text, re.IGNORECASE)
-                self.description = pattern.sub("", self.description)
-                self.title = pattern.sub("", self.title)
+        self.description = text_transforms.remove_text(self.description)
+        self.title = text_transforms.remove_text(self.title)
 
         # Sanitize HTML
         self.description = utils.sanitize_html(self.description)
@@ -254,9 +312,10 @@ class Article:
 
 
 class FeedParserArticle:
-    def __init__(self, feedparser_article: feedparser):
+    def __init__(self, feedparser_article: feedparser, scrapers=None):
         # Init Objects
         self._feedparser_article = feedparser_article
+        self._scrapers = scrapers if scrapers is not None else {}
 
         # Init Attributes
         self.link = None
@@ -309,9 +368,11 @@ class FeedParserArticle:
             pass
         return tags
 
-    @staticmethod
-    def _get_article_scraper():
-        return ArticleScrapers.objects.get(name="Newspaper")
+    def _get_article_scraper(self):
+        scraper = self._scrapers.get("Newspaper")
+        if scraper is None:
+            scraper = ArticleScrapers.objects.get(name="Newspaper")
+        return scraper
 
     def _get_content_value(self) -> (str, None):
         content = self._feedparser_article.get("content", None)
@@ -335,8 +396,9 @@ class FeedParserArticle:
 
 
 class ScraperArticle:
-    def __init__(self):
+    def __init__(self, host_health: HostHealthTracker = None):
         self._url = None
+        self._host_health = host_health
         self._scraper = None
         self._scraper_article = None
 
@@ -345,18 +407,21 @@ class ScraperArticle:
         self.description = ""
         self.tags = []
 
-    def load(self, url: str, scraper: ArticleScrapers):
+    def load(self, url: str, scraper: ArticleScrapers, refresh: bool = False):
+        """ With refresh, the page is downloaded again instead of read from the response cache. """
         self._url = url
         self._scraper = scraper
 
-        if self._scraper.name == "Newspaper":
-            self._scraper_article = self._get_article_from_newspaper()
-        elif self._scraper.name == "Simple Scraper":
-            self._scraper_article = SimpleScraper(url=self._url)
-        elif self._scraper.name == "Craigslist Scraper":
-            self._scraper_article = CraigslistScraper(url=self._url)
-        elif self._scraper.name == "Reddit Scraper":
-            self._scraper_article = RedditScraper(url=self._url)
+        if self._scraper.name == "Reddit Scraper":
+            # Downloads the post's JSON and linked pages as it goes
+            self._scraper_article = self._request(lambda: RedditScraper(url=self._url))
+        elif self._scraper.name in extraction.EXTRACTORS:
+            # I/O here, CPU-bound extraction in the worker pool. Only network fetches go through
+            # the circuit breaker and count towards the host's latency.
+            content = None if refresh else self._get_cached_page()
+            if content is None:
+                content = self._request(lambda: self._download(refresh=refresh))
+            self._scraper_article = extraction.run(scraper_name=self._scraper.name, url=self._url, content=content)
         else:
             raise AttributeError(
                 f"Scraper Name '{self._scraper.name} not found in update_from_scraper()."
@@ -365,24 +430,41 @@ class ScraperArticle:
         self._validate_article_contents()
         self._update_attributes_from_scraper_article()
 
+    def _request(self, download):
+        """ Runs download() through the host's circuit breaker, recording its latency and outcome. """
+        if self._host_health is None:
+            return download()
+
+        self._host_health.before_request(url=self._url)
+        started = time.monotonic()
+        try:
+            result = download()
+        except Exception as e:
+            self._host_health.record_result(url=self._url, seconds=time.monotonic() - started, exception=e)
+            raise
+        self._host_health.record_result(url=self._url, seconds=time.monotonic() - started)
+        return result
+
+    def _get_cached_page(self) -> (str, bytes, None):
+        """ The page as _download() returns it, if it is fresh in the response cache. """
+        response = response_cache.get_fresh(self._url)
+        if response is None:
+            return None
+        if self._scraper.name == "Newspaper":
+            return http_client.get_response_text(response)
+        return response.content
+
+    def _download(self, refresh: bool = False) -> (str, bytes):
+        if self._scraper.name == "Newspaper":
+            return response_cache.get_html(self._url, refresh=refresh)
+        return Scraper.download(self._url, refresh=refresh)
+
     def _update_attributes_from_scraper_article(self):
         if self._scraper_article.title:
             self.title = html.escape(self._scraper_article.title)
         self.description += self._build_description_with_additional_details()
         self.tags = self._scraper_article.tags
 
-    def _get_article_from_newspaper(self) -> (newspaper.Article, None):
-        article = newspaper.Article(url=self._url, keep_article_html=True)
-
-        article.download()
-        article.parse()
-        article.nlp()
-
-        article.tags = article.keywords + article.meta_keywords
-        article.additional_images = None
-
-        return article
-
     def _validate_article_contents(self) -> None:
         error_text = (
             "<br /><br /><hr><i><small>FullFeedFilter could not generate the full article text for this link. "
@@ -435,8 +517,9 @@ class ArticleFilter:
 
         # Search Helpers
         self._filters = None
-        self._search_feed_text = None
-        self._search_tags_text = None
+        self._compiled_filters = None
+        self._normalized_sources = {}
+        self._matched_keywords = {}
 
         # Filter Results
         self.active_hide_filters = []
@@ -446,12 +529,11 @@ class ArticleFilter:
         self.hidden_active_keywords = None
 
     def filter(self):
-        self._filters = Filters.objects.filter(feed=self._article_to_filter.feed)
-        self._search_feed_text = self._get_search_feed_text()
-        self._search_tags_text = self._get_search_tags_text()
+        self._filters = self._article_to_filter.context.filters
+        self._compiled_filters = self._article_to_filter.context.compiled_filters
 
-        show_filters = self._filters.filter(action="show")
-        hide_filters = self._filters.filter(action="hide")
+        show_filters = self._article_to_filter.context.show_filters
+        hide_filters = self._article_to_filter.context.hide_filters
 
         # Check Show Filters
         for filter in show_filters:
@@ -496,46 +578,29 @@ class ArticleFilter:
         elif source == "link":
             return self._article_to_filter.link
         elif source == "tag":
-            return self._search_tags_text
+            return self._get_search_tags_text()
         else:
-            return self._search_feed_text
+            return self._get_search_feed_text()
 
-    @staticmethod
-    def _word_in_string(word: str, string: str) -> bool:
-        return f" {word} " in f" {string} "
+    def _get_normalized_source(self, source: str) -> str:
+        """ Normalizes each filter source at most once per article, and only if a filter uses it. """
+        if source not in self._normalized_sources:
+            self._normalized_sources[source] = normalize_filter_text(
+                self._get_mapped_filter_source_as_string(source)
+            )
+        return self._normalized_sources[source]
 
-    @staticmethod
-    def _word_not_in_string(word: str, string: str) -> bool:
-        result = True
-        if f" {word} " in f" {string} ":
-            result = False
-        return result
+    def _get_matched_keywords(self, source: str) -> set:
+        """ Scans each filter source once for all of the feed's keywords. """
+        if source not in self._matched_keywords:
+            self._matched_keywords[source] = self._compiled_filters.search(
+                source=source, text=self._get_normalized_source(source)
+            )
+        return self._matched_keywords[source]
 
     def _filter_is_true(self, filter: Filters) -> bool:
-        filter_source_string = self._get_mapped_filter_source_as_string(filter.source)
-
-        filter_keyword = utils.sanitize_string(
-            dirty_string=filter.keyword,
-            strip_html=True,
-            unescape_string=True,
-            strip_special_chars=True,
-            replace_special_chars_with_space=True,
-            lowercase=True,
-        )
-
-        filter_source = utils.sanitize_string(
-            dirty_string=filter_source_string,
-            strip_html=True,
-            unescape_string=True,
-            strip_special_chars=True,
-            replace_special_chars_with_space=True,
-            lowercase=True,
-        )
-
-        if filter.condition == "in":
-            return self._word_in_string(word=filter_keyword, string=filter_source)
-        else:
-            return self._word_not_in_string(word=filter_keyword, string=filter_source)
+        matched_keywords = self._get_matched_keywords(filter.source)
+        return self._compiled_filters.is_true(filter, matched_keywords=matched_keywords)
 
     def build_filter_keyword_link(self, filter: Filters) -> str:
         filter_link = (
@@ -0,0 +1,50 @@
+import threading
+
+from feeds.models import ArticleScrapers, Feeds
+from feeds.scripts import host_health
+from feeds.scripts.keyword_matcher import CompiledFilters
+from feeds.scripts.text_transforms import get_text_transforms
+
+# Compiled filters are reused across builds in the same process until a feed's filters change
+_compiled_filters_cache = {}
+_compiled_filters_lock = threading.Lock()
+
+
+def get_compiled_filters(feed: Feeds, filters: list) -> CompiledFilters:
+    signature = CompiledFilters.get_signature(filters)
+
+    with _compiled_filters_lock:
+        cached = _compiled_filters_cache.get(feed.pk)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+    compiled_filters = CompiledFilters(filters=filters)
+    with _compiled_filters_lock:
+        _compiled_filters_cache[feed.pk] = (signature, compiled_filters)
+    return compiled_filters
+
+
+class FeedBuildContext:
+    """
+    Configuration loaded once per feed build and shared by every Article of the feed,
+    so building an article never queries the database for feed settings.
+    """
+
+    def __init__(self, feed: Feeds) -> None:
+        self.feed = Feeds.objects.select_related("scraper", "user").get(pk=feed.pk)
+
+        # Filters
+        self.filters = list(self.feed.filters_set.order_by("pk"))
+        self.show_filters = [_filter for _filter in self.filters if _filter.action == "show"]
+        self.hide_filters = [_filter for _filter in self.filters if _filter.action == "hide"]
+        self.compiled_filters = get_compiled_filters(feed=self.feed, filters=self.filters)
+
+        # Remove Text & Stop HTML
+        self.text_transforms = get_text_transforms(feed=self.feed)
+
+        # Scrapers
+        self.scrapers = {scraper.name: scraper for scraper in ArticleScrapers.objects.all()}
+        self.host_health = host_health.get_tracker()
+
+        # Existing ArticleRecords for the feed's current entries, keyed by canonical url
+        self.article_records = {}
@@ -1,50 +1,188 @@
-import html
-import threading
 import traceback
-from html import unescape
+from concurrent.futures import ThreadPoolExecutor
 
-from django.template.loader import render_to_string
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
 
-from feeds.models import Feeds
+from feeds.models import ArticleRecords, Feeds, FeedState
 from general.scripts import utils
 from feeds.scripts.feed_validation import Feedparser
-from full_feed_filter.settings import DOMAIN
-from .build_article import Article
+from feeds.scripts import fingerprints, polling
+from feeds.scripts.build_context import FeedBuildContext
+from feeds.scripts.db_writer import ImmediateWriter
+from feeds.scripts.fetch import FetchResult
+from feeds.scripts.rss_writer import RssWriter
+from full_feed_filter.settings import BUILD_ARTICLE_WORKERS, DOMAIN
+from .build_article import Article, FeedNotResolved, FeedParserArticle
+
+ARTICLE_RECORD_UPDATE_FIELDS = [
+    'title',
+    'pub_date',
+    'scraper',
+    'description',
+    'tags',
+    'full_article',
+    'full_article_retries',
+    'full_article_error',
+    'next_retry_at',
+    'hidden',
+    'hidden_date',
+    'hidden_active_keywords',
+]
+
+
+def get_feeds_with_due_retries(feeds) -> set:
+    """ Ids of the feeds with a failed article scrape whose retry is due (see Article._is_scrape_due). """
+    return set(
+        ArticleRecords.objects.filter(feed__in=feeds, hidden=False, next_retry_at__lte=now())
+        .values_list('feed_id', flat=True)
+        .distinct()
+    )
+
+
+def save_failed_state(feed: Feeds, error: (Exception, str), writer=None) -> int:
+    """ Counts a failed build of the feed and backs off its polling. Returns the number of failures in a row. """
+    writer = ImmediateWriter() if writer is None else writer
+    return writer.run(_save_failed_state, feed=feed, error=error)
+
+
+def _save_failed_state(feed: Feeds, error: (Exception, str)) -> int:
+    state = FeedState.objects.get_or_create(feed=feed)[0]
+    consecutive_failures = state.consecutive_failures + 1
+    poll_interval = polling.get_failure_interval(consecutive_failures=consecutive_failures)
+
+    FeedState.objects.filter(pk=state.pk).update(
+        consecutive_failures=consecutive_failures,
+        last_error=str(error)[:250],
+        last_fetched=now(),
+        next_poll=polling.get_next_poll(interval=poll_interval),
+        poll_interval=poll_interval,
+    )
+    return consecutive_failures
 
 
 class BuildFeed:
     def __init__(self, feed: Feeds, verbose=False, rebuild_full_articles=False, article_id=None, article_url=None,
-                 max_articles=None, verbose_article=False, threaded=True) -> None:
+                 max_articles=None, verbose_article=False, threaded=True, fetch_result: FetchResult = None,
+                 conditional=False, writer=None) -> None:
         # Objects
-        self.feed = feed
+        self.writer = ImmediateWriter() if writer is None else writer
+        self.context = FeedBuildContext(feed=feed)
+        self.feed = self.context.feed
+        self.state = self.writer.run(FeedState.objects.get_or_create, feed=self.feed)[0]
         self.article_id_limit = article_id
         self.article_url_limit = article_url
         self.max_articles_limit = max_articles
         self.errors = []
         self.threaded = threaded
+        self.conditional = conditional
+        self.skipped = None
+        self.settings_hash = fingerprints.get_settings_fingerprint(self.feed, filters=self.context.filters)
+        self.entries_hash = None
+        self.entry_urls = []
+
+        # Attributes
+        self.verbose = verbose
+        self.verbose_article = verbose_article
+        self.rss_folder = utils.get_rss_folder(feed_id=self.feed.id)
+
         try:
-            self.feedparser = Feedparser(url=self.feed.url)
+            self.feedparser = Feedparser(url=self.feed.url,
+                                         fetch_result=fetch_result,
+                                         writer=self.writer,
+                                         etag=self.state.etag if self.conditional else None,
+                                         modified=self.state.last_modified if self.conditional else None)
         except AttributeError as e:
             self.handle_exception(e)
             return
         self.rebuild_full_articles = rebuild_full_articles
 
-        # Attributes
-        self.verbose = verbose
-        self.verbose_article = verbose_article
-        self.rss_folder = utils.get_rss_folder(feed_id=self.feed.id)
+        # Feed has not changed since the last build; keep the existing rss.xml
+        if self.is_not_modified():
+            self.skipped = "Not Modified"
+            return
+
+        self.entries_hash = fingerprints.get_entries_fingerprint(self.feedparser.feedparser['entries'])
+        if self.is_unchanged():
+            self.skipped = "Unchanged Entries & Settings"
+            return
 
         # Filter Articles
+        self.context.article_records = self.load_article_records()
         self.all_articles = []
         self.show_articles = []
         self.hide_articles = []
         self.articles = self.build_articles_object()
+        self.save_article_records()
+        if not self.has_article_limits():
+            self.writer.run(self.clear_dropped_retries)
         self.filter_articles()
 
     def vprint(self, message: str) -> print:
         if self.verbose:
             return print(message)
 
+    def is_not_modified(self) -> bool:
+        if self.feedparser.not_modified:
+            return True
+
+        content_hash = self.feedparser.content_hash
+        return self.conditional and content_hash != "" and content_hash == self.state.content_hash
+
+    def is_unchanged(self) -> bool:
+        """ Entries and settings match the last build, even though the origin sent the feed again. """
+        return (self.conditional
+                and self.entries_hash == self.state.entries_hash
+                and self.settings_hash == self.state.settings_hash)
+
+    def has_article_limits(self) -> bool:
+        return bool(self.article_id_limit or self.article_url_limit or self.max_articles_limit)
+
+    def get_polling_state(self) -> dict:
+        """ The feed's next poll time, stretched when nothing changed and reset by new entries. """
+        if self.skipped:
+            unchanged_polls = self.state.unchanged_polls + 1
+        else:
+            unchanged_polls = 0
+
+        publish_interval = self.state.publish_interval
+        if not self.feedparser.not_modified:
+            publish_interval = polling.get_publish_interval(self.feedparser.feedparser['entries']) or publish_interval
+
+        poll_interval = polling.get_poll_interval(publish_interval=publish_interval, unchanged_polls=unchanged_polls)
+        return {
+            'next_poll': polling.get_next_poll(interval=poll_interval),
+            'poll_interval': poll_interval,
+            'publish_interval': publish_interval,
+            'unchanged_polls': unchanged_polls,
+            'total_polls': F('total_polls') + 1,
+            'total_not_modified': F('total_not_modified') + int(self.feedparser.not_modified),
+        }
+
+    def save_state(self) -> None:
+        """ Stores the feed's validators and polling schedule after a successful build (or skip). """
+        fields = self.get_polling_state()
+        fields.update(last_fetched=now(), consecutive_failures=0, last_success=now(), last_error="")
+
+        # A 304 keeps the stored validators
+        if self.has_article_limits():
+            # Partial builds must not be treated as up to date on the next run
+            fields.update(etag="", last_modified="", content_hash="", entries_hash="", settings_hash="")
+        elif self.skipped and not self.feedparser.not_modified:
+            fields.update(etag=self.feedparser.etag,
+                          last_modified=self.feedparser.modified,
+                          content_hash=self.feedparser.content_hash)
+        elif not self.skipped:
+            fields.update(etag=self.feedparser.etag,
+                          last_modified=self.feedparser.modified,
+                          content_hash=self.feedparser.content_hash,
+                          entries_hash=self.entries_hash,
+                          settings_hash=self.settings_hash,
+                          last_built=now())
+
+        self.writer.run(FeedState.objects.filter(pk=self.state.pk).update, **fields)
+
     def handle_exception(self, exception: Exception) -> None:
         tb = traceback.format_exc()
         self.errors.append({
@@ -56,7 +194,7 @@ class BuildFeed:
             'traceback': tb,
         })
 
-    def build_article(self, i, feedparser_entry, entries, articles):
+    def build_article(self, i, feedparser_entry, entries) -> (Article, None):
 
         # Check Article Limits
         if self.article_id_limit:
@@ -74,35 +212,79 @@ class BuildFeed:
             self.vprint(f"  - ({i} of {len(entries)}) URL:{feedparser_entry.link}")
 
         full_filtered_article = Article(feedparser_entry=feedparser_entry,
-                                        feed=self.feed,
+                                        context=self.context,
                                         rebuild_full_article=self.rebuild_full_articles)
+        return full_filtered_article
+
+    def load_article_records(self) -> dict:
+        """ Loads existing records for all current entries in one query, keyed by canonical url. """
+        urls = []
+        for feedparser_entry in self.feedparser.feedparser['entries']:
+            try:
+                urls.append(FeedParserArticle(feedparser_article=feedparser_entry).get_link())
+            except FeedNotResolved:
+                continue
 
-        if full_filtered_article.errors:
-            self.errors += full_filtered_article.errors
+        self.entry_urls = urls
+        article_records = {}
+        for record in ArticleRecords.objects.filter(feed=self.feed, url__in=urls).order_by('pk'):
+            article_records.setdefault(record.url, record)
+        return article_records
 
-        articles.append(full_filtered_article)
+    def clear_dropped_retries(self) -> None:
+        """ Articles no longer in the feed are not built again, so their scrape retries would stay due forever. """
+        (ArticleRecords.objects.filter(feed=self.feed, next_retry_at__isnull=False)
+         .exclude(url__in=self.entry_urls)
+         .update(next_retry_at=None))
 
     def build_articles_object(self) -> list:
         entries = self.feedparser.feedparser['entries']
-        thread_list = []
-        articles = []
+        build_args = [(i, feedparser_entry, entries) for i, feedparser_entry in enumerate(entries, start=1)]
 
         if self.threaded:
-            for i, feedparser_entry in enumerate(entries, start=1):
-                t = threading.Thread(target=self.build_article, args=(i, feedparser_entry, entries, articles))
-                thread_list.append(t)
-
-            for thread in thread_list:
-                thread.start()
-
-            for thread in thread_list:
-                thread.join()
+            with ThreadPoolExecutor(max_workers=BUILD_ARTICLE_WORKERS) as executor:
+                results = list(executor.map(lambda args: self.build_article(*args), build_args))
         else:
-            for i, feedparser_entry in enumerate(entries, start=1):
-                self.build_article(i, feedparser_entry, entries, articles)
+            results = [self.build_article(*args) for args in build_args]
 
+        # Keep the feed's order whatever order the articles finished in
+        articles = []
+        for article in results:
+            if article is None:
+                continue
+            if article.errors:
+                self.errors += article.errors
+            articles.append(article)
         return articles
 
+    def save_article_records(self) -> None:
+        """ Writes all new and changed records for the feed in a single transaction, on the writer thread. """
+        new_records = {}
+        changed_records = {}
+        for article in self.articles:
+            if not article.record_changed:
+                continue
+            if article.record.pk is None:
+                new_records[id(article.record)] = article.record
+            else:
+                changed_records[id(article.record)] = article.record
+
+        if new_records or changed_records:
+            self.writer.run(self.write_article_records,
+                            new_records=list(new_records.values()),
+                            changed_records=list(changed_records.values()))
+
+    @staticmethod
+    def write_article_records(new_records: list, changed_records: list) -> None:
+        with transaction.atomic():
+            if new_records:
+                ArticleRecords.objects.bulk_create(new_records,
+                                                   update_conflicts=True,
+                                                   unique_fields=['feed', 'url'],
+                                                   update_fields=ARTICLE_RECORD_UPDATE_FIELDS)
+            if changed_records:
+                ArticleRecords.objects.bulk_update(changed_records, fields=ARTICLE_RECORD_UPDATE_FIELDS)
+
     def filter_articles(self) -> None:
         for article in self.articles:
             if not article.hidden:
@@ -132,22 +314,18 @@ class BuildFeed:
         utils.mkdir_if_doesnt_exist(directory=self.rss_folder)
 
         feed_title = f"{self.feed.name} - (Filtered)"
-        self.write_feed_to_file(filename='rss.xml', feed_title=feed_title, articles=self.show_articles)
+        if not self.write_feed_to_file(filename='rss.xml', feed_title=feed_title, articles=self.show_articles):
+            self.vprint(f"Filtered feed is unchanged; '{self.rss_folder}rss.xml' was left as is.")
 
-    def write_feed_to_file(self, filename, articles, feed_title=None) -> None:
-        xml_link = f"http://{DOMAIN}/{self.feed.user.username}/{self.feed.slug}/"''
+    def write_feed_to_file(self, filename, articles, feed_title=None) -> bool:
+        xml_link = f"http://{DOMAIN}/{self.feed.user.username}/{self.feed.slug}/"
         feed_title = self.feed.name if feed_title is None else feed_title
 
-        context = {
-            'xml_link': html.escape(xml_link),
-            'title': html.escape(feed_title),
-            'link': html.escape(self.feed.url),
-            'description': html.escape(self.feedparser.description),
-            'articles': articles,
-        }
-
-        rss_string = render_to_string('rss/rss.xml', context)
-
-        rss_string = unescape(rss_string)
-        with open(f'{self.rss_folder}{filename}', 'w') as fp:
-            fp.write(str(rss_string.encode('ascii', 'ignore').decode()))
+        rss_writer = RssWriter(
+            path=f'{self.rss_folder}{filename}',
+            xml_link=xml_link,
+            title=feed_title,
+            link=self.feed.url,
+            description=self.feedparser.description,
+        )
+        return rss_writer.write(articles=articles)
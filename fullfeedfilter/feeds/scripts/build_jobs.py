@@ -0,0 +1,143 @@
+"""
+Database-backed queue of feed builds.
+
+Web views enqueue a BuildJob and return immediately; `./manage.py build_worker` claims
+queued jobs and runs them. A feed has at most one queued job: enqueueing it again upgrades
+the queued job's kind and priority instead of adding another one.
+"""
+import traceback
+from datetime import timedelta
+
+from django.core import management
+from django.db import transaction
+from django.utils.timezone import now
+
+from feeds.models import BuildJob, Feeds
+from feeds.scripts.rss_writer import RssWriter
+from full_feed_filter.settings import DOMAIN
+
+# Priorities
+PRIORITY_BACKGROUND = 0
+PRIORITY_USER = 10
+PRIORITY_MISSING_FEED = 20
+
+# Seconds a reader is asked to wait before polling a feed that is still being built
+PLACEHOLDER_RETRY_AFTER = 30
+
+# `./manage.py build` options for each kind of job
+BUILD_OPTIONS = {
+    BuildJob.KIND_REFILTER: {},
+    BuildJob.KIND_REBUILD: {"force": True},
+    BuildJob.KIND_FULL_RESCRAPE: {"force": True, "rebuild_full_articles": True},
+}
+
+
+def enqueue_build(feed: Feeds, kind: str = BuildJob.KIND_REFILTER, priority: int = PRIORITY_USER) -> BuildJob:
+    """
+    Queues a build of the feed, coalescing with a build that is already queued.
+
+    select_for_update() does nothing on SQLite. There the read and the write below are kept
+    together by the atomic block, which starts with BEGIN IMMEDIATE and so holds the database's
+    write lock from the start (see general.backends.sqlite3); other backends lock the row.
+    """
+    with transaction.atomic():
+        job = (
+            BuildJob.objects.select_for_update()
+            .filter(feed=feed, state=BuildJob.STATE_QUEUED)
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return BuildJob.objects.create(feed=feed, kind=kind, priority=priority)
+
+        update_fields = []
+        if BuildJob.KIND_STRENGTH[kind] > BuildJob.KIND_STRENGTH[job.kind]:
+            job.kind = kind
+            update_fields.append("kind")
+        if priority > job.priority:
+            job.priority = priority
+            update_fields.append("priority")
+        if update_fields:
+            job.save(update_fields=update_fields)
+        return job
+
+
+def claim_next_job() -> (BuildJob, None):
+    """ Marks the next queued job as running and returns it. Safe to call from several workers. """
+    while True:
+        job = (
+            BuildJob.objects.filter(state=BuildJob.STATE_QUEUED)
+            .order_by("-priority", "created_at")
+            .first()
+        )
+        if job is None:
+            return None
+
+        # Only one worker can move the job out of the queued state: the UPDATE matches no row
+        # once another worker has claimed it (no row lock needed, so this holds on SQLite too)
+        claimed = BuildJob.objects.filter(pk=job.pk, state=BuildJob.STATE_QUEUED).update(
+            state=BuildJob.STATE_RUNNING, started_at=now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job: BuildJob, verbose: bool = False) -> bool:
+    try:
+        management.call_command("build", feed_id=job.feed_id, verbose=verbose, **BUILD_OPTIONS[job.kind])
+    except Exception:
+        job.state = BuildJob.STATE_FAILED
+        job.error = traceback.format_exc()
+    else:
+        job.state = BuildJob.STATE_DONE
+
+    job.finished_at = now()
+    job.save(update_fields=["state", "error", "finished_at"])
+    return job.state == BuildJob.STATE_DONE
+
+
+def requeue_stale_jobs(timeout: timedelta) -> int:
+    """ Returns jobs left running by a worker that died to the queue. """
+    return BuildJob.objects.filter(state=BuildJob.STATE_RUNNING, started_at__lt=now() - timeout).update(
+        state=BuildJob.STATE_QUEUED, started_at=None
+    )
+
+
+def delete_finished_jobs(older_than: timedelta) -> int:
+    deleted, _ = BuildJob.objects.filter(
+        state__in=[BuildJob.STATE_DONE, BuildJob.STATE_FAILED], finished_at__lt=now() - older_than
+    ).delete()
+    return deleted
+
+
+def get_build_status(feed: Feeds) -> dict:
+    """ The feed's most recent job and last build time, for the feed page to poll. """
+    job = BuildJob.objects.filter(feed=feed).order_by("-created_at").first()
+    state = getattr(feed, "state", None)
+
+    return {
+        "feed_id": feed.id,
+        "job": None if job is None else {
+            "id": job.id,
+            "kind": job.kind,
+            "state": job.state,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "failed": job.state == BuildJob.STATE_FAILED,
+        },
+        "last_built": None if state is None else state.last_built,
+    }
+
+
+def render_placeholder_feed(feed: Feeds) -> str:
+    """ A valid, empty feed returned while the feed's first build is queued or running. """
+    rss_writer = RssWriter(
+        path=None,
+        xml_link=f"http://{DOMAIN}/{feed.user.username}/{feed.slug}/",
+        title=f"{feed.name} - (Filtered)",
+        link=feed.url,
+        description="This feed is being built. Check back shortly.",
+    )
+    return rss_writer.render(articles=[])
@@ -0,0 +1,68 @@
+"""
+Single writer thread for threaded builds.
+
+SQLite allows one writer at a time. Instead of letting every feed thread compete for the
+write lock, `./manage.py build` starts one DatabaseWriter and every build-time write
+(ArticleRecords, FeedState, feed url changes) is queued to it and runs in order on its own
+connection. Feed and article threads only ever read.
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.db import connections
+
+
+class DatabaseWriter:
+    def __init__(self) -> None:
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="database-writer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'DatabaseWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+
+                future, func, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            connections.close_all()
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def run(self, func, *args, **kwargs):
+        """ Runs func on the writer thread and waits for its result (or exception). """
+        if threading.current_thread() is self._thread:
+            return func(*args, **kwargs)
+        return self.submit(func, *args, **kwargs).result()
+
+    def close(self) -> None:
+        """ Finishes the queued writes and stops the thread. """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+class ImmediateWriter:
+    """ Same interface as DatabaseWriter, writing on the calling thread (for single builds and views). """
+
+    @staticmethod
+    def run(func, *args, **kwargs):
+        return func(*args, **kwargs)
@@ -0,0 +1,146 @@
+"""
+CPU stage of full-article scraping.
+
+Downloading an article page is I/O and stays on the build's threads (see
+ScraperArticle.load). Turning the page into an article (newspaper's parse() and nlp(),
+BeautifulSoup selectors) holds the GIL, so it runs in a pool of worker processes instead:
+workers receive the url and raw html and return a plain dict of article attributes.
+
+Workers are forked from a forkserver that has already imported newspaper and BeautifulSoup,
+load NLTK's punkt tokenizer as they start, and are all started with the pool, so the first
+articles do not pay for it. EXTRACTION_WORKERS sets the pool size (default: one per core);
+0 extracts on the calling thread.
+"""
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import newspaper
+
+from feeds.scripts import scraper_registry
+from feeds.scripts.scrapers import CraigslistScraper, SimpleScraper
+from full_feed_filter.settings import EXTRACTION_WORKERS
+
+ARTICLE_ATTRIBUTES = ["title", "top_image", "article_html", "movies", "additional_images", "tags"]
+
+
+class ExtractedArticle:
+    """ The attributes Article reads from a scraper, rebuilt from an extract() result. """
+
+    def __init__(self, attributes: dict) -> None:
+        self.title = attributes.get("title")
+        self.top_image = attributes.get("top_image")
+        self.article_html = attributes.get("article_html")
+        self.movies = attributes.get("movies")
+        self.additional_images = attributes.get("additional_images")
+        self.tags = attributes.get("tags") or []
+
+
+def get_attributes(article) -> dict:
+    return {name: getattr(article, name, None) for name in ARTICLE_ATTRIBUTES}
+
+
+def extract_newspaper(url: str, content: str) -> dict:
+    article = newspaper.Article(url=url, keep_article_html=True)
+    article.download(input_html=content)
+    article.parse()
+    article.nlp()
+
+    attributes = get_attributes(article)
+    attributes["movies"] = list(article.movies)
+    attributes["additional_images"] = None
+    attributes["tags"] = article.keywords + article.meta_keywords
+    return attributes
+
+
+def extract_simple(url: str, content: bytes) -> dict:
+    return get_attributes(SimpleScraper(url=url, content=content))
+
+
+def extract_craigslist(url: str, content: bytes) -> dict:
+    return get_attributes(CraigslistScraper(url=url, content=content))
+
+
+# Scrapers whose extraction can run in a worker. The Reddit Scraper is not here: it downloads
+# the post's JSON and linked pages as it goes, so it runs on the build's threads.
+EXTRACTORS = {
+    "Newspaper": extract_newspaper,
+    "Simple Scraper": extract_simple,
+    "Craigslist Scraper": extract_craigslist,
+}
+
+
+def extract(scraper_name: str, url: str, content: (str, bytes)) -> dict:
+    return EXTRACTORS[scraper_name](url, content)
+
+
+def warm_up() -> None:
+    """ Loads what extraction needs up front, so the first article in each worker is not slower. """
+    import nltk.data
+
+    scraper_registry.get_url_config("http://localhost/")
+    try:
+        nltk.data.load("tokenizers/punkt/english.pickle")
+    except LookupError:
+        pass
+
+
+def _ping(_) -> None:
+    return None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> (ProcessPoolExecutor, None):
+    global _pool
+    if EXTRACTION_WORKERS <= 0:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            # Forked from a clean server process rather than from the (threaded) build
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS, mp_context=context, initializer=warm_up)
+
+            # Start every worker now instead of on the first articles
+            list(_pool.map(_ping, range(EXTRACTION_WORKERS)))
+            atexit.register(shutdown)
+        return _pool
+
+
+def run(scraper_name: str, url: str, content: (str, bytes)) -> ExtractedArticle:
+    """
+    Extracts the article in the worker pool, or on this thread when the pool is disabled.
+    If a worker died (OOM, a crash in lxml or newspaper), the broken pool is dropped, so the
+    next article starts a new one, and this article is extracted on this thread.
+    """
+    pool = get_pool()
+    if pool is None:
+        return ExtractedArticle(extract(scraper_name, url, content))
+    try:
+        return ExtractedArticle(pool.submit(extract, scraper_name, url, content).result())
+    except BrokenProcessPool:
+        discard_pool(pool)
+        return ExtractedArticle(extract(scraper_name, url, content))
+
+
+def discard_pool(pool: ProcessPoolExecutor) -> None:
+    """ Forgets a broken pool, unless another thread already replaced it. """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
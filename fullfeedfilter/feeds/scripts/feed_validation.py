@@ -1,35 +1,57 @@
+import hashlib
+
 import feedparser as feedparser
 import requests
 from bs4 import BeautifulSoup
 
 from feeds.models import Feeds
+from feeds.scripts import http_client
+from feeds.scripts.db_writer import ImmediateWriter
+from feeds.scripts.fetch import FetchResult, fetch_url
 
 
 class Feedparser:
-    def __init__(self, url: str) -> None:
+    def __init__(self, url: str, fetch_result: FetchResult = None, etag=None, modified=None, writer=None) -> None:
         self.url = url
+        self.fetch_result = fetch_result
+        self.writer = ImmediateWriter() if writer is None else writer
         self.feedparser = None
         self.title = None
         self.link = None
         self.description = None
 
+        # Conditional GET
+        self.request_etag = etag
+        self.request_modified = modified
+        self.not_modified = False
+        self.etag = ""
+        self.modified = ""
+        self.content_hash = ""
+
         self.is_valid = self.validate()
 
     def validate(self) -> bool:
         try:
-            self.feedparser = feedparser.parse(self.url)
+            if self.fetch_result is None:
+                self.fetch_result = fetch_url(url=self.url, headers=self.get_conditional_headers())
+            self.feedparser = self.parse_fetch_result()
             status = self.feedparser.status
 
+            # Feed has not changed since the validators were stored
+            if status == 304:
+                self.not_modified = True
+                return False
+
+            self.etag = self.feedparser.get('etag', '')
+            self.modified = self.feedparser.get('modified', '')
+
             # If feed url changed, update in database
             changed_status = [
                 301,  # 301 Moved Permanently
                 302,  # 302 Found (Previously "Moved temporarily")
             ]
             if status in changed_status:
-                new_url = self.feedparser.href
-                feed = Feeds.objects.filter(url=self.url).first()
-                feed.url = new_url
-                feed.save()
+                self.writer.run(self.update_feed_url, new_url=self.feedparser.href)
 
             allowed_status = [
                 200, # OK
@@ -51,6 +73,38 @@ class Feedparser:
         except Exception as e:
             raise e
 
+    def update_feed_url(self, new_url: str) -> None:
+        feed = Feeds.objects.filter(url=self.url).first()
+        feed.url = new_url
+        feed.save()
+
+    def get_conditional_headers(self) -> dict:
+        headers = {}
+        if self.request_etag:
+            headers['If-None-Match'] = self.request_etag
+        if self.request_modified:
+            headers['If-Modified-Since'] = self.request_modified
+        return headers
+
+    def parse_fetch_result(self) -> feedparser.FeedParserDict:
+        """ Parses a document downloaded ahead of time by the fetch stage. """
+        if self.fetch_result.exception:
+            raise self.fetch_result.exception
+
+        parsed = feedparser.parse(self.fetch_result.content, response_headers=self.fetch_result.headers)
+
+        # Report redirects the same way feedparser does when it downloads the url itself
+        status = self.fetch_result.status
+        if self.fetch_result.history:
+            status = self.fetch_result.history[0]
+        parsed['status'] = status
+        parsed['href'] = self.fetch_result.href
+        parsed['etag'] = self.fetch_result.headers.get('etag', '')
+        parsed['modified'] = self.fetch_result.headers.get('last-modified', '')
+
+        self.content_hash = hashlib.sha256(self.fetch_result.content).hexdigest()
+        return parsed
+
 
 class ValidateFeed:
     def __init__(self, url: str) -> None:
@@ -64,7 +118,7 @@ class ValidateFeed:
 
     def check_feed_url(self) -> requests:
         payload = {'url': self.url}
-        response = requests.post('https://validator.w3.org/feed/check.cgi', data=payload)
+        response = http_client.post('https://validator.w3.org/feed/check.cgi', data=payload)
 
         return self.parse_response(response=response)
 
@@ -0,0 +1,94 @@
+"""
+Concurrent fetch stage for `./manage.py build`.
+
+Downloads are scheduled on an asyncio event loop and bounded by a global and a
+per-host concurrency cap. The blocking HTTP call itself runs on a worker thread
+through the shared http_client session, so parsing, filtering and database writes
+stay with the caller.
+"""
+import asyncio
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from feeds.scripts import http_client
+
+MAX_CONCURRENCY = 20
+MAX_CONCURRENCY_PER_HOST = 2
+FETCH_TIMEOUT = 10
+
+
+class FetchResult:
+    def __init__(self, url: str, status=None, href=None, content=b"", headers=None, history=None,
+                 exception=None) -> None:
+        self.url = url
+        self.status = status
+        self.href = href if href else url
+        self.content = content
+        self.headers = headers if headers else {}
+        self.history = history if history else []
+        self.exception = exception
+
+    @classmethod
+    def from_response(cls, url: str, response: requests.Response) -> 'FetchResult':
+        return cls(url=url,
+                   status=response.status_code,
+                   href=response.url,
+                   content=response.content,
+                   headers={key.lower(): value for key, value in response.headers.items()},
+                   history=[r.status_code for r in response.history])
+
+
+def fetch_url(url: str, headers=None, timeout=FETCH_TIMEOUT) -> FetchResult:
+    response = http_client.get(url, headers=headers, timeout=timeout)
+    return FetchResult.from_response(url=url, response=response)
+
+
+class AsyncFetcher:
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, max_concurrency_per_host=MAX_CONCURRENCY_PER_HOST,
+                 timeout=FETCH_TIMEOUT, user_agent=None) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.timeout = timeout
+        self.user_agent = user_agent
+
+        self._semaphore = None
+        self._host_semaphores = {}
+
+    def fetch_all(self, urls: list, request_headers=None) -> dict:
+        """ Fetches all urls concurrently. Returns a dict of {url: FetchResult}. """
+        request_headers = request_headers if request_headers else {}
+        return asyncio.run(self._fetch_all(urls=list(dict.fromkeys(urls)), request_headers=request_headers))
+
+    async def _fetch_all(self, urls: list, request_headers: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.max_concurrency))
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._host_semaphores = {}
+
+        results = await asyncio.gather(*[self._fetch(url, request_headers.get(url)) for url in urls])
+        return {result.url: result for result in results}
+
+    def _get_host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urllib.parse.urlparse(url).netloc.lower()
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_concurrency_per_host)
+        return self._host_semaphores[host]
+
+    async def _fetch(self, url: str, headers=None) -> FetchResult:
+        # Wait for a host slot first so a busy host never holds global slots idle.
+        async with self._get_host_semaphore(url):
+            async with self._semaphore:
+                try:
+                    return await asyncio.to_thread(self.get, url, headers)
+                except Exception as e:
+                    return FetchResult(url=url, exception=e)
+
+    def get(self, url: str, headers=None) -> FetchResult:
+        headers = dict(headers) if headers else {}
+        if self.user_agent:
+            headers.setdefault('User-Agent', self.user_agent)
+
+        return fetch_url(url=url, headers=headers, timeout=self.timeout)
@@ -0,0 +1,44 @@
+"""
+Fingerprints used by `./manage.py build` to detect feeds that have not changed since their
+last successful build.
+"""
+import hashlib
+import json
+
+from feeds.models import Feeds, Filters
+
+
+def get_fingerprint(value) -> str:
+    serialized = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def get_entries_fingerprint(entries: list) -> str:
+    """ Hashes the parts of each feed entry that can change a built article. """
+    normalized = []
+    for entry in entries:
+        normalized.append([
+            entry.get("link", ""),
+            entry.get("updated", entry.get("published", "")),
+            entry.get("title", ""),
+        ])
+    return get_fingerprint(normalized)
+
+
+def get_settings_fingerprint(feed: Feeds, filters=None) -> str:
+    """ Hashes the feed settings and filters that are applied while building the feed. """
+    if filters is None:
+        filters = Filters.objects.filter(feed=feed)
+
+    settings = {
+        "name": feed.name,
+        "url": feed.url,
+        "scraper": feed.scraper_id,
+        "remove_text": feed.remove_text,
+        "stop_html": feed.stop_html,
+        "filters": sorted(
+            [_filter.id, _filter.keyword, _filter.condition, _filter.source, _filter.action]
+            for _filter in filters
+        ),
+    }
+    return get_fingerprint(settings)
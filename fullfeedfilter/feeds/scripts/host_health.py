@@ -0,0 +1,168 @@
+"""
+Per-host circuit breaker for full-article scraping.
+
+Every scrape records its latency and whether the host failed (timeouts, connection errors
+and 5xx; see scrape_errors.HOST_ERRORS) in an exponentially weighted moving average.
+A host with too many failures is opened: scrapes of it fail fast with CircuitOpenError and
+the article keeps its RSS description. After OPEN_DURATION the host is half-open and a
+single trial scrape decides whether it is closed again or re-opened.
+
+The state is kept in HostHealth rows, reloaded at the start of each `./manage.py build` (so a
+long-running build_worker sees circuits opened or closed by other processes) and saved at its
+end. Request and failure counts are saved as increments, so concurrent builds add up.
+"""
+import threading
+from datetime import timedelta
+from urllib.parse import urlparse
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from feeds.models import HostHealth
+from feeds.scripts import scrape_errors
+
+# Weight of the newest request in the failure rate and latency averages
+EWMA_ALPHA = 0.2
+
+# Open the circuit after this many failures in a row...
+CONSECUTIVE_FAILURE_THRESHOLD = 5
+# ...or when the failure rate reaches this, once the host has enough requests
+FAILURE_RATE_THRESHOLD = 0.5
+MIN_REQUESTS = 10
+
+OPEN_DURATION = timedelta(minutes=10)
+
+# Saved as last seen by this process; total_requests and total_failures are saved as increments
+HOST_STATE_FIELDS = [
+    'state',
+    'failure_rate',
+    'latency',
+    'consecutive_failures',
+    'opened_at',
+    'last_failure',
+    'last_success',
+]
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_at) -> None:
+        super().__init__(f"Circuit open for host '{host}'; skipped scraping until {retry_at:%Y-%m-%d %H:%M}.")
+        self.host = host
+        self.retry_at = retry_at
+
+
+def get_host(url: str) -> str:
+    return (urlparse(url).hostname or "").lower()
+
+
+class HostHealthTracker:
+    def __init__(self) -> None:
+        self._hosts = {health.host: health for health in HostHealth.objects.all()}
+        self._changed = set()
+        # host: [requests, failures] recorded since the last save
+        self._increments = {}
+        self._trials_in_flight = set()
+        self._lock = threading.Lock()
+
+    def reload(self) -> None:
+        """ Reads the hosts again from the database, keeping those with unsaved changes. """
+        hosts = {health.host: health for health in HostHealth.objects.all()}
+        with self._lock:
+            for host in self._changed:
+                hosts[host] = self._hosts[host]
+            self._hosts = hosts
+
+    def _get(self, host: str) -> HostHealth:
+        health = self._hosts.get(host)
+        if health is None:
+            health = self._hosts[host] = HostHealth(host=host)
+        return health
+
+    def before_request(self, url: str) -> None:
+        """ Raises CircuitOpenError if the url's host is open, or half-open with a trial already running. """
+        host = get_host(url)
+        with self._lock:
+            health = self._hosts.get(host)
+            if health is None or health.state == HostHealth.STATE_CLOSED:
+                return
+
+            retry_at = health.opened_at + OPEN_DURATION
+            if health.state == HostHealth.STATE_OPEN and now() >= retry_at:
+                health.state = HostHealth.STATE_HALF_OPEN
+                self._changed.add(host)
+
+            if health.state == HostHealth.STATE_HALF_OPEN and host not in self._trials_in_flight:
+                self._trials_in_flight.add(host)
+                return
+
+            raise CircuitOpenError(host=host, retry_at=retry_at)
+
+    def record_result(self, url: str, seconds: float, exception: Exception = None) -> None:
+        """ Records a finished request. Exceptions that are not host errors count as successes. """
+        host = get_host(url)
+        failed = exception is not None and scrape_errors.is_host_error(scrape_errors.classify_exception(exception))
+
+        with self._lock:
+            health = self._get(host)
+            self._trials_in_flight.discard(host)
+            self._changed.add(host)
+            increments = self._increments.setdefault(host, [0, 0])
+            increments[0] += 1
+
+            health.total_requests += 1
+            health.failure_rate += EWMA_ALPHA * (float(failed) - health.failure_rate)
+            if health.total_requests == 1:
+                health.latency = seconds
+            else:
+                health.latency += EWMA_ALPHA * (seconds - health.latency)
+
+            if failed:
+                increments[1] += 1
+                health.total_failures += 1
+                health.consecutive_failures += 1
+                health.last_failure = now()
+                if health.state == HostHealth.STATE_HALF_OPEN or self._should_open(health):
+                    health.state = HostHealth.STATE_OPEN
+                    health.opened_at = now()
+            else:
+                health.consecutive_failures = 0
+                health.last_success = now()
+                health.state = HostHealth.STATE_CLOSED
+                health.opened_at = None
+
+    @staticmethod
+    def _should_open(health: HostHealth) -> bool:
+        if health.consecutive_failures >= CONSECUTIVE_FAILURE_THRESHOLD:
+            return True
+        return health.total_requests >= MIN_REQUESTS and health.failure_rate >= FAILURE_RATE_THRESHOLD
+
+    def save(self) -> None:
+        with self._lock:
+            changed = [(self._hosts[host], self._increments.pop(host, [0, 0])) for host in self._changed]
+            self._changed = set()
+        if not changed:
+            return
+
+        with transaction.atomic():
+            HostHealth.objects.bulk_create([HostHealth(host=health.host) for health, _ in changed],
+                                           ignore_conflicts=True)
+            for health, (requests, failures) in changed:
+                HostHealth.objects.filter(host=health.host).update(
+                    total_requests=F('total_requests') + requests,
+                    total_failures=F('total_failures') + failures,
+                    **{field: getattr(health, field) for field in HOST_STATE_FIELDS},
+                )
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker() -> HostHealthTracker:
+    """ The process-wide tracker, loaded from the database on first use. """
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = HostHealthTracker()
+        return _tracker
@@ -0,0 +1,146 @@
+"""
+Shared HTTP client for feed fetching and full-article scraping.
+
+Every request goes through one requests.Session per process, so connections to a host are
+kept alive and reused across articles, feeds and builds instead of paying a new TCP/TLS
+handshake per request. The session sends a single User-Agent, applies the same timeouts
+everywhere and retries idempotent requests on connection errors and 429/5xx responses.
+
+get_connection_stats() reports, per host, how many requests were sent over how many
+connections (urllib3's pool counters; a keep-alive connection the server closed and that
+was reopened in place still counts as one).
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from full_feed_filter.settings import HTTP_USER_AGENT
+
+# Seconds (connect, read)
+TIMEOUT = (5, 10)
+
+# Hosts with an open pool, and keep-alive connections kept per host
+POOL_HOSTS = 100
+POOL_CONNECTIONS_PER_HOST = 10
+
+# Longest Retry-After (seconds) honoured before a retry; longer waits are cut to this
+MAX_RETRY_AFTER = 5
+
+
+class CappedRetry(Retry):
+    """ Retry that honours Retry-After only up to MAX_RETRY_AFTER, so a 429/503 cannot stall a build thread. """
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
+
+RETRY = CappedRetry(
+    total=2,
+    connect=2,
+    read=1,
+    status=2,
+    backoff_factor=0.5,
+    status_forcelist=(429, 502, 503, 504),
+    allowed_methods=("GET", "HEAD"),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+# Responses with this charset were probably not labelled; let requests guess instead (as newspaper does)
+FALLBACK_ENCODING = "iso-8859-1"
+
+
+class PooledAdapter(HTTPAdapter):
+    """ HTTPAdapter that keeps the connection counts of pools it evicts, for get_connection_stats(). """
+
+    def __init__(self, **kwargs) -> None:
+        self._closed_pool_stats = {}
+        self._stats_lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+
+        pools = self.poolmanager.pools
+        close_pool = pools.dispose_func
+
+        def dispose_pool(pool) -> None:
+            self._add_pool_stats(self._closed_pool_stats, pool)
+            # urllib3 2 no longer closes the pools it evicts, and sets no dispose_func
+            if close_pool is not None:
+                close_pool(pool)
+
+        pools.dispose_func = dispose_pool
+
+    def _add_pool_stats(self, stats: dict, pool) -> None:
+        with self._stats_lock:
+            host_stats = stats.setdefault(pool.host, {"connections": 0, "requests": 0})
+            host_stats["connections"] += pool.num_connections
+            host_stats["requests"] += pool.num_requests
+
+    def get_connection_stats(self) -> dict:
+        with self._stats_lock:
+            stats = {host: dict(host_stats) for host, host_stats in self._closed_pool_stats.items()}
+
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                self._add_pool_stats(stats, pool)
+
+        for host_stats in stats.values():
+            host_stats["reused"] = max(host_stats["requests"] - host_stats["connections"], 0)
+        return stats
+
+
+def create_session() -> requests.Session:
+    session = requests.Session()
+    session.headers["User-Agent"] = HTTP_USER_AGENT
+
+    adapter = PooledAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_CONNECTIONS_PER_HOST, max_retries=RETRY)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def get(url: str, headers=None, timeout=TIMEOUT, **kwargs) -> requests.Response:
+    return get_session().get(url, headers=headers, timeout=timeout, **kwargs)
+
+
+def post(url: str, data=None, headers=None, timeout=TIMEOUT, **kwargs) -> requests.Response:
+    return get_session().post(url, data=data, headers=headers, timeout=timeout, **kwargs)
+
+
+def get_response_text(response: requests.Response) -> str:
+    if response.encoding and response.encoding.lower() == FALLBACK_ENCODING:
+        response.encoding = response.apparent_encoding
+    return response.text
+
+
+def get_connection_stats() -> dict:
+    """ {host: {"requests": ..., "connections": ..., "reused": ...}} for this process. """
+    stats = {}
+    for adapter in set(get_session().adapters.values()):
+        if isinstance(adapter, PooledAdapter):
+            for host, host_stats in adapter.get_connection_stats().items():
+                total = stats.setdefault(host, {"connections": 0, "requests": 0, "reused": 0})
+                for name, value in host_stats.items():
+                    total[name] += value
+    return stats
@@ -0,0 +1,108 @@
+"""
+Multi-keyword matching for ArticleFilter.
+
+A filter matches when its keyword appears as whole words in the filter source, which
+ArticleFilter has always tested with `f" {keyword} " in f" {source} "`. KeywordMatcher
+builds an Aho-Corasick automaton over the space-padded keywords of every filter that
+shares a source, so each source string is scanned once no matter how many filters a
+feed has.
+"""
+from collections import deque
+
+from general.scripts import utils
+
+
+def normalize_filter_text(text: str) -> str:
+    """ Normalizes keywords and filter sources the same way before they are compared. """
+    return utils.normalize_search_text(text)
+
+
+class KeywordMatcher:
+    def __init__(self, keywords) -> None:
+        self.keywords = set(keywords)
+
+        # Automaton: goto transitions, failure links and keywords ending at each state
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+
+        for keyword in self.keywords:
+            self._add_pattern(pattern=f" {keyword} ", keyword=keyword)
+        self._build_failure_links()
+
+    def _add_pattern(self, pattern: str, keyword: str) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].add(keyword)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> set:
+        """ Returns every keyword found as whole words in text. """
+        found = set()
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        state = 0
+        for char in f" {text} ":
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+class CompiledFilters:
+    """ Normalized keywords and one KeywordMatcher per filter source for a feed's filters. """
+
+    def __init__(self, filters: list) -> None:
+        self.keywords = {}
+        keywords_by_source = {}
+
+        for _filter in filters:
+            keyword = _filter.normalized_keyword or normalize_filter_text(_filter.keyword)
+            self.keywords[_filter.id] = keyword
+            keywords_by_source.setdefault(_filter.source, []).append(keyword)
+
+        self.matchers = {
+            source: KeywordMatcher(keywords=keywords) for source, keywords in keywords_by_source.items()
+        }
+
+    @staticmethod
+    def get_signature(filters: list) -> tuple:
+        return tuple(
+            (_filter.id, _filter.keyword, _filter.condition, _filter.source, _filter.action)
+            for _filter in filters
+        )
+
+    def search(self, source: str, text: str) -> set:
+        return self.matchers[source].search(text)
+
+    def is_true(self, _filter, matched_keywords: set) -> bool:
+        keyword_found = self.keywords[_filter.id] in matched_keywords
+        if _filter.condition == "in":
+            return keyword_found
+        else:
+            return not keyword_found
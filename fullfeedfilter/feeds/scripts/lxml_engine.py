@@ -0,0 +1,423 @@
+"""
+lxml scraping engine, used by Scraper when SCRAPER_ENGINE = "lxml".
+
+Most of the time BeautifulSoup spends on a page goes into html.parser's tokenizer (pure Python)
+and building its tree of Python objects, although SimpleScraper and CraigslistScraper only read
+the few subtrees their scrapers.yaml selectors match. Here libxml2 parses the page in C
+(lxml.etree.HTMLParser), selectors are translated to XPath once (cssselect, see scraper_registry)
+and only the matched subtrees are wrapped in Python objects, walked and serialized.
+
+LxmlDocument and LxmlNode implement the part of the BeautifulSoup API the scrapers use
+(select_one, find_all, find_parents, get, text, str()) and write markup the way BeautifulSoup
+does, so scraped articles are identical whichever engine built them. libxml2 and html.parser
+only build different trees from some markup: tags closed implicitly (<p>, <li>, ...) or out of
+order, carriage returns and control characters, some entity and character references, repeated
+attributes and <![CDATA[ ]]> sections. LxmlDocument raises ValueError for pages containing any
+of those, and Scraper parses them with BeautifulSoup instead.
+`./manage.py benchmark_scrapers` compares both engines.
+"""
+import html.entities
+import re
+
+import lxml.etree
+from bs4.builder import HTMLParserTreeBuilder
+from bs4.dammit import UnicodeDammit
+
+from feeds.scripts import scraper_registry
+
+# BeautifulSoup's rules for html.parser documents (void elements, <pre>, <script> strings, class lists)
+BUILDER = HTMLParserTreeBuilder()
+
+# Elements whose strings BeautifulSoup writes without escaping
+RAW_TEXT_ELEMENTS = {"script", "style"}
+
+# Elements libxml2 closes when some other tag starts (e.g. <p> at a <div>, <li> at the next <li>), where
+# html.parser nests the new tag inside them. A page is only parsed by libxml2 if each of these is closed by
+# an end tag, and html, head and body must be explicit for the same tree.
+IMPLICITLY_CLOSED_TAGS = {
+    "a", "address", "b", "big", "caption", "colgroup", "dd", "dir", "dl", "dt", "font", "form",
+    "h1", "h2", "h3", "h4", "h5", "h6", "i", "legend", "li", "menu", "ol", "option", "p", "pre",
+    "s", "small", "span", "strike", "tbody", "td", "tfoot", "th", "thead", "tr", "tt", "u", "ul",
+    "html", "head", "body",
+}
+
+# Elements whose content libxml2 reads as text, and html.parser as markup. libxml2 still replaces
+# references in the first ones, not in the others.
+ESCAPABLE_TEXT_TAGS = {"textarea", "title"}
+RAW_TEXT_TAGS = {"xmp", "iframe", "noembed", "noframes", "plaintext"}
+TAG_START = re.compile(r"<[a-zA-Z/!?]")
+
+# The patterns below without letters of both cases run on the lowercased page
+
+END_TAG = re.compile(r"</([a-z][^\s/>]*)\s*>")
+DOCUMENT_START_TAG = re.compile(r"<(html|head|body)[\s/>]")
+
+# Control characters (libxml2 drops them) and carriage returns (libxml2 turns them into newlines)
+UNSUPPORTED_CHARACTERS = re.compile(r"[\x00-\x08\x0b\x0d\x0e-\x1f\x7f]")
+
+# <![CDATA[ ]]> and <![if ...]> (html.parser's declarations, libxml2's comments) outside comments and scripts
+MARKED_SECTION = "<!["
+NOT_MARKUP = re.compile(r"<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>", re.DOTALL)
+
+# Comments html.parser reads differently: empty ones, those ended by "--!>", and those starting with "?"
+# (which is what libxml2 makes of <?php ?>)
+EMPTY_COMMENT = re.compile(r"<!---{0,2}>")
+UNSUPPORTED_COMMENT_MARKUP = ["--!>", "<!--?"]
+
+# Doctypes after the start of <html> (libxml2 drops them)
+HTML_START_TAG = re.compile(r"<html[\s/>]")
+DOCTYPE = "<!doctype"
+
+# A tag with an attribute given twice (libxml2 keeps the first value, html.parser the last)
+ATTRIBUTE = r"""\s++[^\s"'>/=]++(?:\s*+=\s*+(?:"[^"]*+"|'[^']*+'|[^\s"'>]++))?+"""
+DUPLICATE_ATTRIBUTE = re.compile(
+    rf"""<[a-z][^\s/>]*+(?:{ATTRIBUTE})*?\s++([^\s"'>/=]++)(?:\s*+=\s*+(?:"[^"]*+"|'[^']*+'|[^\s"'>]++))?+"""
+    rf"""(?:{ATTRIBUTE})*?\s++\1(?=[\s=/>])"""
+)
+
+# References as html.parser finds them in text
+CHARACTER_REFERENCE = re.compile(r"&#(?:([0-9]+)|[xX]([0-9a-fA-F]+))?(;?)")
+ENTITY_REFERENCE = re.compile(r"&([a-zA-Z][-.a-zA-Z0-9]*)(;?)")
+
+# Entities that may be written without the semicolon (e.g. "&copy"). libxml2 also reads them at the start of
+# longer names ("&copyright" is "©right"), where html.parser only knows the full name.
+LEGACY_ENTITIES = {name for name in html.entities.html5 if not name.endswith(";")}
+LEGACY_ENTITY_PREFIX = re.compile("|".join(sorted(LEGACY_ENTITIES, key=len, reverse=True)))
+
+# Encodings in which html.parser's character references below 256 mean the same character as in libxml2
+CHARACTER_REFERENCE_ENCODINGS = {None, "ascii", "utf-8", "windows-1252"}
+
+# Attributes libxml2 gives their own name as value when written without one (<option selected>), where
+# html.parser gives them ""
+BOOLEAN_ATTRIBUTES = [
+    "checked", "compact", "declare", "defer", "disabled", "ismap", "multiple", "nohref", "noresize",
+    "noshade", "nowrap", "readonly", "selected",
+]
+VALUELESS_ATTRIBUTES = {name: re.compile(rf"{name}(?!\s*=)[\s/>]") for name in BOOLEAN_ATTRIBUTES}
+VALUED_ATTRIBUTES = {name: re.compile(rf"{name}\s*=") for name in BOOLEAN_ATTRIBUTES}
+ATTRIBUTE_XPATHS = {name: lxml.etree.XPath(f"//*[@{name}]") for name in BOOLEAN_ATTRIBUTES}
+
+META_CONTENT_CHARSET = re.compile(r"((^|;)\s*charset=)([^;]*)", re.M)
+
+
+MULTI_VALUED_ATTRIBUTES = {}
+
+
+def get_multi_valued_attributes(tag: str) -> set:
+    """ Attributes BeautifulSoup splits into lists (e.g. class), whose whitespace it normalizes. """
+    attributes = MULTI_VALUED_ATTRIBUTES.get(tag)
+    if attributes is None:
+        attributes = BUILDER.cdata_list_attributes["*"] | BUILDER.cdata_list_attributes.get(tag, set())
+        MULTI_VALUED_ATTRIBUTES[tag] = attributes
+    return attributes
+
+
+def is_same_character_reference(match, encoding: (str, None)) -> bool:
+    decimal, hexadecimal, semicolon = match.groups()
+    if decimal is None and hexadecimal is None:
+        # "&#" followed by something else is text to both parsers
+        return True
+    if not semicolon:
+        return False
+    code_point = int(decimal) if decimal is not None else int(hexadecimal, 16)
+    if code_point < 128:
+        return code_point in (9, 10) or 32 <= code_point < 127
+    if code_point < 256:
+        # html.parser looks these up in the page's encoding, then windows-1252
+        if encoding not in CHARACTER_REFERENCE_ENCODINGS:
+            return False
+        try:
+            bytes([code_point]).decode("windows-1252")
+        except UnicodeDecodeError:
+            return False
+        return True
+    return code_point <= 0x10FFFF and not 0xD800 <= code_point <= 0xDFFF
+
+
+def is_same_entity_reference(match, markup: str) -> bool:
+    name, semicolon = match.groups()
+    if semicolon:
+        return name + ";" in html.entities.html5
+    if name in LEGACY_ENTITIES:
+        # In attributes, libxml2 leaves "&copy=" as it is
+        return not markup.startswith("=", match.end())
+    return name + ";" not in html.entities.html5 and not LEGACY_ENTITY_PREFIX.match(name)
+
+
+def check_markup(markup: str, lowered: str, encoding: (str, None)) -> None:
+    """ Raises ValueError if libxml2 would read characters or references in markup unlike html.parser. """
+    if UNSUPPORTED_CHARACTERS.search(markup):
+        raise ValueError("Markup lxml reads differently: control characters")
+    if MARKED_SECTION in lowered and MARKED_SECTION in NOT_MARKUP.sub("", lowered):
+        raise ValueError("Markup lxml reads differently: CDATA")
+    if any(comment in lowered for comment in UNSUPPORTED_COMMENT_MARKUP) or EMPTY_COMMENT.search(lowered):
+        raise ValueError("Markup lxml reads differently: comment")
+    html_start = HTML_START_TAG.search(lowered)
+    if html_start and lowered.find(DOCTYPE, html_start.start()) != -1:
+        raise ValueError("Markup lxml reads differently: doctype inside the document")
+    if DUPLICATE_ATTRIBUTE.search(lowered):
+        raise ValueError("Markup lxml reads differently: repeated attribute")
+    if "&" not in markup:
+        return
+    for match in CHARACTER_REFERENCE.finditer(markup):
+        if not is_same_character_reference(match, encoding):
+            raise ValueError(f"Character reference lxml reads differently: {match.group()}")
+    for match in ENTITY_REFERENCE.finditer(markup):
+        if not is_same_entity_reference(match, markup):
+            raise ValueError(f"Entity reference lxml reads differently: {match.group()}")
+
+
+def close_void_elements(root) -> None:
+    """
+    Moves what libxml2 put inside void elements it does not know (e.g. <source>, <wbr>) after them,
+    where html.parser puts it.
+    """
+    for element in list(root.iter(*BUILDER.empty_element_tags)):
+        if not element.text and not len(element):
+            continue
+        parent = element.getparent()
+        index = parent.index(element)
+        children = list(element)
+        tail = element.tail
+        element.tail, element.text = element.text, None
+        for offset, child in enumerate(children, start=1):
+            parent.insert(index + offset, child)
+        last = children[-1] if children else element
+        last.tail = (last.tail or "") + (tail or "")
+
+
+def restore_valueless_attributes(root, lowered: str) -> None:
+    """ Gives boolean attributes written without a value "" like html.parser, or raises ValueError if unsure. """
+    for name in BOOLEAN_ATTRIBUTES:
+        if name not in lowered or not VALUELESS_ATTRIBUTES[name].search(lowered):
+            continue
+        if VALUED_ATTRIBUTES[name].search(lowered):
+            raise ValueError(f"Markup lxml reads differently: {name} with and without a value")
+        for element in ATTRIBUTE_XPATHS[name](root):
+            element.set(name, "")
+
+
+def check_tree(root, parser: lxml.etree.HTMLParser, lowered: str) -> None:
+    """ Raises ValueError if html.parser would have built a different tree from the page. """
+    for error in parser.error_log:
+        if error.type != lxml.etree.ErrorTypes.HTML_UNKNOWN_TAG:
+            raise ValueError(f"Markup lxml builds differently: {error.message}")
+
+    end_tags = {}
+    for name in END_TAG.findall(lowered):
+        end_tags[name] = end_tags.get(name, 0) + 1
+    elements = {}
+    for element in root.iter(*IMPLICITLY_CLOSED_TAGS):
+        elements[element.tag] = elements.get(element.tag, 0) + 1
+    for name, count in elements.items():
+        if end_tags.get(name, 0) != count:
+            raise ValueError(f"Markup lxml builds differently: <{name}> closed implicitly")
+
+    start_tags = {}
+    for name in DOCUMENT_START_TAG.findall(lowered):
+        start_tags[name] = start_tags.get(name, 0) + 1
+    for name in ["html", "head", "body"]:
+        if start_tags.get(name, 0) != elements.get(name, 0):
+            raise ValueError(f"Markup lxml builds differently: <{name}> added implicitly")
+
+    for element in root.iter(*ESCAPABLE_TEXT_TAGS, *RAW_TEXT_TAGS):
+        text = element.text or ""
+        if TAG_START.search(text) or (element.tag in RAW_TEXT_TAGS and "&" in text):
+            raise ValueError(f"Markup lxml builds differently: markup in <{element.tag}>")
+
+
+def escape_text(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def quote_attribute(value: str) -> str:
+    value = escape_text(value)
+    if '"' in value:
+        if "'" in value:
+            return '"' + value.replace('"', "&quot;") + '"'
+        return "'" + value + "'"
+    return '"' + value + '"'
+
+
+def substitute_meta_charset(attributes: dict, name: str, value: str) -> str:
+    """ BeautifulSoup writes the encoding a <meta> tag declares as utf-8, the encoding of its output. """
+    if name == "charset":
+        return "utf-8"
+    if name == "content" and "charset" not in attributes and attributes.get("http-equiv", "").lower() == "content-type":
+        return META_CONTENT_CHARSET.sub(lambda match: match.group(1) + "utf-8", value)
+    return value
+
+
+def collapse_whitespace(text: str, preserve_whitespace: bool) -> str:
+    """ BeautifulSoup keeps a whitespace-only string outside <pre> and <textarea> as a single newline or space. """
+    if preserve_whitespace or text.strip(" \n\t\x0c\r"):
+        return text
+    return "\n" if "\n" in text else " "
+
+
+def is_preserving_whitespace(element) -> bool:
+    return any(
+        candidate.tag in BUILDER.preserve_whitespace_tags for candidate in [element, *element.iterancestors()]
+    )
+
+
+class LxmlNode:
+    def __init__(self, element, document: 'LxmlDocument') -> None:
+        self._element = element
+        self._document = document
+
+    def _wrap(self, element) -> 'LxmlNode':
+        return LxmlNode(element, self._document)
+
+    def __str__(self) -> str:
+        parts = []
+        self._document.serialize(self._element, is_preserving_whitespace(self._element), parts)
+        return "".join(parts)
+
+    @property
+    def name(self) -> str:
+        return self._element.tag
+
+    @property
+    def text(self) -> str:
+        return self._document.get_text(self._element)
+
+    def get(self, name: str, default=None):
+        value = self._element.get(name)
+        if value is None:
+            return default
+        if name in get_multi_valued_attributes(self._element.tag):
+            return value.split()
+        return value
+
+    def find_all(self, name: str) -> list:
+        return [self._wrap(element) for element in self._element.iterdescendants(name)]
+
+    findAll = find_all
+
+    def find_parents(self, name: str, class_name: str = None) -> list:
+        """ Ancestors named name; with class_name, those having that class (or exactly that class attribute). """
+        return [
+            self._wrap(element) for element in self._element.iterancestors(name)
+            if class_name is None or class_name in element.get("class", "").split()
+            or class_name == " ".join(element.get("class", "").split())
+        ]
+
+    def select_one(self, selector: str) -> ('LxmlNode', None):
+        xpath = scraper_registry.get_xpath(selector)
+        if xpath is None:
+            raise ValueError(f"Selector not supported by the lxml engine: {selector}")
+        for match in xpath(self._element):
+            return self._wrap(match)
+        return None
+
+
+class LxmlDocument(LxmlNode):
+    def __init__(self, content: (bytes, str)) -> None:
+        # Decoded exactly as BeautifulSoup decodes it
+        encoding = None
+        if isinstance(content, bytes):
+            dammit = UnicodeDammit(content, is_html=True)
+            content, encoding = dammit.unicode_markup, dammit.original_encoding
+            if content is None:
+                raise ValueError("Could not decode the page")
+        lowered = content.lower()
+        check_markup(content, lowered, encoding)
+
+        # Given as utf-8, so that libxml2 ignores the encoding the page declares
+        parser = lxml.etree.HTMLParser(encoding="utf-8", collect_ids=False, default_doctype=False)
+        root = lxml.etree.fromstring(content.encode("utf-8"), parser) if content.strip() else None
+        if root is None:
+            raise ValueError("Empty page")
+        close_void_elements(root)
+        restore_valueless_attributes(root, lowered)
+        check_tree(root, parser, lowered)
+        super().__init__(root, self)
+
+    # Like a BeautifulSoup object, the document contains <html> rather than being it
+
+    @property
+    def name(self) -> str:
+        return "[document]"
+
+    def find_all(self, name: str) -> list:
+        return [self._wrap(element) for element in self._element.iter(name)]
+
+    findAll = find_all
+
+    def select_one(self, selector: str) -> (LxmlNode, None):
+        xpath = scraper_registry.get_xpath(selector, document=True)
+        if xpath is None:
+            raise ValueError(f"Selector not supported by the lxml engine: {selector}")
+        for match in xpath(self._element):
+            return self._wrap(match)
+        return None
+
+    def serialize(self, element, preserve_whitespace: bool, parts: list) -> None:
+        """ Appends element as BeautifulSoup would write it. Does not include the element's tail. """
+        tag = element.tag
+        if tag is lxml.etree.Comment:
+            # libxml2 keeps <?php ... ?> as a comment, html.parser as a processing instruction
+            text = element.text or ""
+            parts.append(f"<?{text[1:]}>" if text.startswith("?") else f"<!--{text}-->")
+            return
+
+        attributes = element.attrib
+        parts.append(f"<{tag}")
+        if attributes:
+            multi_valued = get_multi_valued_attributes(tag)
+            for name, value in sorted(attributes.items()):
+                if name in multi_valued:
+                    value = " ".join(value.split())
+                elif tag == "meta":
+                    value = substitute_meta_charset(attributes, name, value)
+                parts.append(f" {name}={quote_attribute(value)}")
+
+        if tag in BUILDER.empty_element_tags:
+            parts.append("/>")
+            return
+        parts.append(">")
+
+        preserve_whitespace = preserve_whitespace or tag in BUILDER.preserve_whitespace_tags
+        raw = tag in RAW_TEXT_ELEMENTS
+        if element.text:
+            text = collapse_whitespace(element.text, preserve_whitespace)
+            parts.append(text if raw else escape_text(text))
+        for child in element:
+            self.serialize(child, preserve_whitespace, parts)
+            if child.tail:
+                text = collapse_whitespace(child.tail, preserve_whitespace)
+                parts.append(text if raw else escape_text(text))
+        parts.append(f"</{tag}>")
+
+    @staticmethod
+    def get_string_container(element) -> (str, None):
+        """ The tag (e.g. <script>, <template>) whose kind of string the element's own strings are, if any. """
+        for candidate in [element, *element.iterancestors()]:
+            if candidate.tag in BUILDER.string_containers:
+                return candidate.tag
+        return None
+
+    def get_text(self, element) -> str:
+        """
+        The element's strings like BeautifulSoup's .text: text outside <script>, <style>, <template>,
+        <rt> and <rp>, or for one of those, the text of its own kind.
+        """
+        wanted = element.tag if element.tag in BUILDER.string_containers else None
+        parts = []
+        self._append_text(
+            element, self.get_string_container(element), wanted, is_preserving_whitespace(element), parts
+        )
+        return "".join(parts)
+
+    def _append_text(self, element, container: (str, None), wanted: (str, None), preserve_whitespace: bool,
+                     parts: list) -> None:
+        preserve_whitespace = preserve_whitespace or element.tag in BUILDER.preserve_whitespace_tags
+        if element.text and container == wanted:
+            parts.append(collapse_whitespace(element.text, preserve_whitespace))
+        for child in element:
+            if child.tag is not lxml.etree.Comment:
+                child_container = child.tag if child.tag in BUILDER.string_containers else container
+                self._append_text(child, child_container, wanted, preserve_whitespace, parts)
+            if child.tail and container == wanted:
+                parts.append(collapse_whitespace(child.tail, preserve_whitespace))
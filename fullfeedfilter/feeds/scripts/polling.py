@@ -0,0 +1,80 @@
+"""
+Adaptive polling intervals used by `./manage.py scheduler`.
+
+A feed is polled at about half of its observed publish interval (the median gap between
+entry timestamps). Every poll that finds nothing new (304, identical content or unchanged
+entries) stretches the interval, and a poll with new entries resets it. Intervals are
+bounded by MIN/MAX_POLL_INTERVAL, and the next poll time is jittered so feeds do not all
+come due on the same tick.
+
+A feed whose builds fail (404, DNS errors, unparsable documents...) backs off separately:
+1h, 2h, 4h, ... up to MAX_FAILURE_INTERVAL, until a successful build restores its normal
+interval.
+"""
+import calendar
+import random
+import statistics
+from datetime import datetime, timedelta
+
+from django.utils.timezone import now
+
+# Seconds
+MIN_POLL_INTERVAL = 15 * 60
+MAX_POLL_INTERVAL = 24 * 60 * 60
+DEFAULT_POLL_INTERVAL = 60 * 60
+
+# Fraction of the publish interval to poll at
+PUBLISH_INTERVAL_FACTOR = 0.5
+
+# Growth per consecutive unchanged poll, capped at UNCHANGED_BACKOFF_LIMIT polls
+UNCHANGED_BACKOFF = 1.5
+UNCHANGED_BACKOFF_LIMIT = 8
+
+# +/- fraction of the interval added to each next poll time
+JITTER = 0.1
+
+# Seconds
+BASE_FAILURE_INTERVAL = 60 * 60
+MAX_FAILURE_INTERVAL = 7 * 24 * 60 * 60
+
+
+def clamp_interval(seconds: float) -> int:
+    return int(min(max(seconds, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL))
+
+
+def get_entry_timestamps(entries: list) -> list:
+    timestamps = []
+    for entry in entries:
+        parsed = entry.get("published_parsed") or entry.get("updated_parsed")
+        if parsed:
+            timestamps.append(calendar.timegm(parsed))
+    return sorted(timestamps)
+
+
+def get_publish_interval(entries: list) -> (int, None):
+    """ Median seconds between consecutive entries, or None if the feed has too few dated entries. """
+    timestamps = get_entry_timestamps(entries)
+    gaps = [later - earlier for earlier, later in zip(timestamps, timestamps[1:]) if later > earlier]
+    if not gaps:
+        return None
+    return int(statistics.median(gaps))
+
+
+def get_poll_interval(publish_interval: (int, None), unchanged_polls: int) -> int:
+    if publish_interval:
+        interval = publish_interval * PUBLISH_INTERVAL_FACTOR
+    else:
+        interval = DEFAULT_POLL_INTERVAL
+
+    interval *= UNCHANGED_BACKOFF ** min(unchanged_polls, UNCHANGED_BACKOFF_LIMIT)
+    return clamp_interval(interval)
+
+
+def get_failure_interval(consecutive_failures: int) -> int:
+    return int(min(BASE_FAILURE_INTERVAL * 2 ** max(consecutive_failures - 1, 0), MAX_FAILURE_INTERVAL))
+
+
+def get_next_poll(interval: int, from_time: datetime = None) -> datetime:
+    from_time = now() if from_time is None else from_time
+    jitter = random.uniform(-JITTER, JITTER) * interval
+    return from_time + timedelta(seconds=interval + jitter)
@@ -0,0 +1,241 @@
+"""
+On-disk cache of article page responses, shared by every scraper and every process.
+
+Entries are keyed by the page's canonical url. An entry is a small JSON file with the
+response's status, url, headers and the sha256 of its body; bodies are stored gzipped under
+that digest, so a page reached through several urls (or feeds) is stored once.
+
+A fresh entry (younger than RESPONSE_CACHE_TTL) is served without touching the network, so
+re-scraping a feed after its scraper changed, or `./manage.py build -r`, reuses the pages
+already downloaded. A stale entry is revalidated with If-None-Match/If-Modified-Since; a 304
+refreshes it. Only 200 responses are cached.
+
+Reading an entry bumps its mtime, and prune() (run after each `./manage.py build`) evicts the
+least recently used entries until the bodies fit in RESPONSE_CACHE_MAX_BYTES.
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+import urllib.parse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from feeds.scripts import http_client
+from full_feed_filter.settings import RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL
+from general.scripts import artifacts
+
+ENTRIES_DIR = os.path.join(RESPONSE_CACHE_DIR, "entries")
+BODIES_DIR = os.path.join(RESPONSE_CACHE_DIR, "bodies")
+
+# Response headers kept with an entry
+CACHED_HEADERS = ["content-type", "etag", "last-modified"]
+
+# Query parameters that do not change the page
+TRACKING_PARAMETERS = {"fbclid", "gclid", "mc_cid", "mc_eid"}
+TRACKING_PREFIXES = ("utm_",)
+
+
+def canonicalize_url(url: str) -> str:
+    """ Lowercase scheme and host, no default port, fragment or tracking parameters. """
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, parts.port) in (("http", 80), ("https", 443)):
+        netloc = netloc.rsplit(":", 1)[0]
+
+    query = [
+        (name, value) for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in TRACKING_PARAMETERS and not name.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urllib.parse.urlunsplit((scheme, netloc, parts.path or "/", urllib.parse.urlencode(query), ""))
+
+
+def _get_shard_path(directory: str, digest: str, extension: str) -> str:
+    return os.path.join(directory, digest[:2], f"{digest}{extension}")
+
+
+def get_entry_path(url: str) -> str:
+    key = hashlib.sha256(canonicalize_url(url).encode("utf-8")).hexdigest()
+    return _get_shard_path(ENTRIES_DIR, key, ".json")
+
+
+def get_body_path(digest: str) -> str:
+    return _get_shard_path(BODIES_DIR, digest, ".gz")
+
+
+def _write_file(path: str, content: bytes) -> None:
+    """ Atomically replaces path, so readers in other processes never see a partial file. """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with artifacts.temp_file(path=path) as (fp, temp_path):
+        fp.write(content)
+    os.replace(temp_path, path)
+
+
+def load_entry(url: str) -> (dict, None):
+    path = get_entry_path(url)
+    try:
+        with open(path, "r") as fp:
+            entry = json.load(fp)
+        with gzip.open(get_body_path(entry["digest"]), "rb") as fp:
+            entry["content"] = fp.read()
+    except (OSError, ValueError, KeyError):
+        return None
+
+    # Reading an entry makes it recently used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return entry
+
+
+def store_entry(url: str, response: requests.Response) -> dict:
+    content = response.content
+    digest = hashlib.sha256(content).hexdigest()
+
+    body_path = get_body_path(digest)
+    if not os.path.exists(body_path):
+        _write_file(body_path, gzip.compress(content, compresslevel=6))
+
+    entry = {
+        "url": response.url,
+        "status": response.status_code,
+        "headers": {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers},
+        "digest": digest,
+        "size": len(content),
+        "fetched_at": time.time(),
+    }
+    _write_file(get_entry_path(url), json.dumps(entry).encode("utf-8"))
+
+    entry["content"] = content
+    return entry
+
+
+def refresh_entry(url: str, entry: dict) -> None:
+    """ Marks an entry fresh again after the origin answered 304. """
+    entry = {name: value for name, value in entry.items() if name != "content"}
+    entry["fetched_at"] = time.time()
+    _write_file(get_entry_path(url), json.dumps(entry).encode("utf-8"))
+
+
+def is_fresh(entry: dict) -> bool:
+    return time.time() - entry["fetched_at"] < RESPONSE_CACHE_TTL
+
+
+def build_response(entry: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response.url = entry["url"]
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = entry["content"]
+    return response
+
+
+def get_revalidation_headers(entry: dict) -> dict:
+    headers = {}
+    if entry["headers"].get("etag"):
+        headers["If-None-Match"] = entry["headers"]["etag"]
+    if entry["headers"].get("last-modified"):
+        headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+    return headers
+
+
+def get_fresh(url: str) -> (requests.Response, None):
+    """ The cached response if it is fresh, without touching the network. """
+    entry = load_entry(url)
+    if entry is not None and is_fresh(entry):
+        return build_response(entry)
+    return None
+
+
+def get(url: str, timeout=http_client.TIMEOUT, refresh: bool = False) -> requests.Response:
+    """
+    GETs the url through the cache. Non-200 responses are returned but not cached. With refresh,
+    the cached entry is neither served nor revalidated (e.g. when retrying a failed scrape of it).
+    """
+    entry = None if refresh else load_entry(url)
+    if entry is not None and is_fresh(entry):
+        return build_response(entry)
+
+    headers = get_revalidation_headers(entry) if entry is not None else None
+    response = http_client.get(url, headers=headers, timeout=timeout)
+
+    if response.status_code == 304 and entry is not None:
+        refresh_entry(url, entry)
+        return build_response(entry)
+    if response.status_code == 200:
+        store_entry(url, response)
+    return response
+
+
+def get_html(url: str, timeout=http_client.TIMEOUT, refresh: bool = False) -> str:
+    """ The page's html as text, through the cache. Raises requests.HTTPError for non-2xx responses. """
+    response = get(url, timeout=timeout, refresh=refresh)
+    response.raise_for_status()
+    return http_client.get_response_text(response)
+
+
+def _list_files(directory: str, extension: str) -> list:
+    """ (path, stat) of the directory's files with the extension; skips temp files being written. """
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.startswith(".") or not name.endswith(extension):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, stat))
+    return files
+
+
+def prune(max_bytes: int = RESPONSE_CACHE_MAX_BYTES) -> int:
+    """
+    Evicts the least recently used entries until the bodies they reference fit in max_bytes,
+    then removes bodies no entry references. Returns the number of entries evicted.
+    """
+    entries = []
+    for path, stat in _list_files(ENTRIES_DIR, ".json"):
+        try:
+            with open(path, "r") as fp:
+                digest = json.load(fp)["digest"]
+        except (OSError, ValueError, KeyError):
+            digest = None
+        entries.append((stat.st_mtime, path, digest))
+    entries.sort()
+
+    bodies = {os.path.basename(path)[:-len(".gz")]: stat.st_size for path, stat in _list_files(BODIES_DIR, ".gz")}
+    references = {}
+    for _, _, digest in entries:
+        references[digest] = references.get(digest, 0) + 1
+    total_bytes = sum(size for digest, size in bodies.items() if digest in references)
+
+    evicted = 0
+    for _, path, digest in entries:
+        if total_bytes <= max_bytes:
+            break
+
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        evicted += 1
+
+        references[digest] = references.get(digest, 1) - 1
+        if references[digest] <= 0:
+            total_bytes -= bodies.get(digest, 0)
+
+    for digest, size in bodies.items():
+        if references.get(digest, 0) <= 0:
+            try:
+                os.remove(get_body_path(digest))
+            except OSError:
+                pass
+    return evicted
@@ -0,0 +1,86 @@
+"""
+Streaming RSS 2.0 writer.
+
+Items are written one at a time to a temporary file in the destination folder, which is then
+published with general.scripts.artifacts, so readers only ever see a complete feed.
+"""
+import io
+import re
+from html import unescape
+from xml.sax.saxutils import escape, quoteattr
+
+from general.scripts import artifacts
+
+# Characters that are not allowed anywhere in an XML 1.0 document
+INVALID_XML_CHARS = re.compile('[^\u0009\u000A\u000D\u0020-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFF]')
+
+
+def clean_xml_text(text) -> str:
+    if text is None:
+        return ""
+    return INVALID_XML_CHARS.sub("", str(text))
+
+
+def escape_text(text) -> str:
+    """ Escapes text for an XML element, decoding any HTML entities it already contains first. """
+    return escape(unescape(clean_xml_text(text)))
+
+
+def cdata(text) -> str:
+    """ Wraps text in CDATA, splitting any ']]>' so it cannot end the section early. """
+    return "<![CDATA[" + clean_xml_text(text).replace("]]>", "]]]]><![CDATA[>") + "]]>"
+
+
+class RssWriter:
+    def __init__(self, path: (str, None), xml_link: str, title: str, link: str, description: str) -> None:
+        self.path = path
+        self.xml_link = xml_link
+        self.title = title
+        self.link = link
+        self.description = description
+
+    def write(self, articles) -> bool:
+        """ Returns False when the feed is unchanged and the published file was left alone. """
+        with artifacts.temp_file(path=self.path, mode="w", encoding="utf-8") as (fp, temp_path):
+            self._write_header(fp)
+            for article in articles:
+                self._write_item(fp, article)
+            self._write_footer(fp)
+
+        return artifacts.publish_artifact(temp_path=temp_path, path=self.path)
+
+    def render(self, articles) -> str:
+        """ Returns the feed as a string instead of publishing it. """
+        fp = io.StringIO()
+        self._write_header(fp)
+        for article in articles:
+            self._write_item(fp, article)
+        self._write_footer(fp)
+        return fp.getvalue()
+
+    def _write_header(self, fp) -> None:
+        fp.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        fp.write('<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom" '
+                 'xmlns:content="http://purl.org/rss/1.0/modules/content/">\n')
+        fp.write('    <channel>\n')
+        fp.write(f'        <atom:link href={quoteattr(clean_xml_text(self.xml_link))} rel="self" '
+                 f'type="application/rss+xml" />\n')
+        fp.write(f'        <title>{escape_text(self.title)}</title>\n')
+        fp.write(f'        <link>{cdata(self.link)}</link>\n')
+        fp.write(f'        <description>{escape_text(self.description)}</description>\n')
+        fp.write('        <language>en</language>\n\n')
+
+    @staticmethod
+    def _write_item(fp, article) -> None:
+        fp.write('            <item>\n')
+        fp.write(f'            <title>{escape_text(article.title)}</title>\n')
+        fp.write(f'            <guid>{cdata(article.link)}</guid>\n')
+        fp.write(f'            <link>{cdata(article.link)}</link>\n')
+        fp.write(f'            <pubDate>{escape(clean_xml_text(article.pub_date))}</pubDate>\n')
+        fp.write(f'            <description>{cdata(article.description)}</description>\n')
+        fp.write('            </item>\n')
+
+    @staticmethod
+    def _write_footer(fp) -> None:
+        fp.write('\n    </channel>\n')
+        fp.write('</rss>\n')
@@ -0,0 +1,97 @@
+"""
+Classification of full-article scrape errors, and the retry schedule that follows from it.
+
+Forbidden (403) and Not Found (404) are permanent: the article is not scraped again unless
+its full article is explicitly rebuilt. Anything else is retried with exponential backoff
+and jitter.
+"""
+import random
+from datetime import datetime, timedelta
+
+import requests
+from django.utils.timezone import now
+
+from feeds.scripts.http_client import TIMEOUT
+
+ERROR_FORBIDDEN = "forbidden"
+ERROR_NOT_FOUND = "not_found"
+ERROR_TIMEOUT = "timeout"
+ERROR_CONNECTION = "connection"
+ERROR_SERVER = "server_error"
+ERROR_OTHER = "error"
+
+PERMANENT_ERRORS = {ERROR_FORBIDDEN, ERROR_NOT_FOUND}
+
+# Errors that say something about the host rather than the article (see host_health)
+HOST_ERRORS = {ERROR_TIMEOUT, ERROR_CONNECTION, ERROR_SERVER}
+
+# (error, substrings found in the exception text, short message shown by `./manage.py build`)
+ERROR_PATTERNS = [
+    (ERROR_FORBIDDEN, ["403 Client Error: Forbidden", "Status code: 403"],
+     "Article `download()` failed with 403 Client Error: Forbidden"),
+    (ERROR_NOT_FOUND, ["404 Client Error: Not Found", "Status code: 404"],
+     "Article `download()` failed with 404 Client Error: Not Found"),
+    (ERROR_TIMEOUT, ["(connect timeout=", "Read timed out", "Connection timed out"],
+     f"Connection timed out. (connect timeout={TIMEOUT[0]}, read timeout={TIMEOUT[1]})"),
+    (ERROR_CONNECTION, ["Max retries exceeded", "Failed to establish a new connection", "Connection refused",
+                        "Connection aborted"],
+     None),
+    (ERROR_SERVER, ["Server Error", "Status code: 5"],
+     None),
+]
+
+STATUS_CODE_ERRORS = {
+    403: ERROR_FORBIDDEN,
+    404: ERROR_NOT_FOUND,
+}
+
+# Seconds
+BASE_RETRY_DELAY = 60 * 60
+MAX_RETRY_DELAY = 7 * 24 * 60 * 60
+RETRY_JITTER = 0.25
+
+
+def classify_error_text(error_text: str) -> str:
+    for error, patterns, _ in ERROR_PATTERNS:
+        if any(pattern in error_text for pattern in patterns):
+            return error
+    return ERROR_OTHER
+
+
+def classify_exception(exception: Exception) -> str:
+    if isinstance(exception, requests.exceptions.Timeout):
+        return ERROR_TIMEOUT
+    if isinstance(exception, requests.exceptions.ConnectionError):
+        return ERROR_CONNECTION
+
+    response = getattr(exception, "response", None)
+    status_code = getattr(response, "status_code", None)
+    if status_code in STATUS_CODE_ERRORS:
+        return STATUS_CODE_ERRORS[status_code]
+    if status_code is not None and status_code >= 500:
+        return ERROR_SERVER
+
+    return classify_error_text(str(exception))
+
+
+def get_error_message(error: str) -> (str, None):
+    for pattern_error, _, message in ERROR_PATTERNS:
+        if pattern_error == error:
+            return message
+    return None
+
+
+def is_permanent_error(error: str) -> bool:
+    return error in PERMANENT_ERRORS
+
+
+def is_host_error(error: str) -> bool:
+    return error in HOST_ERRORS
+
+
+def get_next_retry_at(retries: int, from_time: datetime = None) -> datetime:
+    """ 1h, 2h, 4h, ... capped at a week, each +/-25%. """
+    from_time = now() if from_time is None else from_time
+    delay = min(BASE_RETRY_DELAY * 2 ** max(retries - 1, 0), MAX_RETRY_DELAY)
+    delay *= 1 + random.uniform(-RETRY_JITTER, RETRY_JITTER)
+    return from_time + timedelta(seconds=delay)
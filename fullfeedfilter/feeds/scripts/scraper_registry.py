@@ -0,0 +1,157 @@
+"""
+In-memory registry of the site configs in scrapers.yaml.
+
+The file is parsed once and indexed by the reversed labels of each entry's hostname
+("kenoshanews.com" -> ("com", "kenoshanews")), so finding the config for an article url
+walks the url's hostname labels instead of scanning every entry. An entry matches its
+hostname and any subdomain; if several match, the one later in the file wins, as before.
+Entries whose url also has a path ("example.com/news") additionally require that path.
+
+Every CSS selector in the file is compiled with soupsieve when the file is loaded, and
+translated to XPath for the lxml engine (feeds/scripts/lxml_engine.py) when first used. The
+file is reloaded when its mtime changes (checked at most once per RELOAD_CHECK_INTERVAL).
+"""
+import os
+import threading
+import time
+import urllib.parse
+
+import lxml.etree
+import soupsieve
+import yaml
+from bs4 import BeautifulSoup
+from cssselect import HTMLTranslator, SelectorError
+
+from full_feed_filter.settings import BASE_DIR
+
+SCRAPERS_YAML = os.path.join(BASE_DIR, "feeds/scripts/scrapers.yaml")
+
+# Config keys holding CSS selectors
+SELECTOR_KEYS = ["article", "images", "tags", "additional_details", "map"]
+
+# Seconds
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+def get_host_key(host: str) -> tuple:
+    return tuple(reversed(host.lower().strip(".").split(".")))
+
+
+class ScraperRegistry:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime_ns = None
+        self._checked_at = 0.0
+
+        self._entries = []
+        self._index = {}
+        self._selectors = {}
+        self._xpaths = {}
+
+    def _reload_if_changed(self) -> None:
+        with self._lock:
+            if time.monotonic() - self._checked_at < RELOAD_CHECK_INTERVAL and self._mtime_ns is not None:
+                return
+            self._checked_at = time.monotonic()
+
+            mtime_ns = os.stat(self.path).st_mtime_ns
+            if mtime_ns != self._mtime_ns:
+                self._load()
+                self._mtime_ns = mtime_ns
+
+    def _load(self) -> None:
+        with open(self.path) as fp:
+            yml = yaml.load(fp, Loader=yaml.BaseLoader)
+
+        entries = [item for site, config in yml.items() for item in config]
+        index = {}
+        selectors = {}
+        for order, item in enumerate(entries):
+            host, _, path = item["url"].partition("/")
+            path = f"/{path}" if path else ""
+            index.setdefault(get_host_key(host), []).append((order, path, item))
+
+            for key in SELECTOR_KEYS:
+                selector = item.get(key)
+                if selector and selector not in selectors:
+                    selectors[selector] = self._compile(selector)
+
+        self._entries, self._index, self._selectors = entries, index, selectors
+
+    @staticmethod
+    def _compile(selector: str) -> (soupsieve.SoupSieve, None):
+        try:
+            return soupsieve.compile(selector)
+        except soupsieve.SelectorSyntaxError:
+            return None
+
+    def get_config(self, url: str) -> (dict, None):
+        self._reload_if_changed()
+        index = self._index
+
+        matches = []
+        host_key = get_host_key(urllib.parse.urlsplit(url).hostname or "")
+        for length in range(1, len(host_key) + 1):
+            for order, path, item in index.get(host_key[:length], []):
+                if not path or path in url:
+                    matches.append((order, item))
+        if matches:
+            return max(matches, key=lambda match: match[0])[1]
+
+        # Entries that only match outside the hostname (e.g. a proxied url) keep the old substring rule
+        result = None
+        for item in self._entries:
+            if item["url"] in url:
+                result = item
+        return result
+
+    def get_selector(self, selector: str) -> (soupsieve.SoupSieve, None):
+        compiled = self._selectors.get(selector)
+        if compiled is None:
+            compiled = self._compile(selector)
+            if compiled is not None:
+                self._selectors[selector] = compiled
+        return compiled
+
+    def get_xpath(self, selector: str, document: bool = False) -> (lxml.etree.XPath, None):
+        """
+        The selector as XPath over an element's descendants (or with document, over the whole
+        document the element is in, root included), or None if cssselect cannot translate it.
+        """
+        key = (selector, document)
+        if key not in self._xpaths:
+            prefix = "/descendant::" if document else "descendant::"
+            try:
+                compiled = lxml.etree.XPath(HTMLTranslator().css_to_xpath(selector, prefix=prefix))
+            except SelectorError:
+                compiled = None
+            self._xpaths[key] = compiled
+        return self._xpaths[key]
+
+
+registry = ScraperRegistry(path=SCRAPERS_YAML)
+
+
+def get_url_config(url: str) -> (dict, None):
+    return registry.get_config(url)
+
+
+def get_xpath(selector: str, document: bool = False) -> (lxml.etree.XPath, None):
+    return registry.get_xpath(selector, document=document)
+
+
+def has_xpaths(config: dict) -> bool:
+    """ Whether every selector of the config can be used by the lxml engine. """
+    return all(registry.get_xpath(config[key]) is not None for key in SELECTOR_KEYS if config.get(key))
+
+
+def select_one(soup: BeautifulSoup, selector: str):
+    """ soup.select_one(selector) with the selector compiled once. """
+    if not isinstance(soup, BeautifulSoup):
+        # An lxml_engine.LxmlDocument
+        return soup.select_one(selector)
+    compiled = registry.get_selector(selector)
+    if compiled is None:
+        return soup.select_one(selector)
+    return compiled.select_one(soup)
@@ -1,18 +1,18 @@
-import os
 from html import unescape
 
-import requests
-import yaml
 from bs4 import BeautifulSoup
-from full_feed_filter.settings import BASE_DIR
+from feeds.scripts import response_cache, scraper_registry
+from feeds.scripts.lxml_engine import LxmlDocument
+from full_feed_filter.settings import SCRAPER_ENGINE
 from newspaper import Article
 
 
 class Scraper:
-    def __init__(self, url: str) -> None:
+    def __init__(self, url: str, content: bytes = None, engine: str = None) -> None:
         self.url = url
+        self.engine = engine or SCRAPER_ENGINE
         self.config = self.get_url_config()
-        self.soup = self.get_soup()
+        self.soup = self.get_soup(content=content)
 
         self.additional_images = None
         self.top_image = None
@@ -22,23 +22,29 @@ class Scraper:
         self.title = None
 
     def get_url_config(self) -> dict:
-        yml = yaml.load(
-            open(os.path.join(BASE_DIR, "feeds/scripts/scrapers.yaml")), Loader=yaml.BaseLoader
-        )
-        result = None
-        for site, config in yml.items():
-            for item in config:
-                if item["url"] in self.url:
-                    result = item
+        result = scraper_registry.get_url_config(self.url)
         if result:
             return result
         else:
             raise AttributeError("URL not found in scrapers.yaml")
 
-    def get_soup(self) -> BeautifulSoup:
-        resp = requests.get(self.url, timeout=5)
+    def get_soup(self, content: bytes = None) -> (BeautifulSoup, LxmlDocument):
+        """ Parses content (the page, already downloaded) or downloads the page. """
+        if content is None:
+            content = self.download(self.url)
+        if self.engine == "lxml" and scraper_registry.has_xpaths(self.config):
+            try:
+                return LxmlDocument(content)
+            except ValueError:
+                # Markup libxml2 reads differently from html.parser (e.g. unclosed <p> tags)
+                pass
+        return BeautifulSoup(content, "html.parser")
+
+    @staticmethod
+    def download(url: str, refresh: bool = False) -> bytes:
+        resp = response_cache.get(url, refresh=refresh)
         if resp.status_code == 200:
-            return BeautifulSoup(resp.content, "html.parser")
+            return resp.content
         else:
             raise Exception(f"Status code: {resp.status_code}")
 
@@ -46,7 +52,7 @@ class Scraper:
         if selector is None:
             return None
 
-        raw_html = self.soup.select_one(selector)
+        raw_html = scraper_registry.select_one(self.soup, selector)
 
         if raw_html is None:
             return None
@@ -62,7 +68,7 @@ class Scraper:
     def get_article_p_html(
         self, article_selector: str, article_stop_div_classname=None, remove=None
     ) -> (None, str):
-        raw_html = self.soup.select_one(article_selector)
+        raw_html = scraper_registry.select_one(self.soup, article_selector)
 
         if raw_html is None:
             return None
@@ -84,7 +90,7 @@ class Scraper:
         return html_string
 
     def get_tags(self, tags_selector: str) -> (list, None):
-        raw_html = self.soup.select_one(tags_selector)
+        raw_html = scraper_registry.select_one(self.soup, tags_selector)
 
         if raw_html is None:
             return None
@@ -110,7 +116,7 @@ class Scraper:
             return None
 
     def get_all_images(self, images_selector: str) -> (list, None):
-        raw_html = self.soup.select_one(images_selector)
+        raw_html = scraper_registry.select_one(self.soup, images_selector)
 
         if raw_html is None:
             return None
@@ -170,7 +176,7 @@ class CraigslistScraper(SimpleScraper):
             return None
 
     def get_all_images(self, images_selector: str) -> (list, None):
-        raw_html = self.soup.select_one(images_selector)
+        raw_html = scraper_registry.select_one(self.soup, images_selector)
 
         if raw_html is None:
             return None
@@ -238,22 +244,15 @@ class RedditScraper:
         self.article_html = self.build_article_html()
         pass
 
-    def get_url_config(self) -> str:
-        yml = yaml.load(
-            open(os.path.join(BASE_DIR, "feeds/scripts/scrapers.yaml")), Loader=yaml.BaseLoader
-        )
-        result = None
-        for site, config in yml.items():
-            for item in config:
-                if item["url"] in self.url:
-                    result = item
+    def get_url_config(self) -> dict:
+        result = scraper_registry.get_url_config(self.url)
         if result:
             return result
         else:
             raise AttributeError("URL not found in simple_scraper.yaml")
 
-    def get_json_dump(self) -> requests:
-        r = requests.get(f"{self.url}.json", headers={"user-agent": "Mozilla/5.0"})
+    def get_json_dump(self) -> dict:
+        r = response_cache.get(f"{self.url}.json")
         return r.json()[0]["data"]["children"][0]["data"]
 
     def build_title(self) -> str:
@@ -358,7 +357,7 @@ class RedditScraper:
 
             # Download & Parse via Newspaper
             article = Article(url=self._url, keep_article_html=True)
-            article.download()
+            article.download(input_html=response_cache.get_html(self._url))
             article.parse()
             article.nlp()
 
@@ -387,7 +386,7 @@ class RedditScraper:
         article_html += f"<h3>Tweet</h3>"
         article_html += f"<p>URL: <a href='{self._url}'>{self._url}</a></p>"
 
-        resp = requests.get(self._url, timeout=5)
+        resp = response_cache.get(self._url)
         soup = BeautifulSoup(resp.content, "html.parser")
 
         raw_html = soup.select_one("div.js-tweet-text-container")
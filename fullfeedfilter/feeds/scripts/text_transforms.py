@@ -0,0 +1,87 @@
+"""
+Per-feed text transforms applied to every article of a feed.
+
+`Feeds.stop_html` cuts the description at the first occurrence of the stop text, and
+`Feeds.remove_text` is a comma separated list of case-insensitive patterns removed, in order,
+from the title and description. The patterns are compiled once per feed, together with a single
+alternation of all of them, so a string with nothing to remove is scanned once instead of once
+per pattern.
+"""
+import re
+import threading
+
+from feeds.models import Feeds
+
+# Compiled transforms are reused across builds in the same process until the feed's settings change
+_text_transforms_cache = {}
+_text_transforms_lock = threading.Lock()
+
+
+def get_text_transforms(feed: Feeds) -> "TextTransforms":
+    key = (feed.remove_text, feed.stop_html)
+
+    with _text_transforms_lock:
+        cached = _text_transforms_cache.get(feed.pk)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+    text_transforms = TextTransforms(remove_text=feed.remove_text, stop_html=feed.stop_html)
+    with _text_transforms_lock:
+        _text_transforms_cache[feed.pk] = (key, text_transforms)
+    return text_transforms
+
+
+class TextTransforms:
+    def __init__(self, remove_text: str, stop_html: str) -> None:
+        self.stop_html = stop_html
+
+        # Empty pieces ("a,,b" or a trailing comma) never removed anything
+        self.remove_patterns = [text for text in (remove_text or "").split(",") if text]
+        self.compiled_patterns = self._compile_remove_patterns()
+        self.remove_pattern = self._compile_remove_pattern()
+
+    def _compile_remove_patterns(self) -> (list, None):
+        """ Returns the compiled remove_text patterns, or None if one is invalid and should fail the article. """
+        try:
+            return [re.compile(text, re.IGNORECASE) for text in self.remove_patterns]
+        except re.error:
+            return None
+
+    def _compile_remove_pattern(self):
+        """
+        Returns one compiled alternation of the remove_text patterns, which finds whether there is
+        anything to remove, or None when the patterns cannot be combined (capture groups whose
+        numbering would shift, global flags, or invalid patterns).
+        """
+        if not self.compiled_patterns:
+            return None
+
+        if any(pattern.groups for pattern in self.compiled_patterns):
+            return None
+        try:
+            return re.compile("|".join(f"(?:{text})" for text in self.remove_patterns), re.IGNORECASE)
+        except re.error:
+            return None
+
+    def remove_text(self, text: str) -> str:
+        if not self.remove_patterns:
+            return text
+
+        # No pattern matches anywhere, so removing them one by one would change nothing
+        if self.remove_pattern is not None and not self.remove_pattern.search(text):
+            return text
+
+        # Removing one pattern can join text into a match of another, so they still apply in order
+        if self.compiled_patterns is not None:
+            for pattern in self.compiled_patterns:
+                text = pattern.sub("", text)
+            return text
+
+        for pattern in self.remove_patterns:
+            text = re.sub(pattern, "", text, flags=re.IGNORECASE)
+        return text
+
+    def apply_stop_html(self, text: str) -> str:
+        if not self.stop_html:
+            return text
+        return text.partition(self.stop_html)[0]
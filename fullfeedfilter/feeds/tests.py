@@ -1 +1,1201 @@
-# Create your tests here.
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+from datetime import timedelta
+
+import lxml.etree
+import requests
+import urllib3
+import yaml
+from bs4 import BeautifulSoup
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from full_feed_filter.settings import HTTP_USER_AGENT
+
+from feeds.management.commands.build import Command as BuildCommand
+from feeds.management.commands.scheduler import Command as SchedulerCommand
+from feeds.management.commands.stress_build import Command as StressBuildCommand, FeedServer
+from feeds.models import ArticleRecords, ArticleScrapers, BuildJob, Feeds, FeedState, Filters, HostHealth
+from feeds.scripts.build_article import ScraperArticle
+from feeds.scripts.build_context import FeedBuildContext
+from feeds.scripts.build_feed import BuildFeed
+from feeds.scripts.fetch import AsyncFetcher, FetchResult
+from feeds.scripts.keyword_matcher import CompiledFilters, KeywordMatcher
+from feeds.scripts.lxml_engine import LxmlDocument
+from feeds.scripts.rss_writer import RssWriter
+from feeds.scripts.scraper_registry import ScraperRegistry
+from feeds.scripts.scrapers import CraigslistScraper, SimpleScraper
+from feeds.scripts.text_transforms import TextTransforms, get_text_transforms
+from feeds.scripts import (build_article, build_jobs, extraction, fetch, host_health, http_client, polling,
+                           response_cache, scrape_errors, scraper_registry)
+from feeds.views import feeds as feed_views
+from general.scripts import artifacts, utils
+
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+def read_testdata(name: str) -> bytes:
+    with open(os.path.join(TESTDATA_DIR, name), "rb") as fp:
+        return fp.read()
+
+
+def use_temp_dirs(test_case) -> str:
+    """ Points built feeds (media/) and the response cache at a temporary directory for the test. """
+    directory = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+    for patcher in [
+        mock.patch.object(utils, "BASE_DIR", directory),
+        mock.patch.object(response_cache, "ENTRIES_DIR", os.path.join(directory, "cache", "entries")),
+        mock.patch.object(response_cache, "BODIES_DIR", os.path.join(directory, "cache", "bodies")),
+    ]:
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
+    return directory
+
+
+class BuildJobTests(TransactionTestCase):
+    def setUp(self) -> None:
+        use_temp_dirs(self)
+        user = User.objects.create_user(username="tester", password="password")
+        scraper = ArticleScrapers.objects.create(name="Simple Scraper")
+        # Nothing listens on the discard port, so every fetch of the feed fails
+        self.feed = Feeds.objects.create(name="Unreachable", url="http://127.0.0.1:9/rss.xml", user=user,
+                                         scraper=scraper)
+
+    def test_failing_feed_fails_job(self) -> None:
+        build_jobs.enqueue_build(self.feed)
+        job = build_jobs.claim_next_job()
+
+        self.assertFalse(build_jobs.run_job(job))
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, BuildJob.STATE_FAILED)
+        self.assertTrue(job.error)
+        self.assertTrue(build_jobs.get_build_status(self.feed)["job"]["failed"])
+
+    def test_enqueue_coalesces_queued_jobs(self) -> None:
+        first = build_jobs.enqueue_build(self.feed, priority=build_jobs.PRIORITY_BACKGROUND)
+        second = build_jobs.enqueue_build(self.feed, kind=BuildJob.KIND_REBUILD, priority=build_jobs.PRIORITY_USER)
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(BuildJob.objects.count(), 1)
+        self.assertEqual(second.kind, BuildJob.KIND_REBUILD)
+        self.assertEqual(second.priority, build_jobs.PRIORITY_USER)
+
+    def test_job_is_claimed_once(self) -> None:
+        job = build_jobs.enqueue_build(self.feed)
+
+        claimed = build_jobs.claim_next_job()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.state, BuildJob.STATE_RUNNING)
+        self.assertIsNone(build_jobs.claim_next_job())
+
+
+class HostHealthTrackerTests(TestCase):
+    URL = "http://example.com/article.html"
+
+    def test_trackers_in_separate_processes_add_up(self) -> None:
+        worker = host_health.HostHealthTracker()
+        build = host_health.HostHealthTracker()
+
+        worker.record_result(url=self.URL, seconds=1.0)
+        worker.save()
+        for _ in range(host_health.CONSECUTIVE_FAILURE_THRESHOLD):
+            build.record_result(url=self.URL, seconds=1.0, exception=TimeoutError("Read timed out"))
+        build.save()
+
+        health = HostHealth.objects.get(host="example.com")
+        self.assertEqual(health.total_requests, host_health.CONSECUTIVE_FAILURE_THRESHOLD + 1)
+        self.assertEqual(health.state, HostHealth.STATE_OPEN)
+
+        # The worker only sees the circuit the other process opened once it reloads
+        worker.before_request(url=self.URL)
+        worker.reload()
+        with self.assertRaises(host_health.CircuitOpenError):
+            worker.before_request(url=self.URL)
+
+
+class ThreadedBuildTests(TransactionTestCase):
+    """ A threaded build on a WAL database while other connections write, like `./manage.py stress_build`. """
+    FEEDS = 6
+    ARTICLES = 5
+
+    def setUp(self) -> None:
+        use_temp_dirs(self)
+
+    def test_no_database_locked_errors(self) -> None:
+        user = User.objects.create_user(username="tester", password="password")
+        # Feeds without a scraper (pk 1) build from the feed alone, without requesting the article pages
+        ArticleScrapers.objects.create(pk=1, name="None")
+        ArticleScrapers.objects.create(name="Newspaper")
+        stress_build = StressBuildCommand()
+        documents = {f"/{i}.xml": stress_build.build_feed_document(i, self.ARTICLES) for i in range(self.FEEDS)}
+
+        with FeedServer(documents=documents) as server:
+            feeds = [
+                Feeds.objects.create(name=f"Feed {i}", url=f"{server.base_url}/{i}.xml", user=user)
+                for i in range(self.FEEDS)
+            ]
+            lock_errors = stress_build.run_round(feeds, build_round=1, total_articles=self.ARTICLES, contention=2)
+
+        self.assertEqual(lock_errors, 0)
+        self.assertEqual(stress_build.contention_errors, [])
+        self.assertGreater(stress_build.contention_writes, 0)
+        self.assertEqual(ArticleRecords.objects.filter(feed__in=feeds).count(), self.FEEDS * self.ARTICLES)
+
+
+class RequestCounter(dict):
+    """ FeedServer documents that count how often each path was requested. """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.requests = {}
+
+    def get(self, path, default=None):
+        self.requests[path] = self.requests.get(path, 0) + 1
+        return super().get(path, default)
+
+
+class ScrapeRetryTests(TransactionTestCase):
+    ARTICLES = 2
+    # Nothing to extract, so every scrape fails
+    PLACEHOLDER_PAGE = b"<html><head><title>Subscribe</title></head><body></body></html>"
+
+    def setUp(self) -> None:
+        use_temp_dirs(self)
+        extraction_patcher = mock.patch.object(extraction, "EXTRACTION_WORKERS", 0)
+        extraction_patcher.start()
+        self.addCleanup(extraction_patcher.stop)
+
+        self.user = User.objects.create_user(username="tester", password="password")
+        ArticleScrapers.objects.create(pk=1, name="None")
+        self.scraper = ArticleScrapers.objects.create(name="Newspaper")
+
+    def get_documents(self, base_url: str) -> dict:
+        items = "".join(
+            f"<item><title>Article {i}</title><link>{base_url}/article/{i}.html</link>"
+            f"<description>Summary {i}</description></item>"
+            for i in range(self.ARTICLES)
+        )
+        documents = {f"/article/{i}.html": self.PLACEHOLDER_PAGE for i in range(self.ARTICLES)}
+        documents["/rss.xml"] = (f'<?xml version="1.0"?><rss version="2.0"><channel><title>Paywalled</title>'
+                                 f'<link>{base_url}/</link><description>Feed</description>{items}'
+                                 f'</channel></rss>').encode("utf-8")
+        return documents
+
+    def test_unchanged_feed_is_rebuilt_when_a_retry_is_due(self) -> None:
+        documents = RequestCounter()
+        with FeedServer(documents=documents) as server:
+            documents.update(self.get_documents(server.base_url))
+            feed = Feeds.objects.create(name="Paywalled", url=f"{server.base_url}/rss.xml", user=self.user,
+                                        scraper=self.scraper)
+            records = ArticleRecords.objects.filter(feed=feed)
+
+            call_command("build", feed_id=feed.id)
+            self.assertEqual(records.count(), self.ARTICLES)
+            self.assertTrue(all(record.full_article_retries == 1 and record.next_retry_at > now()
+                                for record in records))
+
+            # Nothing due: the unchanged feed is skipped
+            call_command("build", feed_id=feed.id)
+            self.assertTrue(all(record.full_article_retries == 1 for record in records))
+
+            records.update(next_retry_at=now() - timedelta(minutes=1))
+            call_command("build", feed_id=feed.id)
+            self.assertTrue(all(record.full_article_retries == 2 and record.next_retry_at > now()
+                                for record in records))
+
+        # The retry downloaded the pages again rather than re-reading the cached copies that failed
+        self.assertEqual(documents.requests["/article/0.html"], 2)
+
+    def test_missing_article_is_not_retried(self) -> None:
+        documents = RequestCounter()
+        with FeedServer(documents=documents) as server:
+            documents.update(self.get_documents(server.base_url))
+            for i in range(self.ARTICLES):
+                del documents[f"/article/{i}.html"]
+            feed = Feeds.objects.create(name="Paywalled", url=f"{server.base_url}/rss.xml", user=self.user,
+                                        scraper=self.scraper)
+            records = ArticleRecords.objects.filter(feed=feed)
+
+            call_command("build", feed_id=feed.id)
+            self.assertTrue(all(record.full_article_error == scrape_errors.ERROR_NOT_FOUND
+                                and record.next_retry_at is None for record in records))
+
+            call_command("build", feed_id=feed.id, force=True)
+            self.assertTrue(all(record.full_article_retries == 1 for record in records))
+
+        self.assertEqual(documents.requests["/article/0.html"], 1)
+
+
+def make_response(url: str, content: bytes, status_code: int = 200) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = url
+    response.headers["content-type"] = "text/html; charset=utf-8"
+    response.encoding = "utf-8"
+    response._content = content
+    return response
+
+
+# A page matching the kenoshanews.com config in scrapers.yaml
+ARTICLE_PAGE = (
+    "<html><head><title>Council approves the new library</title></head><body>"
+    "<div class='asset-body'>" + "".join(f"<p>Paragraph {i} of the story.</p>" for i in range(4)) + "</div>"
+    "</body></html>"
+).encode("utf-8")
+
+
+class ScraperArticleCacheTests(TestCase):
+    URL = "https://kenoshanews.com/news/library.html"
+    HOST = "kenoshanews.com"
+
+    def setUp(self) -> None:
+        use_temp_dirs(self)
+        extraction_patcher = mock.patch.object(extraction, "EXTRACTION_WORKERS", 0)
+        extraction_patcher.start()
+        self.addCleanup(extraction_patcher.stop)
+        self.scraper = ArticleScrapers.objects.create(name="Simple Scraper")
+
+        # Open the host's circuit
+        self.tracker = host_health.HostHealthTracker()
+        for _ in range(host_health.CONSECUTIVE_FAILURE_THRESHOLD):
+            self.tracker.record_result(url=self.URL, seconds=1.0, exception=TimeoutError("Read timed out"))
+
+    def test_cached_page_bypasses_open_circuit(self) -> None:
+        response_cache.store_entry(self.URL, make_response(self.URL, ARTICLE_PAGE))
+        latency = self.tracker._get(self.HOST).latency
+
+        article = ScraperArticle(host_health=self.tracker)
+        article.load(url=self.URL, scraper=self.scraper)
+
+        self.assertIn("Paragraph 3", article.description)
+        health = self.tracker._get(self.HOST)
+        self.assertEqual(health.total_requests, host_health.CONSECUTIVE_FAILURE_THRESHOLD)
+        self.assertEqual(health.latency, latency)
+
+    def test_uncached_page_is_blocked_by_open_circuit(self) -> None:
+        with self.assertRaises(host_health.CircuitOpenError):
+            ScraperArticle(host_health=self.tracker).load(url=self.URL, scraper=self.scraper)
+
+
+class ExtractionPoolTests(TestCase):
+    URL = "https://kenoshanews.com/news/library.html"
+
+    def setUp(self) -> None:
+        patcher = mock.patch.object(extraction, "EXTRACTION_WORKERS", 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(extraction.shutdown)
+
+    def run_in_thread(self) -> extraction.ExtractedArticle:
+        with mock.patch.object(extraction, "EXTRACTION_WORKERS", 0):
+            return extraction.run("Simple Scraper", self.URL, ARTICLE_PAGE)
+
+    def test_pool_matches_calling_thread(self) -> None:
+        in_pool = extraction.run("Simple Scraper", self.URL, ARTICLE_PAGE)
+
+        self.assertIsNotNone(extraction._pool)
+        self.assertIn("Paragraph 3", in_pool.article_html)
+        self.assertEqual(vars(in_pool), vars(self.run_in_thread()))
+
+    def test_dead_worker_falls_back_and_replaces_pool(self) -> None:
+        pool = extraction.get_pool()
+        for process in list(pool._processes.values()):
+            process.kill()
+            process.join()
+
+        article = extraction.run("Simple Scraper", self.URL, ARTICLE_PAGE)
+
+        self.assertEqual(vars(article), vars(self.run_in_thread()))
+        self.assertIsNone(extraction._pool)
+        self.assertIsNot(extraction.get_pool(), pool)
+
+    def test_extraction_error_reaches_the_caller_and_keeps_the_pool(self) -> None:
+        # The Reddit Scraper has no extractor, so the worker raises KeyError
+        with self.assertRaises(KeyError):
+            extraction.run("Reddit Scraper", self.URL, ARTICLE_PAGE)
+        pool = extraction._pool
+        self.assertIsNotNone(pool)
+
+        self.assertIn("Paragraph 3", extraction.run("Simple Scraper", self.URL, ARTICLE_PAGE).article_html)
+        self.assertIs(extraction._pool, pool)
+
+
+class ScraperEngineTests(TestCase):
+    """ Saved article pages scrape the same with SCRAPER_ENGINE "soup" and "lxml". """
+    PAGES = [
+        (SimpleScraper, "https://kenoshanews.com/news/local/library.html", "kenoshanews_article.html"),
+        (CraigslistScraper, "https://milwaukee.craigslist.org/bik/d/kenosha-trek-820/7450000000.html",
+         "craigslist_posting.html"),
+        # Unclosed <p> and <li> tags, which libxml2 closes and html.parser nests
+        (SimpleScraper, "https://kenoshanews.com/news/local/snow.html", "kenoshanews_malformed.html"),
+    ]
+
+    @staticmethod
+    def scrape(scraper_class, url: str, content: bytes, engine: str) -> dict:
+        scraper = scraper_class(url=url, content=content, engine=engine)
+        return {name: value for name, value in vars(scraper).items() if name not in ["soup", "engine"]}
+
+    def test_engines_scrape_the_same_article(self) -> None:
+        for scraper_class, url, name in self.PAGES:
+            with self.subTest(page=name):
+                content = read_testdata(name)
+                scraped = self.scrape(scraper_class, url, content, engine="soup")
+
+                self.assertTrue(scraped["article_html"])
+                self.assertEqual(self.scrape(scraper_class, url, content, engine="lxml"), scraped)
+
+    def test_lxml_writes_pages_like_beautifulsoup(self) -> None:
+        for name in ["kenoshanews_article.html", "craigslist_posting.html"]:
+            with self.subTest(page=name):
+                content = read_testdata(name)
+                soup = BeautifulSoup(content, "html.parser")
+                document = LxmlDocument(content)
+
+                self.assertEqual(str(document.select_one("html")), str(soup.select_one("html")))
+                self.assertEqual(document.select_one("body").text, soup.select_one("body").text)
+
+    def test_malformed_page_is_parsed_by_beautifulsoup(self) -> None:
+        content = read_testdata("kenoshanews_malformed.html")
+        with self.assertRaises(ValueError):
+            LxmlDocument(content)
+
+        scraper = SimpleScraper(url="https://kenoshanews.com/news/local/snow.html", content=content, engine="lxml")
+        self.assertIsInstance(scraper.soup, BeautifulSoup)
+
+    def test_markup_read_differently_is_left_to_beautifulsoup(self) -> None:
+        body = "<html><head></head><body>{}</body></html>"
+        for markup in ['<p class="a" class="b">text</p>', "<div><![CDATA[text]]></div>", "<div><!--></div>",
+                       "<div>a &#0; &notit; b</div>", "<select><option selected>a</option><option selected=\"no\">b"
+                       "</option></select>", "<div><p>one<p>two</div>", "<title>a <b>b</b></title>"]:
+            with self.subTest(markup=markup):
+                with self.assertRaises(ValueError):
+                    LxmlDocument(body.format(markup))
+
+    def test_valueless_attributes_read_like_beautifulsoup(self) -> None:
+        content = ('<html><head></head><body><form><input type="checkbox" checked><select>'
+                   '<option selected>a</option></select></form></body></html>')
+        soup = BeautifulSoup(content, "html.parser")
+        document = LxmlDocument(content)
+
+        self.assertEqual(document.select_one("option").get("selected"), "")
+        self.assertEqual(str(document.select_one("form")), str(soup.select_one("form")))
+
+
+class RecordingFetcher(AsyncFetcher):
+    """ Fetches nothing, but records how many requests were in flight at once, overall and per host. """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.lock = threading.Lock()
+        self.active = {}
+        self.most_active = {}
+        self.requested = []
+
+    def get(self, url: str, headers=None) -> FetchResult:
+        host = url.split("/")[2]
+        with self.lock:
+            self.requested.append(url)
+            for key in [host, None]:
+                self.active[key] = self.active.get(key, 0) + 1
+                self.most_active[key] = max(self.most_active.get(key, 0), self.active[key])
+        time.sleep(0.02)
+        with self.lock:
+            for key in [host, None]:
+                self.active[key] -= 1
+        if "broken" in url:
+            raise ConnectionError("Connection refused")
+        return FetchResult(url=url, status=200, content=url.encode("utf-8"), headers=headers)
+
+
+class AsyncFetcherTests(TestCase):
+    URLS = [f"http://host{i % 3}.example.com/{i}.xml" for i in range(12)]
+
+    def test_concurrency_is_capped_globally_and_per_host(self) -> None:
+        fetcher = RecordingFetcher(max_concurrency=4, max_concurrency_per_host=2)
+        results = fetcher.fetch_all(urls=self.URLS)
+
+        self.assertEqual(list(results), self.URLS)
+        self.assertTrue(all(result.content == url.encode("utf-8") for url, result in results.items()))
+        self.assertLessEqual(fetcher.most_active[None], 4)
+        self.assertGreater(fetcher.most_active[None], 1)
+        for host in ["host0.example.com", "host1.example.com", "host2.example.com"]:
+            self.assertLessEqual(fetcher.most_active[host], 2)
+
+    def test_urls_are_fetched_once_with_their_headers(self) -> None:
+        url = "http://example.com/rss.xml"
+        fetcher = RecordingFetcher()
+        results = fetcher.fetch_all(urls=[url, url], request_headers={url: {"If-None-Match": '"v1"'}})
+
+        self.assertEqual(fetcher.requested, [url])
+        self.assertEqual(results[url].headers, {"If-None-Match": '"v1"'})
+
+    def test_failed_fetch_is_returned_as_a_result(self) -> None:
+        results = RecordingFetcher().fetch_all(urls=["http://broken.example.com/rss.xml", self.URLS[0]])
+
+        self.assertIsInstance(results["http://broken.example.com/rss.xml"].exception, ConnectionError)
+        self.assertIsNone(results[self.URLS[0]].exception)
+
+
+class FeedOrigin:
+    """ Stands in for http_client.get in the fetch stage: serves one feed and answers If-None-Match with a 304. """
+    URL = "http://news.example.com/rss.xml"
+    ETAG = '"v1"'
+
+    def __init__(self) -> None:
+        self.request_headers = []
+        self.status_code = 200
+        self.send_not_modified = True
+        self.build_date = "Mon, 01 Jan 2024 08:00:00 GMT"
+
+    def get_document(self) -> bytes:
+        items = "".join(
+            f"<item><title>Article {i}</title><link>http://news.example.com/{i}.html</link>"
+            f"<description>Summary {i}</description></item>"
+            for i in range(3)
+        )
+        return (f'<?xml version="1.0"?><rss version="2.0"><channel><title>News</title>'
+                f'<link>http://news.example.com/</link><description>Feed</description>'
+                f'<lastBuildDate>{self.build_date}</lastBuildDate>{items}</channel></rss>').encode("utf-8")
+
+    def __call__(self, url: str, headers=None, timeout=None) -> requests.Response:
+        self.request_headers.append(dict(headers or {}))
+        if self.status_code != 200:
+            return make_response(url, b"", status_code=self.status_code)
+        if self.send_not_modified and (headers or {}).get("If-None-Match") == self.ETAG:
+            return make_response(url, b"", status_code=304)
+        response = make_response(url, self.get_document())
+        response.headers["etag"] = self.ETAG
+        return response
+
+
+class ConditionalBuildTests(TransactionTestCase):
+    def setUp(self) -> None:
+        use_temp_dirs(self)
+        self.origin = FeedOrigin()
+        patcher = mock.patch.object(fetch.http_client, "get", self.origin)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(username="tester", password="password")
+        # Feeds without a scraper (pk 1) build from the feed alone, without requesting the article pages
+        ArticleScrapers.objects.create(pk=1, name="None")
+        ArticleScrapers.objects.create(name="Newspaper")
+        self.feed = Feeds.objects.create(name="News", url=FeedOrigin.URL, user=self.user)
+
+    def build(self) -> BuildCommand:
+        command = BuildCommand()
+        call_command(command, feed_id=self.feed.id)
+        return command
+
+    def get_rss_path(self) -> str:
+        return os.path.join(utils.get_rss_folder(feed_id=self.feed.id), "rss.xml")
+
+    def test_unchanged_feed_is_not_downloaded_again(self) -> None:
+        self.build()
+        state = FeedState.objects.get(feed=self.feed)
+        self.assertEqual(state.etag, FeedOrigin.ETAG)
+        self.assertEqual(self.origin.request_headers, [{}])
+        with open(self.get_rss_path(), "rb") as fp:
+            rss = fp.read()
+
+        command = self.build()
+
+        self.assertEqual(self.origin.request_headers[-1], {"If-None-Match": FeedOrigin.ETAG})
+        self.assertEqual(command.skipped, [(self.feed, "Not Modified")])
+        state.refresh_from_db()
+        self.assertEqual(state.etag, FeedOrigin.ETAG)
+        self.assertEqual(state.total_not_modified, 1)
+        with open(self.get_rss_path(), "rb") as fp:
+            self.assertEqual(fp.read(), rss)
+
+    def test_forced_build_sends_no_validators(self) -> None:
+        self.build()
+
+        command = BuildCommand()
+        call_command(command, feed_id=self.feed.id, force=True)
+
+        self.assertEqual(self.origin.request_headers[-1], {})
+        self.assertEqual(command.skipped, [])
+
+    def test_feed_with_unchanged_entries_and_settings_is_skipped(self) -> None:
+        self.origin.send_not_modified = False
+        self.build()
+        last_built = FeedState.objects.get(feed=self.feed).last_built
+
+        # The origin sends the feed again, with only a new build date
+        self.origin.build_date = "Mon, 01 Jan 2024 09:00:00 GMT"
+        command = self.build()
+
+        self.assertEqual(command.skipped, [(self.feed, "Unchanged Entries & Settings")])
+        self.assertEqual(FeedState.objects.get(feed=self.feed).last_built, last_built)
+
+    def test_changed_filters_rebuild_the_feed(self) -> None:
+        self.build()
+        state = FeedState.objects.get(feed=self.feed)
+        Filters.objects.create(user=self.user, feed=self.feed, keyword="Article 1", condition="in", source="title",
+                               action="hide")
+
+        command = self.build()
+
+        # The last build used other settings, so even the validators are not sent
+        self.assertEqual(self.origin.request_headers[-1], {})
+        self.assertEqual(command.skipped, [])
+        self.assertGreater(FeedState.objects.get(feed=self.feed).last_built, state.last_built)
+        self.assertNotEqual(FeedState.objects.get(feed=self.feed).settings_hash, state.settings_hash)
+
+
+class FeedHealthTests(TransactionTestCase):
+    """ Builds of all feeds, in which a failing feed is not fetched again until its backoff has elapsed. """
+
+    def setUp(self) -> None:
+        use_temp_dirs(self)
+        self.origin = FeedOrigin()
+        patcher = mock.patch.object(fetch.http_client, "get", self.origin)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create_user(username="tester", password="password")
+        ArticleScrapers.objects.create(pk=1, name="None")
+        ArticleScrapers.objects.create(name="Newspaper")
+        self.feed = Feeds.objects.create(name="News", url=FeedOrigin.URL, user=user)
+
+    @staticmethod
+    def build() -> BuildCommand:
+        command = BuildCommand()
+        call_command(command)
+        return command
+
+    def test_failing_feed_backs_off_until_it_builds_again(self) -> None:
+        self.origin.status_code = 500
+        command = self.build()
+
+        self.assertEqual(command.failed[0][0], self.feed)
+        state = FeedState.objects.get(feed=self.feed)
+        self.assertEqual(state.consecutive_failures, 1)
+        self.assertIn("500", state.last_error)
+        self.assertGreater(state.next_poll, now() + timedelta(minutes=50))
+
+        command = self.build()
+        self.assertEqual(command.skipped, [(self.feed, "Failing Feed Backing Off")])
+        self.assertEqual(len(self.origin.request_headers), 1)
+
+        FeedState.objects.filter(feed=self.feed).update(next_poll=now() - timedelta(minutes=1))
+        self.build()
+        state.refresh_from_db()
+        self.assertEqual(state.consecutive_failures, 2)
+        self.assertGreater(state.next_poll, now() + timedelta(minutes=110))
+
+        self.origin.status_code = 200
+        FeedState.objects.filter(feed=self.feed).update(next_poll=now() - timedelta(minutes=1))
+        command = self.build()
+        self.assertEqual(command.failed, [])
+        state.refresh_from_db()
+        self.assertEqual(state.consecutive_failures, 0)
+        self.assertEqual(state.last_error, "")
+
+    def test_failure_interval_doubles_up_to_a_week(self) -> None:
+        self.assertEqual([polling.get_failure_interval(failures) for failures in [1, 2, 3]], [3600, 7200, 14400])
+        self.assertEqual(polling.get_failure_interval(20), polling.MAX_FAILURE_INTERVAL)
+
+
+class ArticleRecordTests(TestCase):
+    def setUp(self) -> None:
+        use_temp_dirs(self)
+        self.origin = FeedOrigin()
+        user = User.objects.create_user(username="tester", password="password")
+        ArticleScrapers.objects.create(pk=1, name="None")
+        ArticleScrapers.objects.create(name="Newspaper")
+        self.feed = Feeds.objects.create(name="News", url=FeedOrigin.URL, user=user)
+
+    def build(self) -> list:
+        """ Builds the feed on this thread. Returns the queries it ran on ArticleRecords. """
+        fetch_result = FetchResult.from_response(url=FeedOrigin.URL, response=self.origin(FeedOrigin.URL))
+        with CaptureQueriesContext(connection) as queries:
+            BuildFeed(feed=self.feed, fetch_result=fetch_result, threaded=False)
+        return [query["sql"] for query in queries.captured_queries if "feeds_articlerecords" in query["sql"]]
+
+    @staticmethod
+    def count(queries: list, statement: str) -> int:
+        return sum(1 for sql in queries if sql.startswith(statement))
+
+    def test_records_are_loaded_in_one_query(self) -> None:
+        self.build()
+        self.assertEqual(ArticleRecords.objects.filter(feed=self.feed).count(), 3)
+
+        queries = self.build()
+
+        self.assertEqual(self.count(queries, "SELECT"), 1)
+        self.assertEqual(ArticleRecords.objects.filter(feed=self.feed).count(), 3)
+
+    def test_new_records_are_inserted_in_one_statement(self) -> None:
+        queries = self.build()
+
+        self.assertEqual(self.count(queries, "INSERT"), 1)
+        self.assertEqual(ArticleRecords.objects.filter(feed=self.feed).count(), 3)
+
+    def test_failed_write_saves_no_records(self) -> None:
+        self.build()
+        records = list(ArticleRecords.objects.filter(feed=self.feed))
+        new_record = ArticleRecords(feed=self.feed, url="http://news.example.com/3.html", title="Article 3",
+                                    pub_date="", scraper_id=1)
+        records[0].title = "Renamed"
+
+        with mock.patch.object(ArticleRecords.objects, "bulk_update", side_effect=RuntimeError("disk I/O error")):
+            with self.assertRaises(RuntimeError):
+                BuildFeed.write_article_records(new_records=[new_record], changed_records=records)
+
+        self.assertFalse(ArticleRecords.objects.filter(url=new_record.url).exists())
+
+
+class FeedBuildContextTests(TestCase):
+    def setUp(self) -> None:
+        use_temp_dirs(self)
+        self.origin = FeedOrigin()
+        self.user = User.objects.create_user(username="tester", password="password")
+        ArticleScrapers.objects.create(pk=1, name="None")
+        ArticleScrapers.objects.create(name="Newspaper")
+        self.feed = Feeds.objects.create(name="News", url=FeedOrigin.URL, user=self.user)
+        for keyword in ["weather", "sports"]:
+            Filters.objects.create(user=self.user, feed=self.feed, keyword=keyword, condition="in", source="title",
+                                   action="hide")
+
+    def test_articles_do_not_load_feed_settings(self) -> None:
+        fetch_result = FetchResult.from_response(url=FeedOrigin.URL, response=self.origin(FeedOrigin.URL))
+        with CaptureQueriesContext(connection) as queries:
+            BuildFeed(feed=self.feed, fetch_result=fetch_result, threaded=False)
+
+        for table in ["feeds_feeds", "feeds_filters", "feeds_articlescrapers"]:
+            with self.subTest(table=table):
+                self.assertEqual(sum(1 for query in queries.captured_queries if f'FROM "{table}"' in query["sql"]), 1)
+
+    def test_filters_are_compiled_again_only_when_they_change(self) -> None:
+        compiled_filters = FeedBuildContext(feed=self.feed).compiled_filters
+        self.assertIs(FeedBuildContext(feed=self.feed).compiled_filters, compiled_filters)
+
+        Filters.objects.create(user=self.user, feed=self.feed, keyword="traffic", condition="in", source="title",
+                               action="hide")
+        context = FeedBuildContext(feed=self.feed)
+
+        self.assertIsNot(context.compiled_filters, compiled_filters)
+        self.assertEqual(context.compiled_filters.search("title", "traffic on main street"), {"traffic"})
+
+
+class KeywordMatcherTests(TestCase):
+    KEYWORDS = ["he", "she", "hers", "his", "new york", "york", "new york city", "a", "car", "car crash"]
+    TEXTS = [
+        "ushers and she sells his hers",
+        "new york city police",
+        "a car crashed in new yorkshire",
+        "car crash on i 94",
+        "the shepherd",
+        "",
+        "a",
+        "she she he",
+    ]
+
+    def test_matches_keywords_like_space_padded_substrings(self) -> None:
+        matcher = KeywordMatcher(keywords=self.KEYWORDS)
+        for text in self.TEXTS:
+            with self.subTest(text=text):
+                expected = {keyword for keyword in self.KEYWORDS if f" {keyword} " in f" {text} "}
+                self.assertEqual(matcher.search(text), expected)
+
+    def test_filter_conditions(self) -> None:
+        filters = [
+            Filters(id=1, keyword="crash", normalized_keyword="crash", condition="in", source="title", action="hide"),
+            Filters(id=2, keyword="kenosha", normalized_keyword="kenosha", condition="not_in", source="title",
+                    action="hide"),
+            Filters(id=3, keyword="crash", normalized_keyword="crash", condition="in", source="body", action="show"),
+        ]
+        compiled_filters = CompiledFilters(filters=filters)
+
+        matched = compiled_filters.search(source="title", text="car crash in racine")
+        self.assertEqual(matched, {"crash"})
+        self.assertTrue(compiled_filters.is_true(filters[0], matched_keywords=matched))
+        self.assertTrue(compiled_filters.is_true(filters[1], matched_keywords=matched))
+        self.assertEqual(compiled_filters.search(source="body", text="no crashes today"), set())
+
+
+class ArticleFilterTests(TestCase):
+    FILTERS = [("article 1", "title"), ("weather", "title"), ("summary 2", "body")]
+
+    def setUp(self) -> None:
+        use_temp_dirs(self)
+        self.origin = FeedOrigin()
+        user = User.objects.create_user(username="tester", password="password")
+        ArticleScrapers.objects.create(pk=1, name="None")
+        ArticleScrapers.objects.create(name="Newspaper")
+        self.feed = Feeds.objects.create(name="News", url=FeedOrigin.URL, user=user)
+        for keyword, source in self.FILTERS:
+            Filters.objects.create(user=user, feed=self.feed, keyword=keyword, condition="in", source=source,
+                                   action="hide")
+
+    def test_each_source_is_normalized_once_per_article(self) -> None:
+        fetch_result = FetchResult.from_response(url=FeedOrigin.URL, response=self.origin(FeedOrigin.URL))
+        with mock.patch.object(build_article, "normalize_filter_text",
+                               wraps=build_article.normalize_filter_text) as normalize:
+            build_feed = BuildFeed(feed=self.feed, fetch_result=fetch_result, threaded=False)
+
+        self.assertEqual([article.title for article in build_feed.show_articles], ["Article 0"])
+        # Three articles, each with a title and a body source
+        self.assertEqual(normalize.call_count, 6)
+
+
+class TextTransformsTests(TestCase):
+    TEXTS = ["Read more at ABC News", "abc", "Sponsored: ad - Subscribe now!", "", "a(b)c  bb"]
+    REMOVE_TEXTS = [
+        "read more,subscribe now",
+        "bc,ab",
+        "b,ac",
+        "(b),a",
+        "(?i)ad,sponsored: ",
+        "b+,,",
+    ]
+
+    @staticmethod
+    def remove_one_by_one(remove_text: str, text: str) -> str:
+        for pattern in [pattern for pattern in remove_text.split(",") if pattern]:
+            text = re.sub(pattern, "", text, flags=re.IGNORECASE)
+        return text
+
+    def test_patterns_are_removed_in_order(self) -> None:
+        for remove_text in self.REMOVE_TEXTS:
+            text_transforms = TextTransforms(remove_text=remove_text, stop_html="")
+            for text in self.TEXTS:
+                with self.subTest(remove_text=remove_text, text=text):
+                    self.assertEqual(text_transforms.remove_text(text), self.remove_one_by_one(remove_text, text))
+
+    def test_invalid_pattern_fails_when_applied(self) -> None:
+        text_transforms = TextTransforms(remove_text="ok,(unclosed", stop_html="")
+        with self.assertRaises(re.error):
+            text_transforms.remove_text("ok")
+
+    def test_stop_html(self) -> None:
+        text_transforms = TextTransforms(remove_text="", stop_html="<div class=\"related\">")
+        self.assertEqual(text_transforms.apply_stop_html("<p>Story</p><div class=\"related\"><a>x</a></div>"),
+                         "<p>Story</p>")
+        self.assertEqual(text_transforms.apply_stop_html("<p>Story</p>"), "<p>Story</p>")
+
+    def test_transforms_are_compiled_again_when_the_feed_changes(self) -> None:
+        user = User.objects.create_user(username="tester", password="password")
+        ArticleScrapers.objects.create(pk=1, name="None")
+        feed = Feeds.objects.create(name="News", url=FeedOrigin.URL, user=user, remove_text="read more")
+        text_transforms = get_text_transforms(feed)
+        self.assertIs(get_text_transforms(feed), text_transforms)
+
+        feed.remove_text = "subscribe"
+        self.assertEqual(get_text_transforms(feed).remove_text("Subscribe to read more"), " to read more")
+
+
+class RssWriterTests(TestCase):
+    ARTICLES = [
+        SimpleNamespace(title="Fish &amp; chips <b>\x0b</b>", link="http://news.example.com/1.html?a=1&b=2",
+                        pub_date="Mon, 01 Jan 2024 08:00:00 -0000",
+                        description="<p>Ends early ]]> or not</p>\x00"),
+        SimpleNamespace(title="Caf\u00e9", link="http://news.example.com/2.html", pub_date="",
+                        description=None),
+    ]
+
+    def setUp(self) -> None:
+        self.directory = use_temp_dirs(self)
+        self.path = os.path.join(self.directory, "rss.xml")
+
+    def get_writer(self, title: str = "News & Weather") -> RssWriter:
+        return RssWriter(path=self.path, xml_link="http://localhost/tester/news/", title=title,
+                         link="http://news.example.com/rss.xml", description="Local <news>")
+
+    def test_feed_is_well_formed(self) -> None:
+        channel = ElementTree.fromstring(self.get_writer().render(self.ARTICLES)).find("channel")
+
+        self.assertEqual(channel.findtext("title"), "News & Weather")
+        self.assertEqual(channel.findtext("description"), "Local <news>")
+        items = channel.findall("item")
+        self.assertEqual(items[0].findtext("title"), "Fish & chips <b></b>")
+        self.assertEqual(items[0].findtext("link"), "http://news.example.com/1.html?a=1&b=2")
+        self.assertEqual(items[0].findtext("description"), "<p>Ends early ]]> or not</p>")
+        self.assertEqual(items[1].findtext("title"), "Caf\u00e9")
+        self.assertEqual(items[1].findtext("description"), "")
+
+    def test_write_matches_render_and_replaces_the_file(self) -> None:
+        self.assertTrue(self.get_writer().write(self.ARTICLES))
+        with open(self.path, encoding="utf-8") as fp:
+            self.assertEqual(fp.read(), self.get_writer().render(self.ARTICLES))
+
+        self.assertTrue(self.get_writer(title="Renamed").write(self.ARTICLES))
+        with open(self.path, encoding="utf-8") as fp:
+            self.assertIn("<title>Renamed</title>", fp.read())
+
+    def test_failed_write_keeps_the_published_feed(self) -> None:
+        self.get_writer().write(self.ARTICLES)
+        with open(self.path, encoding="utf-8") as fp:
+            published = fp.read()
+
+        broken_article = SimpleNamespace(link="http://news.example.com/3.html")
+        with self.assertRaises(AttributeError):
+            self.get_writer(title="Renamed").write(self.ARTICLES + [broken_article])
+
+        with open(self.path, encoding="utf-8") as fp:
+            self.assertEqual(fp.read(), published)
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith(".tmp")], [])
+
+
+class RssViewTests(TestCase):
+    def setUp(self) -> None:
+        directory = use_temp_dirs(self)
+        patcher = mock.patch.object(feed_views, "BASE_DIR", directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create_user(username="tester", password="password")
+        ArticleScrapers.objects.create(pk=1, name="None")
+        self.feed = Feeds.objects.create(name="News", url=FeedOrigin.URL, user=user)
+        self.url = f"/feed/{self.feed.id}/rss/"
+
+    def test_missing_feed_gets_placeholder_and_queues_a_build(self) -> None:
+        for _ in range(2):
+            response = self.client.get(self.url)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Retry-After"], str(build_jobs.PLACEHOLDER_RETRY_AFTER))
+            self.assertIn("no-cache", response["Cache-Control"])
+            channel = ElementTree.fromstring(response.content).find("channel")
+            self.assertEqual(channel.findtext("title"), "News - (Filtered)")
+            self.assertEqual(channel.findall("item"), [])
+
+        job = BuildJob.objects.get(feed=self.feed)
+        self.assertEqual(job.state, BuildJob.STATE_QUEUED)
+        self.assertEqual(job.priority, build_jobs.PRIORITY_MISSING_FEED)
+
+    def test_built_feed_is_served(self) -> None:
+        path = os.path.join(utils.get_rss_folder(feed_id=self.feed.id), "rss.xml")
+        os.makedirs(os.path.dirname(path))
+        artifacts.write_artifact(path, "<rss>built</rss>")
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"<rss>built</rss>")
+        self.assertTrue(response.has_header("ETag"))
+        self.assertFalse(BuildJob.objects.exists())
+
+
+class PollingTests(TestCase):
+    @staticmethod
+    def get_entries(hours: list) -> list:
+        return [{"published_parsed": time.gmtime(1704096000 + hour * 3600)} for hour in hours]
+
+    def test_publish_interval_is_the_median_gap(self) -> None:
+        self.assertEqual(polling.get_publish_interval(self.get_entries([0, 2, 4, 10, 12])), 2 * 3600)
+        self.assertEqual(polling.get_publish_interval(self.get_entries([5, 0, 1])), int(2.5 * 3600))
+        self.assertIsNone(polling.get_publish_interval(self.get_entries([3, 3]) + [{}]))
+
+    def test_poll_interval_backs_off_within_bounds(self) -> None:
+        self.assertEqual(polling.get_poll_interval(publish_interval=4 * 3600, unchanged_polls=0), 2 * 3600)
+        self.assertEqual(polling.get_poll_interval(publish_interval=4 * 3600, unchanged_polls=2), int(4.5 * 3600))
+        self.assertEqual(polling.get_poll_interval(publish_interval=None, unchanged_polls=0),
+                         polling.DEFAULT_POLL_INTERVAL)
+        self.assertEqual(polling.get_poll_interval(publish_interval=60, unchanged_polls=0), polling.MIN_POLL_INTERVAL)
+        self.assertEqual(polling.get_poll_interval(publish_interval=4 * 3600, unchanged_polls=100),
+                         polling.MAX_POLL_INTERVAL)
+
+    def test_next_poll_is_jittered_around_the_interval(self) -> None:
+        start = now()
+        for _ in range(20):
+            seconds = (polling.get_next_poll(interval=3600, from_time=start) - start).total_seconds()
+            self.assertGreaterEqual(seconds, 3600 * (1 - polling.JITTER))
+            self.assertLessEqual(seconds, 3600 * (1 + polling.JITTER))
+
+
+class SchedulerTests(TestCase):
+    def setUp(self) -> None:
+        user = User.objects.create_user(username="tester", password="password")
+        ArticleScrapers.objects.create(pk=1, name="None")
+        self.feeds = {
+            name: Feeds.objects.create(name=name, url=f"http://{name}.example.com/rss.xml", user=user)
+            for name in ["due", "not_due", "never_polled", "queued"]
+        }
+        FeedState.objects.create(feed=self.feeds["due"], next_poll=now() - timedelta(minutes=1), poll_interval=7200)
+        FeedState.objects.create(feed=self.feeds["not_due"], next_poll=now() + timedelta(minutes=30))
+        FeedState.objects.create(feed=self.feeds["queued"], next_poll=now() - timedelta(minutes=1))
+        build_jobs.enqueue_build(self.feeds["queued"])
+
+        patcher = mock.patch("feeds.management.commands.scheduler.cprint")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_due_feeds_are_queued_once(self) -> None:
+        scheduler = SchedulerCommand()
+
+        self.assertEqual(scheduler.dispatch_due_feeds(), 2)
+
+        queued = BuildJob.objects.filter(state=BuildJob.STATE_QUEUED)
+        self.assertEqual({job.feed.name for job in queued}, {"due", "never_polled", "queued"})
+        self.assertTrue(all(job.priority == build_jobs.PRIORITY_BACKGROUND for job in queued
+                            if job.feed.name != "queued"))
+
+        # The due feed is leased until its build stores the next poll
+        next_poll = FeedState.objects.get(feed=self.feeds["due"]).next_poll
+        self.assertGreater(next_poll, now() + timedelta(seconds=7200 * (1 - polling.JITTER) - 60))
+        self.assertEqual(scheduler.dispatch_due_feeds(), 0)
+
+
+class ScrapeErrorTests(TestCase):
+    @staticmethod
+    def get_http_error(status_code: int) -> requests.HTTPError:
+        response = make_response("http://example.com/", b"", status_code=status_code)
+        return requests.HTTPError(f"{status_code} Error", response=response)
+
+    def test_exceptions_are_classified(self) -> None:
+        cases = [
+            (self.get_http_error(403), scrape_errors.ERROR_FORBIDDEN),
+            (self.get_http_error(404), scrape_errors.ERROR_NOT_FOUND),
+            (self.get_http_error(503), scrape_errors.ERROR_SERVER),
+            (requests.exceptions.ReadTimeout("Read timed out"), scrape_errors.ERROR_TIMEOUT),
+            (requests.exceptions.ConnectionError("Connection refused"), scrape_errors.ERROR_CONNECTION),
+            (Exception("Article `download()` failed with 404 Client Error: Not Found for url"),
+             scrape_errors.ERROR_NOT_FOUND),
+            (ValueError("No article found"), scrape_errors.ERROR_OTHER),
+        ]
+        for exception, error in cases:
+            with self.subTest(exception=exception):
+                self.assertEqual(scrape_errors.classify_exception(exception), error)
+
+        self.assertTrue(scrape_errors.is_permanent_error(scrape_errors.ERROR_NOT_FOUND))
+        self.assertFalse(scrape_errors.is_permanent_error(scrape_errors.ERROR_TIMEOUT))
+
+    def test_retry_delay_doubles_up_to_a_week(self) -> None:
+        start = now()
+        for retries, hours in [(0, 1), (1, 1), (2, 2), (4, 8), (20, 7 * 24)]:
+            with self.subTest(retries=retries):
+                seconds = (scrape_errors.get_next_retry_at(retries=retries, from_time=start) - start).total_seconds()
+                self.assertGreaterEqual(seconds, hours * 3600 * (1 - scrape_errors.RETRY_JITTER))
+                self.assertLessEqual(seconds, hours * 3600 * (1 + scrape_errors.RETRY_JITTER))
+
+
+class KeepAliveServer:
+    """ Serves a page over HTTP/1.1 keep-alive on a local port and records the User-Agent of each request. """
+
+    def __init__(self, content: bytes) -> None:
+        user_agents = self.user_agents = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                user_agents.append(self.headers.get("User-Agent"))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'KeepAliveServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HttpClientTests(TestCase):
+    def test_requests_to_a_host_share_a_connection(self) -> None:
+        session = http_client.create_session()
+        self.addCleanup(session.close)
+
+        with KeepAliveServer(content=ARTICLE_PAGE) as server:
+            for i in range(3):
+                self.assertEqual(session.get(f"{server.base_url}/{i}.html", timeout=http_client.TIMEOUT).content,
+                                 ARTICLE_PAGE)
+
+        stats = session.get_adapter(server.base_url).get_connection_stats()
+        self.assertEqual(stats["127.0.0.1"], {"connections": 1, "requests": 3, "reused": 2})
+        self.assertEqual(server.user_agents, [HTTP_USER_AGENT] * 3)
+
+    def test_retry_after_is_capped(self) -> None:
+        for retry_after, expected in [("60", http_client.MAX_RETRY_AFTER), ("1", 1)]:
+            with self.subTest(retry_after=retry_after):
+                response = urllib3.HTTPResponse(status=503, headers={"Retry-After": retry_after})
+                self.assertEqual(http_client.RETRY.get_retry_after(response), expected)
+
+    def test_unlabelled_charset_is_detected(self) -> None:
+        response = make_response("http://example.com/", "Caf\u00e9 r\u00e9sum\u00e9 na\u00efve".encode("utf-8"))
+        response.encoding = http_client.FALLBACK_ENCODING
+
+        self.assertEqual(http_client.get_response_text(response), "Caf\u00e9 r\u00e9sum\u00e9 na\u00efve")
+
+
+class ResponseCacheTests(TestCase):
+    URL = "https://kenoshanews.com/news/library.html"
+
+    def setUp(self) -> None:
+        use_temp_dirs(self)
+        self.responses = []
+        self.request_headers = []
+        patcher = mock.patch.object(http_client, "get", self.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, url: str, headers=None, timeout=None) -> requests.Response:
+        self.request_headers.append(headers)
+        return self.responses.pop(0)
+
+    def respond(self, content: bytes = ARTICLE_PAGE, status_code: int = 200, url: str = URL) -> requests.Response:
+        response = make_response(url, content, status_code=status_code)
+        response.headers["etag"] = '"v1"'
+        return response
+
+    def test_urls_are_canonicalized(self) -> None:
+        self.assertEqual(
+            response_cache.canonicalize_url("HTTPS://KenoshaNews.com:443/news/a.html?id=3&utm_source=rss&fbclid=x#top"),
+            "https://kenoshanews.com/news/a.html?id=3",
+        )
+        self.assertEqual(response_cache.get_entry_path("http://example.com"),
+                         response_cache.get_entry_path("http://example.com:80/"))
+
+    def test_fresh_page_is_served_from_disk(self) -> None:
+        self.responses.append(self.respond())
+        self.assertEqual(response_cache.get(self.URL).content, ARTICLE_PAGE)
+
+        response = response_cache.get(f"{self.URL}?utm_medium=feed")
+
+        self.assertEqual(response.content, ARTICLE_PAGE)
+        self.assertEqual(response.encoding, "utf-8")
+        self.assertEqual(self.request_headers, [None])
+
+    def test_stale_page_is_revalidated(self) -> None:
+        self.responses.append(self.respond())
+        response_cache.get(self.URL)
+
+        with mock.patch.object(response_cache, "RESPONSE_CACHE_TTL", 0):
+            self.responses.append(self.respond(b"", status_code=304))
+            self.assertEqual(response_cache.get(self.URL).content, ARTICLE_PAGE)
+            self.assertEqual(self.request_headers[-1], {"If-None-Match": '"v1"'})
+
+            self.responses.append(self.respond(b"<html>new</html>"))
+            response_cache.get(self.URL, refresh=True)
+            self.assertIsNone(self.request_headers[-1])
+        self.assertEqual(response_cache.get(self.URL).content, b"<html>new</html>")
+
+    def test_failed_responses_are_not_cached(self) -> None:
+        self.responses.append(self.respond(b"Not Found", status_code=404))
+        with self.assertRaises(requests.HTTPError):
+            response_cache.get_html(self.URL)
+        self.assertIsNone(response_cache.load_entry(self.URL))
+
+    def test_prune_evicts_least_recently_used_pages(self) -> None:
+        urls = [f"https://kenoshanews.com/news/{i}.html" for i in range(3)]
+        for i, url in enumerate(urls):
+            self.responses.append(self.respond(f"<html>{i} {'x' * 1000}</html>".encode("utf-8"), url=url))
+            response_cache.get(url)
+            os.utime(response_cache.get_entry_path(url), (1000 + i, 1000 + i))
+        # The same page under another url shares its body
+        self.responses.append(self.respond(f"<html>2 {'x' * 1000}</html>".encode("utf-8")))
+        response_cache.get(self.URL)
+        body_size = os.path.getsize(response_cache.get_body_path(response_cache.load_entry(self.URL)["digest"]))
+
+        self.assertEqual(response_cache.prune(max_bytes=2 * body_size), 1)
+
+        self.assertIsNone(response_cache.load_entry(urls[0]))
+        self.assertEqual([response_cache.load_entry(url) is not None for url in urls[1:] + [self.URL]], [True] * 3)
+        bodies = [name for _, _, names in os.walk(response_cache.BODIES_DIR) for name in names]
+        self.assertEqual(len(bodies), 2)
+
+
+class ScraperRegistryTests(TestCase):
+    CONFIG = """
+news:
+  - url: "example.com"
+    article: "div.story"
+  - url: "blogs.example.com"
+    article: "article > div.post"
+  - url: "example.com/sports"
+    article: "div#sports"
+  - url: "craigslist.org"
+    article: "section#postingbody"
+    map: "div.mapbox[data-latitude]"
+broken:
+  - url: "broken.org"
+    article: "div:unknown-pseudo(x)"
+"""
+    URLS = [
+        "https://example.com/news/a.html",
+        "https://www.example.com/news/a.html",
+        "https://blogs.example.com/post/1",
+        "https://example.com/sports/game.html",
+        "https://blogs.example.com/sports/game.html",
+        "https://milwaukee.craigslist.org/bik/d/trek/1.html",
+        "https://notexample.com/a.html",
+        "https://proxy.invalid/?url=https://craigslist.org/x",
+        "https://other.org/a.html",
+        "not a url",
+    ]
+
+    def setUp(self) -> None:
+        directory = use_temp_dirs(self)
+        self.path = os.path.join(directory, "scrapers.yaml")
+        self.write(self.CONFIG)
+        self.registry = ScraperRegistry(path=self.path)
+
+    def write(self, config: str) -> None:
+        with open(self.path, "w") as fp:
+            fp.write(config)
+
+    def get_entries(self) -> list:
+        return [item for items in yaml.load(self.CONFIG, Loader=yaml.BaseLoader).values() for item in items]
+
+    def test_lookup_matches_scanning_every_entry(self) -> None:
+        entries = self.get_entries()
+        for url in self.URLS:
+            with self.subTest(url=url):
+                expected = None
+                for item in entries:
+                    if item["url"] in url:
+                        expected = item
+                self.assertEqual(self.registry.get_config(url), expected)
+
+    def test_changed_file_is_reloaded(self) -> None:
+        self.assertEqual(self.registry.get_config(self.URLS[0])["article"], "div.story")
+
+        self.write(self.CONFIG.replace("div.story", "div.article-body"))
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        with mock.patch.object(scraper_registry, "RELOAD_CHECK_INTERVAL", 0):
+            self.assertEqual(self.registry.get_config(self.URLS[0])["article"], "div.article-body")
+
+    def test_selectors_are_compiled_once(self) -> None:
+        self.registry.get_config(self.URLS[0])
+        selector = self.registry.get_selector("div.story")
+        self.assertIs(self.registry.get_selector("div.story"), selector)
+        self.assertIsNone(self.registry.get_selector("div:unknown-pseudo(x)"))
+
+        root = lxml.etree.fromstring("<div class='story'><p>a</p><div class='story'><p>b</p></div></div>")
+        self.assertEqual(len(self.registry.get_xpath("div.story")(root)), 1)
+        self.assertEqual(len(self.registry.get_xpath("div.story", document=True)(root)), 2)
+        self.assertIs(self.registry.get_xpath("div.story"), self.registry.get_xpath("div.story"))
+        self.assertIsNone(self.registry.get_xpath("div:unknown-pseudo(x)"))
@@ -34,6 +34,7 @@ urlpatterns = [
     # Feeds - Rebuild Feeds
     path('<int:feed_id>/rebuild/', feeds.handle_rebuild_feed, name='feed_rebuild'),
     path('<int:feed_id>/rebuild_full_articles/', feeds.handle_rebuild_full_articles, name='feed_rebuild_full_articles'),
+    path('<int:feed_id>/build_status/', feeds.feed_build_status, name='feed_build_status'),
 
     # Filters Views
     path('<int:pk>/filter/add/', filters.FilterCreateView.as_view(), name='filter_add'),
@@ -4,16 +4,18 @@ import sys
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core import management
 from django.forms import Form
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
+from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.urls import reverse, reverse_lazy
 from django.views.generic import DetailView, ListView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
-from feeds.models import Feeds, FeedValidation, Filters
+from feeds.models import BuildJob, Feeds, FeedValidation, Filters
+from feeds.scripts import build_jobs
 from feeds.scripts.feed_validation import Feedparser
 from full_feed_filter.settings import BASE_DIR, DOMAIN
 from general.scripts import utils
+from general.scripts.artifact_response import RSS_CONTENT_TYPE, serve_artifact
 
 
 class FeedListView(LoginRequiredMixin, ListView):
@@ -21,7 +23,7 @@ class FeedListView(LoginRequiredMixin, ListView):
     template_name = "feeds/feed_list.html"
 
     def get_queryset(self) -> Feeds:
-        return Feeds.objects.filter(user=self.request.user).order_by("name")
+        return Feeds.objects.filter(user=self.request.user).select_related("state").order_by("name")
 
     def get_context_data(self, **kwargs) -> dict:
         # Call the base implementation first to get a context
@@ -103,8 +105,7 @@ class FeedCreateView(LoginRequiredMixin, CreateView):
         o = form.save()
 
         # Create filtered xml rss feed
-        # output_file = os.path.join(BASE_DIR, f"temp.txt")
-        management.call_command("build", feed_id=o.pk, verbose=False)
+        build_jobs.enqueue_build(feed=o, kind=BuildJob.KIND_REFILTER)
 
         return super().form_valid(form)
 
@@ -146,13 +147,9 @@ class FeedUpdateView(LoginRequiredMixin, UpdateView):
 
         # Rebuild RSS Feed
         if "scraper" in form.changed_data:
-            management.call_command(
-                "build", feed_id=o.pk, verbose=False, rebuild_full_articles=True
-            )
+            build_jobs.enqueue_build(feed=o, kind=BuildJob.KIND_FULL_RESCRAPE)
         else:
-            management.call_command(
-                "build", feed_id=o.pk, verbose=False, rebuild_full_articles=False
-            )
+            build_jobs.enqueue_build(feed=o, kind=BuildJob.KIND_REFILTER)
 
         return super().form_valid(form)
 
@@ -181,20 +178,20 @@ class FeedDeleteView(LoginRequiredMixin, DeleteView):
 # HELPERS
 @login_required
 def handle_rebuild_feed(request: HttpRequest, feed_id: int) -> HttpResponse:
-    management.call_command("build", feed_id=feed_id, verbose=True, rebuild_full_articles=False)
+    feed = get_object_or_404(Feeds, id=feed_id)
+    build_jobs.enqueue_build(feed=feed, kind=BuildJob.KIND_REBUILD)
 
-    feed = Feeds.objects.filter(id=feed_id).first()
-    message = f"RSS feed for '<b>{feed.name}</b>' was successfully refreshed."
+    message = f"RSS feed for '<b>{feed.name}</b>' was queued for a refresh."
     messages.add_message(request, messages.SUCCESS, message)
     return HttpResponseRedirect(reverse_lazy("feed_list"))
 
 
 @login_required
 def handle_rebuild_full_articles(request: HttpRequest, feed_id: int) -> HttpResponse:
-    management.call_command("build", feed_id=feed_id, verbose=True, rebuild_full_articles=True)
+    feed = get_object_or_404(Feeds, id=feed_id)
+    build_jobs.enqueue_build(feed=feed, kind=BuildJob.KIND_FULL_RESCRAPE)
 
-    feed = Feeds.objects.filter(id=feed_id).first()
-    message = f"Full articles for '<b>{feed.name}</b>' was successfully rebuilt."
+    message = f"Full articles for '<b>{feed.name}</b>' were queued for a rebuild."
     messages.add_message(request, messages.SUCCESS, message)
     return HttpResponseRedirect(reverse_lazy("feed_list"))
 
@@ -208,6 +205,17 @@ def redirect_to_rss(request: HttpRequest, feed_pk: int) -> HttpResponse:
     rss_xml_file = os.path.join(BASE_DIR, f"media/rss/{feed.id}/rss.xml")
 
     if not os.path.isfile(rss_xml_file):
-        management.call_command("build", feed_id=feed_pk, verbose=False, no_threading=True)
+        build_jobs.enqueue_build(feed=feed, priority=build_jobs.PRIORITY_MISSING_FEED)
+
+        response = HttpResponse(build_jobs.render_placeholder_feed(feed=feed), content_type=RSS_CONTENT_TYPE)
+        response["Retry-After"] = build_jobs.PLACEHOLDER_RETRY_AFTER
+        response["Cache-Control"] = "no-cache, max-age=0"
+        return response
 
-    return HttpResponse(open(rss_xml_file, "r").read())
+    return serve_artifact(request=request, path=rss_xml_file)
+
+
+@login_required
+def feed_build_status(request: HttpRequest, feed_id: int) -> JsonResponse:
+    feed = get_object_or_404(Feeds, id=feed_id, user=request.user)
+    return JsonResponse(build_jobs.get_build_status(feed=feed))
@@ -109,8 +109,10 @@ WSGI_APPLICATION = "full_feed_filter.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "general.backends.sqlite3",
         "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        # A file rather than SQLite's in-memory default, so threaded build tests run on WAL like the real database
+        "TEST": {"NAME": os.path.join(BASE_DIR, "test_db.sqlite3")},
     }
 }
 
@@ -174,6 +176,9 @@ ACCOUNT_USERNAME_BLACKLIST = [
 ACCOUNT_USERNAME_REQUIRED = True
 SOCIALACCOUNT_AUTO_SIGNUP = False
 
+# Not tracked by git; the file handler below needs it to exist
+os.makedirs(os.path.join(BASE_DIR, "logs"), exist_ok=True)
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -192,3 +197,35 @@ LOGGING = {
         },
     },
 }
+
+# Published RSS files
+RSS_CACHE_MAX_AGE = env.int("RSS_CACHE_MAX_AGE", default=300)
+# In-process cache of the most requested RSS files (0 disables it)
+RSS_MEMORY_CACHE_MAX_BYTES = env.int("RSS_MEMORY_CACHE_MAX_BYTES", default=32 * 1024 * 1024)
+RSS_MEMORY_CACHE_MAX_ITEM_BYTES = env.int("RSS_MEMORY_CACHE_MAX_ITEM_BYTES", default=2 * 1024 * 1024)
+# Internal nginx location serving BASE_DIR/media (e.g. "/protected-media/"); when set, RSS files
+# are handed to nginx with X-Accel-Redirect instead of being sent by Django. nginx then chooses
+# the .gz variant itself, so enable gzip_static (and brotli_static) on that location
+RSS_X_ACCEL_REDIRECT_PREFIX = env("RSS_X_ACCEL_REDIRECT_PREFIX", default="")
+
+# Article pages downloaded by the scrapers (see feeds/scripts/response_cache.py)
+RESPONSE_CACHE_DIR = env("RESPONSE_CACHE_DIR", default=os.path.join(BASE_DIR, "cache", "responses"))
+RESPONSE_CACHE_TTL = env.int("RESPONSE_CACHE_TTL", default=7 * 24 * 60 * 60)
+RESPONSE_CACHE_MAX_BYTES = env.int("RESPONSE_CACHE_MAX_BYTES", default=512 * 1024 * 1024)
+
+# Threads used by `./manage.py build`: feeds built at once, and articles per feed
+BUILD_FEED_WORKERS = env.int("BUILD_FEED_WORKERS", default=4)
+BUILD_ARTICLE_WORKERS = env.int("BUILD_ARTICLE_WORKERS", default=8)
+# Milliseconds a SQLite connection waits for the write lock (see general/backends/sqlite3/base.py)
+SQLITE_BUSY_TIMEOUT = env.int("SQLITE_BUSY_TIMEOUT", default=30000)
+
+# Worker processes extracting scraped articles (see feeds/scripts/extraction.py); 0 extracts in-thread
+EXTRACTION_WORKERS = env.int("EXTRACTION_WORKERS", default=os.cpu_count() or 1)
+
+# HTML parser used by the Simple and Craigslist scrapers: "soup" (BeautifulSoup) or "lxml" (see feeds/scripts/lxml_engine.py)
+SCRAPER_ENGINE = env("SCRAPER_ENGINE", default="soup")
+
+# Sent with every feed fetch and scrape (see feeds/scripts/http_client.py)
+HTTP_USER_AGENT = env(
+    "HTTP_USER_AGENT", default=f"Mozilla/5.0 (compatible; FullFeedFilter/1.0; +http://{DOMAIN}/)"
+)
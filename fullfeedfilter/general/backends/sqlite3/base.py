@@ -0,0 +1,37 @@
+"""
+SQLite backend with the connection tuning the builder needs (ENGINE "general.backends.sqlite3").
+
+WAL lets readers (web views, build threads) run while a write is in progress, and the busy
+timeout makes a connection wait for the write lock instead of failing with
+"database is locked" when the builder, the worker and the web process write at once.
+
+Transactions are started with BEGIN IMMEDIATE, so an atomic block takes the write lock up
+front (waiting on the busy timeout) instead of reading first and then failing to upgrade to
+a writer because another connection committed in between, which SQLite reports as
+"database is locked" without waiting. (Django 5.1 has this as the "transaction_mode" option.)
+"""
+from django.db.backends.sqlite3 import base
+
+from full_feed_filter.settings import SQLITE_BUSY_TIMEOUT
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    # Durable across application crashes; an OS crash may lose the last commits, never corrupt the file
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}",
+    "PRAGMA temp_store=MEMORY",
+    # Negative sizes are KiB
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _start_transaction_under_autocommit(self) -> None:
+        self.cursor().execute("BEGIN IMMEDIATE")
@@ -0,0 +1,104 @@
+"""
+In-process LRU cache of published artifacts as bytes.
+
+Entries are keyed by path and validated against the file's (inode, mtime, size) on every
+hit, so a publish (which replaces the file) is picked up immediately. A file is only
+admitted on its second miss, so feeds that are requested once do not push hot feeds out.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class ArtifactCache:
+    def __init__(self, max_bytes: int, max_item_bytes: int, max_tracked_misses: int = 4096) -> None:
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.max_tracked_misses = max_tracked_misses
+
+        self._entries = OrderedDict()  # path: (stamp, content)
+        self._misses = OrderedDict()  # path: None, paths that missed once
+        self._size = 0
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _get_stamp(stat: os.stat_result) -> tuple:
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str) -> (bytes, None):
+        """ Returns the file's bytes if cached (or just admitted), otherwise None. """
+        if self.max_bytes <= 0:
+            return None
+
+        try:
+            stamp = self._get_stamp(os.stat(path))
+        except FileNotFoundError:
+            self.discard(path)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            if stamp[2] > self.max_item_bytes or not self._is_second_miss(path):
+                return None
+
+        return self._admit(path)
+
+    def _is_second_miss(self, path: str) -> bool:
+        if path in self._misses or path in self._entries:
+            self._misses.pop(path, None)
+            return True
+
+        self._misses[path] = None
+        if len(self._misses) > self.max_tracked_misses:
+            self._misses.popitem(last=False)
+        return False
+
+    def _admit(self, path: str) -> (bytes, None):
+        try:
+            with open(path, "rb") as fp:
+                stamp = self._get_stamp(os.fstat(fp.fileno()))
+                content = fp.read()
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            self._remove(path)
+            self._entries[path] = (stamp, content)
+            self._size += len(content)
+            while self._size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+        return content
+
+    def _remove(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def discard(self, path: str) -> None:
+        with self._lock:
+            self._remove(path)
+            self._misses.pop(path, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._misses.clear()
+            self._size = 0
+
+
+artifact_cache = ArtifactCache(
+    max_bytes=settings.RSS_MEMORY_CACHE_MAX_BYTES,
+    max_item_bytes=settings.RSS_MEMORY_CACHE_MAX_ITEM_BYTES,
+)
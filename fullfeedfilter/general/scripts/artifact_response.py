@@ -0,0 +1,128 @@
+"""
+HTTP responses for published artifacts (see general.scripts.artifacts).
+
+Responses carry a strong ETag built from the artifact digest (one per Content-Encoding, since
+each encoding is a different representation), Last-Modified from the file, Cache-Control and
+Vary: Accept-Encoding. Conditional requests are answered with 304, and clients that accept
+br or gzip are sent the pre-compressed variant.
+"""
+import os
+
+from django.conf import settings
+from django.http import FileResponse, HttpRequest, HttpResponse, HttpResponseNotFound
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from general.scripts import artifacts
+from general.scripts.artifact_cache import artifact_cache
+
+RSS_CONTENT_TYPE = "application/rss+xml; charset=utf-8"
+
+# Short suffix added to the ETag of each encoded variant
+ETAG_ENCODING_SUFFIXES = {
+    "br": "br",
+    "gzip": "gz",
+}
+
+
+def get_accepted_encodings(request: HttpRequest) -> set:
+    """ Returns the content codings the client accepts (q > 0) from Accept-Encoding. """
+    accepted = set()
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def select_variant(request: HttpRequest, path: str) -> tuple:
+    """ Returns (encoding, file path) of the best pre-compressed variant, or (None, path). """
+    accepted = get_accepted_encodings(request)
+    for encoding in artifacts.ENCODINGS:
+        if encoding in accepted or "*" in accepted:
+            variant_path = artifacts.get_encoded_variant(path=path, encoding=encoding)
+            if variant_path is not None:
+                return encoding, variant_path
+    return None, path
+
+
+def get_x_accel_redirect(path: str) -> (str, None):
+    """ Returns the internal nginx URI for a file under BASE_DIR/media, if X-Accel-Redirect is configured. """
+    prefix = settings.RSS_X_ACCEL_REDIRECT_PREFIX
+    if not prefix:
+        return None
+
+    media_root = os.path.join(settings.BASE_DIR, "media")
+    relative_path = os.path.relpath(path, media_root)
+    if relative_path.startswith(os.pardir):
+        return None
+    return f"{prefix.rstrip('/')}/{relative_path.replace(os.sep, '/')}"
+
+
+def get_body_response(path: str, content_type: str, filename: str) -> HttpResponse:
+    """
+    Hands the file to nginx when X-Accel-Redirect is configured, returns hot files from the
+    in-process cache, and otherwise streams the file with FileResponse (sendfile when the
+    WSGI server provides wsgi.file_wrapper), so the body is never decoded or copied as str.
+    """
+    x_accel_redirect = get_x_accel_redirect(path)
+    if x_accel_redirect is not None:
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = x_accel_redirect
+        return response
+
+    content = artifact_cache.get(path)
+    if content is not None:
+        return HttpResponse(content, content_type=content_type)
+
+    return FileResponse(open(path, "rb"), content_type=content_type, filename=filename)
+
+
+def serve_artifact(request: HttpRequest, path: str, content_type: str = RSS_CONTENT_TYPE,
+                   max_age: int = None) -> HttpResponse:
+    digest = artifacts.get_artifact_digest(path)
+    if digest is None:
+        return HttpResponseNotFound("RSS FEED NOT FOUND")
+
+    max_age = settings.RSS_CACHE_MAX_AGE if max_age is None else max_age
+    if get_x_accel_redirect(path) is None:
+        encoding, variant_path = select_variant(request=request, path=path)
+    else:
+        # nginx replaces the headers of an X-Accel-Redirect response with its own, so it is always
+        # handed the uncompressed file and picks the pre-compressed variant itself (gzip_static)
+        encoding, variant_path = None, path
+
+    etag = f'"{digest}-{ETAG_ENCODING_SUFFIXES[encoding]}"' if encoding else f'"{digest}"'
+    last_modified = int(os.stat(path).st_mtime)
+
+    # Headers shared by the 304 and the full response
+    headers = HttpResponse()
+    headers["ETag"] = etag
+    headers["Last-Modified"] = http_date(last_modified)
+    headers["Cache-Control"] = f"public, max-age={max_age}"
+    patch_vary_headers(headers, ("Accept-Encoding",))
+
+    # Returns a 304 (or 412) response when a precondition applies, otherwise the response passed in
+    conditional_response = get_conditional_response(request, etag=etag, last_modified=last_modified,
+                                                    response=headers)
+    if conditional_response is not headers:
+        return conditional_response
+
+    response = get_body_response(path=variant_path, content_type=content_type, filename=os.path.basename(path))
+    for header in ("ETag", "Last-Modified", "Cache-Control", "Vary"):
+        response[header] = headers[header]
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,167 @@
+"""
+Published files (filtered feeds, report feeds) and their pre-compressed variants.
+
+An artifact is published by moving a finished temporary file over the destination. Before
+doing so its sha256 digest is compared with the digest of the current file; identical
+content leaves the file, its compressed variants and their mtimes untouched.
+
+Next to `rss.xml` a publish writes:
+    rss.xml.gz      gzip variant
+    rss.xml.br      brotli variant (only when the `brotli` package is installed)
+    rss.xml.sha256  digest of rss.xml, with the size and mtime it was computed for
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CHUNK_SIZE = 64 * 1024
+DIGEST_SUFFIX = ".sha256"
+
+# Content-Encoding: file suffix, in order of preference
+ENCODINGS = {
+    "br": ".br",
+    "gzip": ".gz",
+}
+
+
+def get_file_digest(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_artifact_digest(path: str) -> (str, None):
+    """ Returns the digest of a published file, from its sidecar when it still describes the file. """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    try:
+        with open(f"{path}{DIGEST_SUFFIX}") as fp:
+            sidecar = json.load(fp)
+        if sidecar["size"] == stat.st_size and sidecar["mtime_ns"] == stat.st_mtime_ns:
+            return sidecar["digest"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    digest = get_file_digest(path)
+    _write_digest(path=path, digest=digest)
+    return digest
+
+
+def get_encoded_variant(path: str, encoding: str) -> (str, None):
+    """ Returns the path of the pre-compressed variant of path for a Content-Encoding, if it exists. """
+    suffix = ENCODINGS.get(encoding)
+    if suffix is None:
+        return None
+
+    variant_path = f"{path}{suffix}"
+    try:
+        # A variant older than its source is left over from an interrupted publish
+        if os.stat(variant_path).st_mtime_ns >= os.stat(path).st_mtime_ns:
+            return variant_path
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def publish_artifact(temp_path: str, path: str) -> bool:
+    """
+    Moves a finished temporary file to path, along with its compressed variants and digest.
+    Returns False, and removes the temporary file, when path already has the same content.
+    """
+    digest = get_file_digest(temp_path)
+
+    if digest == get_artifact_digest(path):
+        os.remove(temp_path)
+        # Files published before the compressed variants existed get them on their next build
+        if get_encoded_variant(path=path, encoding="gzip") is None:
+            _write_variants(source_path=path, path=path)
+        return False
+
+    os.chmod(temp_path, 0o644)
+    _write_variants(source_path=temp_path, path=path)
+    os.replace(temp_path, path)
+    _write_digest(path=path, digest=digest)
+    return True
+
+
+def write_artifact(path: str, content: str) -> bool:
+    """ Publishes a string as path. Returns False when path already had the same content. """
+    with temp_file(path=path, mode="w", encoding="utf-8") as (fp, temp_path):
+        fp.write(content)
+    return publish_artifact(temp_path=temp_path, path=path)
+
+
+class temp_file:
+    """ A temporary file next to path, removed again if the block raises. """
+
+    def __init__(self, path: str, mode: str = "wb", encoding: str = None) -> None:
+        self.path = path
+        self.mode = mode
+        self.encoding = encoding
+        self.fp = None
+        self.temp_path = None
+
+    def __enter__(self):
+        folder = os.path.dirname(self.path) or "."
+        fd, self.temp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(self.path)}.", suffix=".tmp")
+        self.fp = os.fdopen(fd, self.mode, encoding=self.encoding)
+        return self.fp, self.temp_path
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.fp.close()
+        if exc_type is not None and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def _write_variants(source_path: str, path: str) -> None:
+    _write_gzip(source_path=source_path, path=f"{path}{ENCODINGS['gzip']}")
+    if brotli is not None:
+        _write_brotli(source_path=source_path, path=f"{path}{ENCODINGS['br']}")
+    elif os.path.exists(f"{path}{ENCODINGS['br']}"):
+        os.remove(f"{path}{ENCODINGS['br']}")
+
+
+def _write_gzip(source_path: str, path: str) -> None:
+    with temp_file(path=path) as (fp, temp_path):
+        # mtime=0 keeps the gzip bytes identical for identical content
+        with open(source_path, "rb") as source, gzip.GzipFile(fileobj=fp, mode="wb", compresslevel=9, mtime=0) as gz:
+            shutil.copyfileobj(source, gz, CHUNK_SIZE)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+
+def _write_brotli(source_path: str, path: str) -> None:
+    with temp_file(path=path) as (fp, temp_path):
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=11)
+        with open(source_path, "rb") as source:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                fp.write(compressor.process(chunk))
+        fp.write(compressor.finish())
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+
+def _write_digest(path: str, digest: str) -> None:
+    stat = os.stat(path)
+    sidecar = {"digest": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    try:
+        with temp_file(path=f"{path}{DIGEST_SUFFIX}", mode="w") as (fp, temp_path):
+            json.dump(sidecar, fp)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, f"{path}{DIGEST_SUFFIX}")
+    except OSError:
+        # The digest can always be recomputed from the file
+        pass
@@ -86,6 +86,22 @@ def sanitize_string(dirty_string: str, unescape_string=True, strip_html=True, st
     return sanitized_string.strip()
 
 
+SEARCH_TEXT_SPECIAL_CHARS = re.compile('[^A-Za-z0-9 ]+')
+
+
+def normalize_search_text(dirty_string: str) -> str:
+    """
+    Same result as sanitize_string(strip_special_chars=True, replace_special_chars_with_space=True,
+    lowercase=True) in a single regex pass, skipping strip_tags when there is no markup to strip.
+    """
+    sanitized_string = unescape(dirty_string)
+
+    if '<' in sanitized_string or '&' in sanitized_string:
+        sanitized_string = strip_tags(sanitized_string)
+
+    return SEARCH_TEXT_SPECIAL_CHARS.sub(' ', sanitized_string).lower().strip()
+
+
 def now_cst() -> str:
     tz = pytz.timezone('US/Central')
     return datetime.strftime(tz.fromutc(now().replace(tzinfo=tz)), "%m-%d %H:%M")
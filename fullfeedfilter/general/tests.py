@@ -1,3 +1,209 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils.http import http_date
+
+from general.scripts import artifact_response, artifacts, utils
+from general.scripts.artifact_cache import ArtifactCache, artifact_cache
+
+
+class SqliteBackendTests(TransactionTestCase):
+    def test_connections_use_wal(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+
+    def test_atomic_blocks_take_the_write_lock_up_front(self) -> None:
+        other = sqlite3.connect(connection.settings_dict["NAME"], timeout=0)
+        try:
+            with transaction.atomic():
+                # Nothing written yet, but another connection already cannot start writing
+                with self.assertRaisesMessage(sqlite3.OperationalError, "database is locked"):
+                    other.execute("BEGIN IMMEDIATE")
+            other.execute("BEGIN IMMEDIATE")
+            other.rollback()
+        finally:
+            other.close()
+
+
+class NormalizeSearchTextTests(TestCase):
+    TEXTS = [
+        "Car Crash on I-94",
+        "<p>Kenosha&#39;s <b>new</b> library</p>",
+        "Caf&eacute; opens &amp; closes",
+        "  spaces\tand\nnewlines  ",
+        "1 < 2 but 3 > 2",
+        "Émile's naïve résumé",
+        "",
+    ]
+
+    def test_matches_sanitize_string(self) -> None:
+        for text in self.TEXTS:
+            with self.subTest(text=text):
+                expected = utils.sanitize_string(text, strip_special_chars=True, replace_special_chars_with_space=True,
+                                                 lowercase=True)
+                self.assertEqual(utils.normalize_search_text(text), expected)
+
+
+class ArtifactTests(TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "rss.xml")
+
+    def test_identical_content_leaves_the_files_alone(self) -> None:
+        self.assertTrue(artifacts.write_artifact(self.path, "<rss>one</rss>"))
+        stats = [os.stat(path).st_mtime_ns for path in [self.path, f"{self.path}.gz"]]
+
+        self.assertFalse(artifacts.write_artifact(self.path, "<rss>one</rss>"))
+
+        self.assertEqual([os.stat(path).st_mtime_ns for path in [self.path, f"{self.path}.gz"]], stats)
+        self.assertEqual(len(os.listdir(os.path.dirname(self.path))), 3 if artifacts.brotli is None else 4)
+
+    def test_changed_content_is_published_with_its_variants(self) -> None:
+        artifacts.write_artifact(self.path, "<rss>one</rss>")
+        self.assertTrue(artifacts.write_artifact(self.path, "<rss>two</rss>"))
+
+        with open(self.path, "rb") as fp:
+            content = fp.read()
+        self.assertEqual(content, b"<rss>two</rss>")
+        with gzip.open(artifacts.get_encoded_variant(self.path, "gzip"), "rb") as fp:
+            self.assertEqual(fp.read(), content)
+        self.assertEqual(artifacts.get_artifact_digest(self.path), hashlib.sha256(content).hexdigest())
+
+    def test_variant_older_than_the_file_is_not_served(self) -> None:
+        artifacts.write_artifact(self.path, "<rss>one</rss>")
+        stat = os.stat(self.path)
+        os.utime(f"{self.path}.gz", ns=(stat.st_atime_ns, stat.st_mtime_ns - 1_000_000_000))
+
+        self.assertIsNone(artifacts.get_encoded_variant(self.path, "gzip"))
+        self.assertIsNone(artifacts.get_encoded_variant(self.path, "zstd"))
+
+
+def get_content(response) -> bytes:
+    if not response.streaming:
+        return response.content
+    content = b"".join(response.streaming_content)
+    response.close()
+    return content
+
+
+@override_settings(RSS_X_ACCEL_REDIRECT_PREFIX="")
+class ArtifactResponseTests(TestCase):
+    CONTENT = "<rss>" + "item " * 100 + "</rss>"
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, "media", "rss", "1", "rss.xml")
+        os.makedirs(os.path.dirname(self.path))
+        artifacts.write_artifact(self.path, self.CONTENT)
+        self.addCleanup(artifact_cache.clear)
+        self.factory = RequestFactory()
+
+    def serve(self, **headers):
+        return artifact_response.serve_artifact(request=self.factory.get("/feed/1/rss/", **headers), path=self.path)
+
+    def test_full_response_carries_validators(self) -> None:
+        response = self.serve()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_content(response), self.CONTENT.encode("utf-8"))
+        self.assertEqual(response["ETag"], f'"{artifacts.get_artifact_digest(self.path)}"')
+        self.assertEqual(response["Last-Modified"], http_date(int(os.stat(self.path).st_mtime)))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_conditional_requests_get_304(self) -> None:
+        response = self.serve()
+        get_content(response)
+
+        for headers in [{"HTTP_IF_NONE_MATCH": response["ETag"]},
+                        {"HTTP_IF_MODIFIED_SINCE": response["Last-Modified"]}]:
+            with self.subTest(headers=headers):
+                not_modified = self.serve(**headers)
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified["ETag"], response["ETag"])
+                self.assertEqual(get_content(not_modified), b"")
+
+        changed = self.serve(HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(changed.status_code, 200)
+        get_content(changed)
+
+    def test_gzip_variant_has_its_own_etag(self) -> None:
+        response = self.serve(HTTP_ACCEPT_ENCODING="br;q=0, gzip, deflate")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["ETag"], f'"{artifacts.get_artifact_digest(self.path)}-gz"')
+        self.assertEqual(gzip.decompress(get_content(response)), self.CONTENT.encode("utf-8"))
+        self.assertEqual(self.serve(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"]).status_code,
+                         304)
+
+    def test_nginx_is_handed_the_uncompressed_file(self) -> None:
+        with override_settings(BASE_DIR=self.directory, RSS_X_ACCEL_REDIRECT_PREFIX="/internal/"):
+            response = self.serve(HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(response["X-Accel-Redirect"], "/internal/rss/1/rss.xml")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response["ETag"], f'"{artifacts.get_artifact_digest(self.path)}"')
+
+    def test_missing_artifact(self) -> None:
+        os.remove(self.path)
+        self.assertEqual(self.serve().status_code, 404)
+
+
+class ArtifactCacheTests(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = ArtifactCache(max_bytes=25, max_item_bytes=20)
+
+    def write(self, name: str, content: bytes) -> str:
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as fp:
+            fp.write(content)
+        return path
+
+    def test_files_are_cached_on_their_second_request(self) -> None:
+        path = self.write("a.xml", b"0123456789")
+
+        self.assertIsNone(self.cache.get(path))
+        self.assertEqual(self.cache.get(path), b"0123456789")
+        self.assertEqual(self.cache.get(path), b"0123456789")
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_replaced_file_is_read_again(self) -> None:
+        path = self.write("a.xml", b"0123456789")
+        self.cache.get(path)
+        self.cache.get(path)
+
+        temp_path = self.write("a.xml.tmp", b"abcdefghij")
+        os.replace(temp_path, path)
+
+        self.assertEqual(self.cache.get(path), b"abcdefghij")
+
+    def test_least_recently_used_file_is_evicted(self) -> None:
+        paths = [self.write(f"{name}.xml", name.encode("utf-8") * 10) for name in "abc"]
+        large_path = self.write("large.xml", b"x" * 21)
+        for path in paths + [large_path]:
+            self.cache.get(path)
+            self.cache.get(path)
+
+        # Two 10 byte files fit, and the large file is never cached
+        self.assertEqual(list(self.cache._entries), paths[1:])
+        self.assertEqual(self.cache._size, 20)
+
+    def test_deleted_file_is_discarded(self) -> None:
+        path = self.write("a.xml", b"0123456789")
+        self.cache.get(path)
+        self.cache.get(path)
+        os.remove(path)
+
+        self.assertIsNone(self.cache.get(path))
+        self.assertEqual(self.cache._size, 0)
@@ -9,7 +9,7 @@ from django.core.management.base import BaseCommand, CommandParser
 from django.template.loader import render_to_string
 from termcolor import cprint
 
-from general.scripts import utils
+from general.scripts import artifacts, utils
 from full_feed_filter.settings import BASE_DIR, DOMAIN
 from general.scripts.utils import main_wrapper
 from reports.scripts.hidden_articles import HiddenArticleViewer
@@ -99,5 +99,4 @@ class ExportHiddenRSS:
 
     def write_rss_to_file(self) -> None:
         utils.mkdir_if_doesnt_exist(self.rss_folder)
-        with open(f'{self.rss_folder}/{self.rss_filename}', 'w') as fp:
-            fp.write(self.rss_string)
+        artifacts.write_artifact(path=f'{self.rss_folder}/{self.rss_filename}', content=self.rss_string)
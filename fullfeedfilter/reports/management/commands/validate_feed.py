@@ -7,7 +7,7 @@ from django.utils.timezone import now
 from termcolor import cprint
 
 from feeds.models import Feeds, FeedValidation
-from general.scripts import utils
+from general.scripts import artifacts, utils
 from full_feed_filter.settings import DOMAIN, BASE_DIR
 from datetime import datetime
 from feeds.scripts.feed_validation import ValidateFeed
@@ -206,5 +206,4 @@ class ExportRSS:
     def write_rss_to_file(self) -> None:
         if self.write_to_rss:
             utils.mkdir_if_doesnt_exist(self.rss_folder)
-            with open(f'{self.rss_folder}/{self.rss_filename}', 'w') as fp:
-                fp.write(self.rss_string)
+            artifacts.write_artifact(path=f'{self.rss_folder}/{self.rss_filename}', content=self.rss_string)
@@ -8,6 +8,7 @@ from django.shortcuts import render
 from django.views.generic import TemplateView
 
 from general.scripts import utils
+from general.scripts.artifact_response import serve_artifact
 from full_feed_filter.settings import BASE_DIR
 from feeds.models import Feeds, FeedValidation
 
@@ -31,7 +32,7 @@ def view_hidden_articles(request: HttpRequest, timedelta_hours=8, feed_id=None,
 
 def redirect_to_hidden_articles_rss(request: HttpRequest, username: str) -> HttpResponse:
     rss_folder = os.path.join(BASE_DIR, f"media/hidden/{username}.xml")
-    return HttpResponse(open(rss_folder, 'r').read())
+    return serve_artifact(request=request, path=rss_folder)
 
 # FEED VALIDATIONS
 @login_required
@@ -66,4 +67,4 @@ def ignore_feed_validation_errors(request: HttpRequest, error_pk: int) -> HttpRe
 # noinspection PyUnusedLocal
 def redirect_to_feed_validation_errors_rss(request: HttpRequest, date=None) -> HttpResponse:
     rss_folder = os.path.join(BASE_DIR, f"media/invalid/invalid_feeds.xml")
-    return HttpResponse(open(rss_folder, 'r').read())
+    return serve_artifact(request=request, path=rss_folder)